@@ -1,66 +1,295 @@
+import json
 import sys
-import uuid
 from pathlib import Path
+from typing import List, Optional, Tuple
 import streamlit as st
 
 ROOT = Path(__file__).resolve().parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from core.songs import get_template_by_key
-from core.storyboard import build_storyboard_for_template
-from core.render import render_video_ffmpeg_drawtext
+from core.songs import get_template_by_key, list_template_keys
+from core.storyboard import StoryEvent, build_storyboard_table
+from core.engines import ENGINES, get_engine
+from core.audio import template_onsets
+from core.audio_track import audio_track_path
+from core.cache import RenderCache, pinned, render_cache_key
+from core.jobs import CANCELLED, DONE, FAILED, Job, get_job_manager
+from core.media_server import media_url
+from core.metrics import ensure_metrics_server, get_trace, observe, span
+from core.profiles import PROFILES, EncodeProfile, get_profile
+from core.thumbnails import build_thumbnails
+from core.warmup import start_prewarm
 
 OUTPUTS_DIR = ROOT / "outputs"
 OUTPUTS_DIR.mkdir(exist_ok=True, parents=True)
 
 DURATION_SEC = 60  # client wants 1 minute
+RESOLUTION = (854, 480)
+FPS = 24
+DEFAULT_TEMPLATE_KEY = "abc"
 
 st.set_page_config(page_title="ABC Visual POC", layout="centered")
 
+# once per process, in the background: the first render finds templates parsed and icons scaled
+start_prewarm(RESOLUTION)
+# Prometheus text at http://127.0.0.1:$METRICS_PORT/metrics, job traces at /traces/<job id>
+ensure_metrics_server()
+
+
+def _plan_render(
+    audio_path: Path, audio_hash: str, template_key: str, engine: str, profile_name: str
+) -> Tuple[str, List[StoryEvent], EncodeProfile]:
+    """
+    (render cache key, storyboard, profile) for one request. The storyboard is
+    built up front so the job key covers the current template contents, not
+    just its name: an edited prompt file is a new job. Untimed lines are placed
+    on the upload's onsets, analysed once per audio hash (core.audio cache).
+    """
+    profile = get_profile(profile_name)
+    resolution, fps = profile.resolve(RESOLUTION, FPS)
+    template = get_template_by_key(template_key)
+    onsets = template_onsets(template.units, audio_path, audio_hash)
+    events = build_storyboard_table(template.units, duration_sec=DURATION_SEC, onset_times=onsets)
+    key = render_cache_key(
+        audio_hash, events, resolution, fps, DURATION_SEC,
+        extra={"engine": engine, "profile": profile.cache_fields()},
+    )
+    return key, events, profile
+
+
+def _render_job(
+    audio_path: Path, audio_hash: str, key: str, events: List[StoryEvent], engine: str, profile: EncodeProfile
+):
+    """
+    Builds the job body that runs on a worker thread (no Streamlit calls in here).
+    """
+    resolution, fps = profile.resolve(RESOLUTION, FPS)
+
+    def run(job: Job) -> str:
+        job.set_stage(f"Rendering {profile.name} {resolution[0]}x{resolution[1]} (ffmpeg)...")
+        cache = RenderCache()
+        # poster + strip come from the storyboard, so they exist before the video does;
+        # the cache deletes them together with the render
+        with span("thumbnails"):
+            job.meta["thumbs"] = build_thumbnails(events, DURATION_SEC, cache.thumbs_path(key), resolution)
+
+        render_fn = get_engine(engine).render
+        # the upload and its prepared soundtrack are read by this render: no other job may evict them
+        in_use = [audio_path, audio_track_path(audio_hash, DURATION_SEC, profile)]
+        with span("render", engine=engine, profile=profile.name, resolution=f"{resolution[0]}x{resolution[1]}") as s, \
+                pinned(*in_use):
+            final_path, hit = cache.get_or_render(
+                key,
+                lambda tmp_path: render_fn(
+                    audio_path=str(audio_path),
+                    events=events,
+                    output_path=str(tmp_path),
+                    duration_sec=DURATION_SEC,
+                    resolution=resolution,
+                    fps=fps,
+                    profile=profile,
+                    progress_cb=job.set_progress,
+                    cancel_event=job.cancel_event,
+                    audio_hash=audio_hash,
+                ),
+                keep=in_use,
+            )
+            s["cache_hit"] = hit
+            s["output_bytes"] = final_path.stat().st_size
+        if not hit:
+            observe("render_output_bytes", s["output_bytes"], engine=engine)
+        job.meta["cache_hit"] = hit
+        return str(final_path)
+
+    return run
+
+
+@st.fragment(run_every=1.0)
+def _poll_job(job_id: str, preview_id: Optional[str] = None):
+    job = get_job_manager().get(job_id)
+    if job is None or job.finished:
+        st.rerun()  # full rerun shows the result once, then polling stops
+    if preview_id:
+        preview = get_job_manager().get(preview_id)
+        if preview is None or preview.finished:
+            st.rerun()  # show the preview above while the full render keeps going
+    position = get_job_manager().queue_position(job_id)
+    waiting = f"waiting for a worker (#{position} in line)..." if position else "waiting for a worker..."
+    st.info(f"{job.status.capitalize()}: {job.stage or waiting}")
+
+    p = job.progress
+    if p is not None and p.queue_position:
+        st.caption(f"Other renders are using the encoder; #{p.queue_position} in line for an ffmpeg slot.")
+    elif p is not None:
+        eta = f"{p.eta_sec:.0f}s left" if p.eta_sec is not None else "estimating..."
+        st.progress(p.fraction, text=f"frame {p.frame} · {p.fps:.0f} fps · {p.speed:.2f}x · {eta}")
+
+    poster = (job.meta.get("thumbs") or {}).get("poster")
+    if poster and Path(poster).exists():
+        st.image(poster, caption="Poster (video still rendering)", width=320)
+
+    if st.button("Cancel render"):
+        get_job_manager().cancel(job_id)
+
+
+def _show_job_result(job: Job):
+    if job.status == FAILED:
+        error = job.error or "Render failed."
+        st.error(error.strip().splitlines()[0])
+        if "\n" in error.strip():
+            with st.expander("Error details"):
+                st.code(error)
+        _show_timings(job)
+        return
+    if job.status == CANCELLED:
+        st.warning("Render cancelled.")
+        return
+
+    if job.meta.get("cache_hit"):
+        st.info("Served from render cache (no re-render).")
+    st.success("Generated ABC video ✅")
+    _show_video(job, download=True, start_time=_pick_start_time(job))
+    _show_thumbnails(job)
+    _show_timings(job)
+
+
+def _thumb_index(job: Job) -> Optional[dict]:
+    index = (job.meta.get("thumbs") or {}).get("index")
+    if not index or not Path(index).exists():
+        return None
+    return json.loads(Path(index).read_text(encoding="utf-8"))
+
+
+def _pick_start_time(job: Job) -> int:
+    """'Jump to' a letter: events start on keyframes, so the seek is immediate."""
+    index = _thumb_index(job)
+    cues = [c for c in (index or {}).get("cues", []) if c["letter"]]
+    if not cues:
+        return 0
+    labels = ["Start"] + [f"{c['letter']} · {c['word']} ({c['t_start']:.1f}s)" for c in cues]
+    choice = st.selectbox("Jump to", range(len(labels)), format_func=lambda i: labels[i], key=f"jump_{job.id}")
+    return int(cues[choice - 1]["t_start"]) if choice else 0
+
+
+def _show_thumbnails(job: Job):
+    thumbs = job.meta.get("thumbs") or {}
+    if not thumbs or not Path(thumbs["sprite"]).exists():
+        return
+    with st.expander("Poster and thumbnail strip"):
+        st.image(thumbs["poster"], caption="Poster", width=320)
+        st.image(thumbs["sprite"], caption="One tile per event (thumbs.vtt maps times to tiles)")
+        st.download_button(
+            "Download thumbs.vtt", data=Path(thumbs["vtt"]).read_bytes(), file_name="thumbs.vtt", mime="text/vtt"
+        )
+
+
+def _show_timings(job: Job):
+    tr = get_trace(job.id)
+    if not tr or not tr["spans"]:
+        return
+    depth = {}
+    rows = []
+    for s in tr["spans"]:
+        depth[s["id"]] = depth.get(s["parent"], -1) + 1
+        attrs = {k: v for k, v in s["attrs"].items() if v is not None}
+        rows.append({
+            "stage": "  " * depth[s["id"]] + s["name"],
+            "seconds": s["duration_sec"],
+            "status": s["status"],
+            "details": ", ".join(f"{k}={v}" for k, v in attrs.items()),
+        })
+    with st.expander("Render timings"):
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+
+def _show_video(job: Job, download: bool, start_time: int = 0):
+    out_name = f"abc_demo_{job.meta.get('audio_hash', '')[:8]}.mp4"
+    url = media_url(Path(job.result))
+    if url:
+        # ranged, mmap-backed server (MEDIA_SERVER_PORT): the browser streams straight from disk
+        st.video(url, start_time=start_time)
+        if download:
+            st.link_button("Download ABC video", media_url(Path(job.result), download=True))
+        return
+
+    # by path: Streamlit stores each file once per content, not once per session,
+    # and the download is only read when the button is clicked
+    result = job.result
+    st.video(result, start_time=start_time)
+    if download:
+        st.download_button(
+            "Download ABC video", data=lambda: Path(result).read_bytes(), file_name=out_name, mime="video/mp4"
+        )
+
+
 def main():
     st.title("ABC Visual POC (Timestamp-aligned)")
     st.write("Upload the ABC song audio. We render visuals aligned to your `prompts/abc_song.txt` timestamps.")
 
     audio_file = st.file_uploader("Upload audio (WAV/MP3/M4A).", type=["wav", "mp3", "m4a"])
+    keys = list_template_keys()
+    template_key = st.selectbox(
+        "Template", keys, index=keys.index(DEFAULT_TEMPLATE_KEY) if DEFAULT_TEMPLATE_KEY in keys else 0
+    )
+    engine = st.selectbox("Render engine", list(ENGINES), format_func=lambda name: ENGINES[name].label)
+    profile_name = st.selectbox(
+        "Quality", [k for k in PROFILES if k != "preview"], index=0, help="Encoder preset/CRF profile"
+    )
+    want_preview = st.checkbox("Show a quick 240p preview first", value=True)
 
     if st.button("Generate ABC video"):
         if not audio_file:
             st.error("Please upload an audio file first.")
             return
 
+        cache = RenderCache()
         suffix = Path(audio_file.name).suffix
-        audio_path = OUTPUTS_DIR / f"audio_{uuid.uuid4().hex}{suffix}"
-        audio_path.write_bytes(audio_file.getbuffer())
+        audio_file.seek(0)
+        audio_path, audio_hash = cache.store_upload_stream(audio_file, suffix)
 
-        template = get_template_by_key("abc")
+        def submit(name: str) -> Job:
+            # keyed like the render cache: same audio + storyboard + settings = same job
+            key, events, profile = _plan_render(audio_path, audio_hash, template_key, engine, name)
+            return get_job_manager().submit(
+                key,
+                _render_job(audio_path, audio_hash, key, events, engine, profile),
+                meta={"audio_hash": audio_hash, "template": template_key, "engine": engine, "profile": name},
+            )
 
-        with st.spinner("Building storyboard from timestamps..."):
-            events = build_storyboard_for_template(template.units, duration_sec=DURATION_SEC)
+        # preview goes first so it gets a worker right away; the full render runs alongside it
+        preview = submit("preview") if want_preview else None
+        job = submit(profile_name)
+        # query param survives a browser reconnect; session_state survives reruns
+        st.session_state["job_id"] = job.id
+        st.query_params["job"] = job.id
+        st.session_state["preview_job_id"] = preview.id if preview else None
+        if preview:
+            st.query_params["preview"] = preview.id
+        else:
+            st.query_params.pop("preview", None)
 
-        with st.spinner("Rendering (ffmpeg)..."):
-            out_name = f"abc_demo_{uuid.uuid4().hex[:8]}.mp4"
-            out_path = OUTPUTS_DIR / out_name
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+    preview_id = st.session_state.get("preview_job_id", st.query_params.get("preview"))
+    if job_id:
+        job = get_job_manager().get(job_id)
+        if job is None:
+            st.warning("Render job not found (it may have expired). Please generate again.")
+        elif job.finished:
+            _show_job_result(job)
+        else:
+            preview = get_job_manager().get(preview_id) if preview_id else None
+            if preview is None or preview.finished:
+                if preview is not None and preview.status == DONE:
+                    st.caption("Low-resolution preview; the full-quality video replaces it when ready.")
+                    _show_video(preview, download=False)
+                preview_id = None  # nothing left to wait for
+            _poll_job(job_id, preview_id)
 
-            try:
-                final_path = render_video_ffmpeg_drawtext(
-                    audio_path=str(audio_path),
-                    events=events,
-                    output_path=str(out_path),
-                    duration_sec=DURATION_SEC,
-                    resolution=(854, 480),
-                    fps=24,
-                )
-            except Exception as e:
-                st.error(str(e))
-                return
-
-        st.success("Generated ABC video ✅")
-        video_bytes = Path(final_path).read_bytes()
-        st.video(video_bytes)
-        st.download_button("Download ABC video", data=video_bytes, file_name=out_name, mime="video/mp4")
-
-    st.caption("abc_song.txt format: 00:00.01|A|Apple|a.png (icons in assets/icons/)")
+    st.caption(
+        "Templates are prompts/*.txt. Line formats: 00:00.01|A|Apple|a.png, A|Apple|a.png, "
+        "RED, or 1 Apple (icons in assets/icons/)"
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,328 @@
+"""
+Render pipeline benchmark.
+
+    python -m benchmarks.bench_render --sizes 26 260 2600 --engines drawtext timed stills
+    python -m benchmarks.bench_render --compare outputs/bench/<previous>.json
+    python -m benchmarks.bench_render --sizes 26 --engines drawtext --update-golden
+
+Times each stage (prompt parsing, storyboard, filtergraph build, ffmpeg encode)
+on synthetic timelines and records wall time, CPU time and the process peak
+RSS so far (ru_maxrss) to JSON. Frames at event midpoints are compared against
+the golden frames in benchmarks/golden/, recorded from the reference drawtext
+engine, so a new engine can be checked to draw the same thing. Recording them is
+an explicit step (`--engines drawtext --update-golden`); frames without a golden
+are reported as not recorded and skipped. A frame that cannot be extracted fails.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import resource
+import subprocess
+import sys
+import time
+import wave
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.prompt_parser import parse_prompt_lines
+from core.engines import ENGINES
+from core.render import build_drawtext_filtergraph, collect_icon_paths
+from core.render_stills import plan_still_spans
+from core.render_timed import build_sendcmd_script
+from core.storyboard import StoryEvent, build_storyboard_for_template
+
+BENCH_DIR = ROOT / "outputs" / "bench"
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+
+# Goldens are recorded from this engine only; every other engine is checked against it.
+REFERENCE_ENGINE = "drawtext"
+# Mean absolute per-channel difference (0..255) tolerated against a golden frame.
+GOLDEN_TOLERANCE = 6.0
+# Relative slowdown flagged by --compare.
+REGRESSION_THRESHOLD = 0.15
+
+_WORDS = ["Apple", "Ball", "Cat", "Dog", "Elephant", "Fish", "Goat", "Hat", "Ice", "Jump", "Kite", "Lion", "Monkey"]
+
+
+def synthetic_prompt_lines(n_events: int, duration_sec: float) -> List[str]:
+    """
+    Timestamped prompt lines cycling through the A-Z icon set.
+    """
+    step = duration_sec / float(n_events)
+    lines = []
+    for i in range(n_events):
+        t = i * step
+        m, s = divmod(t, 60.0)
+        h, m = divmod(int(m), 60)
+        letter = chr(ord("A") + i % 26)
+        word = _WORDS[i % len(_WORDS)]
+        lines.append(f"{h:02d}:{m:02d}:{s:05.2f}|{letter}|{word}|{letter.lower()}.png")
+    return lines
+
+
+def synthetic_audio(path: Path, duration_sec: float, sr: int = 22050) -> Path:
+    """
+    Writes a quiet 440 Hz tone with a click on every second, as 16-bit mono WAV.
+    The signal repeats every second, so one second is computed and written
+    over and over (memory stays at one second of samples).
+    """
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n = int(duration_sec * sr)
+    i = np.arange(sr)
+    v = 0.1 * np.sin(2 * np.pi * 440 * i / sr)
+    v[i < 200] += 0.5
+    second = (np.clip(v, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        full, rest = divmod(n, sr)
+        for _ in range(full):
+            w.writeframes(second)
+        w.writeframes(second[: rest * 2])
+    return path
+
+
+def _rusage() -> Tuple[float, float, int, int]:
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is KiB on Linux, and a high-water mark: the peak of the process
+    # so far (for children, of the largest one), not of the stage that just ran
+    return (me.ru_utime + me.ru_stime, kids.ru_utime + kids.ru_stime, me.ru_maxrss, kids.ru_maxrss)
+
+
+@contextmanager
+def stage(results: Dict[str, dict], name: str):
+    cpu0, kcpu0, _, _ = _rusage()
+    t0 = time.perf_counter()
+    yield
+    wall = time.perf_counter() - t0
+    cpu1, kcpu1, rss, krss = _rusage()
+    results[name] = {
+        "wall_sec": round(wall, 6),
+        "cpu_sec": round(cpu1 - cpu0, 6),
+        "child_cpu_sec": round(kcpu1 - kcpu0, 6),
+        "process_peak_rss_kb": rss,
+        "largest_child_peak_rss_kb": krss,
+    }
+
+
+def extract_midpoint_frames(video: Path, events: List[StoryEvent], out_dir: Path, limit: int = 26) -> List[Path]:
+    """
+    One PNG path per event (first `limit` events), taken at the event's midpoint.
+    A frame ffmpeg could not extract (e.g. the video ends early) is left
+    missing on disk; check_golden reports it.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, e in enumerate(events[:limit]):
+        t = (float(e.t_start) + float(e.t_end)) / 2.0
+        p = out_dir / f"event_{i:04d}.png"
+        p.unlink(missing_ok=True)  # never compare a frame left over from an earlier run
+        subprocess.run(
+            ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+             "-ss", f"{t:.3f}", "-i", str(video), "-frames:v", "1", str(p)],
+            capture_output=True,
+        )
+        paths.append(p)
+    return paths
+
+
+def frame_difference(a: Path, b: Path) -> float:
+    from PIL import Image
+
+    with Image.open(a) as ia, Image.open(b) as ib:
+        xa = np.asarray(ia.convert("RGB"), dtype=np.int16)
+        xb = np.asarray(ib.convert("RGB"), dtype=np.int16)
+    if xa.shape != xb.shape:
+        return float("inf")
+    return float(np.abs(xa - xb).mean())
+
+
+def check_golden(frames: List[Path], golden_dir: Path, update: bool) -> dict:
+    """
+    Compares frames against golden_dir (update=True records them instead).
+    A frame that was not extracted is a failure; a frame without a golden is
+    listed as unrecorded (recording goldens is an explicit --update-golden step).
+    """
+    if update:
+        golden_dir.mkdir(parents=True, exist_ok=True)
+    worst = 0.0
+    checked = 0
+    failures = []
+    unrecorded = []
+    for f in frames:
+        g = golden_dir / f.name
+        if not f.exists():
+            failures.append({"frame": f.name, "error": "not extracted"})
+            continue
+        if update:
+            g.write_bytes(f.read_bytes())
+            continue
+        if not g.exists():
+            unrecorded.append(f.name)
+            continue
+        diff = frame_difference(f, g)
+        checked += 1
+        worst = max(worst, diff)
+        if diff > GOLDEN_TOLERANCE:
+            failures.append({"frame": f.name, "diff": round(diff, 3)})
+    return {
+        "checked": checked,
+        "worst_diff": round(worst, 3),
+        "failures": failures,
+        "unrecorded": unrecorded,
+        "golden_dir": str(golden_dir.relative_to(ROOT)),
+        "updated": update,
+    }
+
+
+def bench_one(
+    n_events: int,
+    engine: str,
+    fps: int,
+    resolution: Tuple[int, int],
+    seconds_per_event: float,
+    update_golden: bool,
+    skip_encode: bool,
+) -> dict:
+    duration = max(10, int(math.ceil(n_events * seconds_per_event)))
+    work = BENCH_DIR / f"n{n_events}_{engine}"
+    work.mkdir(parents=True, exist_ok=True)
+    stages: Dict[str, dict] = {}
+
+    lines = synthetic_prompt_lines(n_events, duration)
+
+    with stage(stages, "parse_prompt_lines"):
+        units = parse_prompt_lines(lines)
+
+    with stage(stages, "build_storyboard"):
+        events = build_storyboard_for_template(units, duration_sec=duration)
+
+    with stage(stages, "filtergraph"):
+        if engine == "timed":
+            icon_slot = {str(p): i for i, p in enumerate(collect_icon_paths(events))}
+            graph = build_sendcmd_script(events, duration, icon_slot)
+        elif engine in ("stills", "numpy"):
+            graph = repr(plan_still_spans(events, duration, fps))
+        else:
+            icons = collect_icon_paths(events)
+            idx = {str(p): i + 1 for i, p in enumerate(icons)}
+            graph, _ = build_drawtext_filtergraph(events, idx, duration, resolution, fps)
+
+    result = {
+        "n_events": n_events,
+        "engine": engine,
+        "duration_sec": duration,
+        "resolution": list(resolution),
+        "fps": fps,
+        "graph_bytes": len(graph),
+        "stages": stages,
+    }
+    if skip_encode:
+        return result
+
+    audio = synthetic_audio(BENCH_DIR / f"tone_{duration}s.wav", duration)
+    video = work / "out.mp4"
+    with stage(stages, "encode"):
+        ENGINES[engine].render(
+            audio_path=str(audio),
+            events=events,
+            output_path=str(video),
+            duration_sec=duration,
+            resolution=resolution,
+            fps=fps,
+        )
+    result["output_bytes"] = video.stat().st_size
+
+    frames = extract_midpoint_frames(video, events, work / "frames")
+    # golden frames are per storyboard, shared by every engine
+    golden = GOLDEN_DIR / f"n{n_events}_{resolution[0]}x{resolution[1]}"
+    result["golden"] = check_golden(frames, golden, update_golden)
+    return result
+
+
+def compare_runs(current: dict, previous: dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """
+    Wall-time regressions per (n_events, engine, stage) beyond `threshold`.
+    """
+    prev = {(r["n_events"], r["engine"]): r for r in previous.get("runs", [])}
+    out = []
+    for r in current.get("runs", []):
+        p = prev.get((r["n_events"], r["engine"]))
+        if p is None:
+            continue
+        for name, st in r["stages"].items():
+            old = p["stages"].get(name, {}).get("wall_sec")
+            new = st["wall_sec"]
+            if old and new > old * (1 + threshold) and new - old > 0.005:
+                out.append(f"n={r['n_events']} {r['engine']} {name}: {old:.3f}s -> {new:.3f}s")
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[26, 260, 2600])
+    ap.add_argument("--engines", nargs="+", default=["drawtext"], choices=sorted(ENGINES))
+    ap.add_argument("--fps", type=int, default=24)
+    ap.add_argument("--resolution", default="854x480")
+    ap.add_argument("--seconds-per-event", type=float, default=2.0)
+    ap.add_argument("--skip-encode", action="store_true", help="only time the Python stages")
+    ap.add_argument("--update-golden", action="store_true")
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--compare", type=Path, default=None, help="previous JSON to check for regressions")
+    args = ap.parse_args(argv)
+    if args.update_golden and (args.skip_encode or args.engines != [REFERENCE_ENGINE]):
+        ap.error(f"--update-golden records goldens from the reference engine only: --engines {REFERENCE_ENGINE}")
+
+    w, h = (int(x) for x in args.resolution.lower().split("x"))
+    runs = []
+    for n in args.sizes:
+        for engine in args.engines:
+            r = bench_one(n, engine, args.fps, (w, h), args.seconds_per_event, args.update_golden, args.skip_encode)
+            runs.append(r)
+            enc = r["stages"].get("encode", {}).get("wall_sec")
+            print(f"n={n:<6} {engine:<9} graph={r['graph_bytes']:>9}B encode={enc if enc is not None else '-'}s")
+
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": runs}
+    out = args.out or BENCH_DIR / f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"wrote {out}")
+
+    status = 0
+    for r in runs:
+        g = r.get("golden")
+        if not g:
+            continue
+        if g["unrecorded"]:
+            print(f"GOLDEN NOT RECORDED n={r['n_events']} {r['engine']}: {len(g['unrecorded'])} frame(s) have no "
+                  f"golden in {g['golden_dir']} (not checked); record them with "
+                  f"--sizes {r['n_events']} --engines {REFERENCE_ENGINE} --update-golden")
+        if g["failures"]:
+            print(f"GOLDEN MISMATCH n={r['n_events']} {r['engine']}: {g['failures']}")
+            status = 1
+
+    if args.compare:
+        regressions = compare_runs(report, json.loads(args.compare.read_text(encoding="utf-8")))
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
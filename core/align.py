@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Onsets further than this from where a unit is expected lose to the expected time itself.
+DEFAULT_SNAP_SEC = 0.75
+# A filled-in unit starts at least this long after the unit before it (6 frames at 24 fps).
+MIN_SPACING_SEC = 0.25
+
+
+def _expected_times(
+    k: int,
+    left: Optional[float],
+    right: Optional[float],
+    step: float,
+    duration_sec: float,
+) -> np.ndarray:
+    """
+    Where k untimed units would sit between two anchors (either may be missing).
+    """
+    i = np.arange(1, k + 1, dtype=np.float64)
+    if left is not None and right is not None:
+        return left + i * (right - left) / (k + 1)
+    if left is not None:
+        # trailing run: typical anchor spacing, squeezed to fit before the end
+        step = min(step, (duration_sec - left) / (k + 1)) if duration_sec > left else step
+        return left + i * step
+    if right is not None:
+        step = min(step, right / (k + 1)) if right > 0 else step
+        return right - (k + 1 - i) * step
+    return i * duration_sec / (k + 1)
+
+
+def _monotonic_assign(
+    expected: np.ndarray,
+    candidates: np.ndarray,
+    extra_cost: np.ndarray,
+    window_sec: float,
+) -> np.ndarray:
+    """
+    Picks a strictly increasing candidate index for each expected time, minimizing
+    sum((candidate - expected)^2 + extra_cost).
+
+    Unit i only considers candidates within window_sec of its expected time, so
+    each DP row is one vectorized pass over a small band: O(k * band) overall.
+    """
+    k = len(expected)
+    lo = np.searchsorted(candidates, expected - window_sec, side="left")
+    hi = np.searchsorted(candidates, expected + window_sec, side="right")
+
+    backs: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+    band = np.arange(lo[0], hi[0])
+    acc = (candidates[band] - expected[0]) ** 2 + extra_cost[band]
+
+    for i in range(1, k):
+        prev_band = band
+        prefix_min = np.minimum.accumulate(acc)
+        # latest previous-band index achieving the prefix minimum, per position
+        arg = np.maximum.accumulate(np.where(acc == prefix_min, np.arange(len(acc)), 0))
+
+        band = np.arange(lo[i], hi[i])
+        # best predecessor must be strictly before j: last prev-band position < j
+        pos = np.searchsorted(prev_band, band, side="left") - 1
+        valid = pos >= 0
+        safe = np.clip(pos, 0, None)
+
+        cost = (candidates[band] - expected[i]) ** 2 + extra_cost[band]
+        acc = np.where(valid, cost + prefix_min[safe], np.inf)
+        backs.append(np.where(valid, prev_band[arg[safe]], -1))
+
+    picks = np.empty(k, dtype=np.int64)
+    j = int(np.argmin(acc))
+    picks[-1] = lo[-1] + j
+    for i in range(k - 1, 0, -1):
+        picks[i - 1] = backs[i][picks[i] - lo[i]]
+    return picks
+
+
+def _align_run(
+    k: int,
+    left: Optional[float],
+    right: Optional[float],
+    onsets: np.ndarray,
+    step: float,
+    duration_sec: float,
+    snap_sec: float,
+) -> np.ndarray:
+    expected = _expected_times(k, left, right, step, duration_sec)
+
+    lo = left if left is not None else -np.inf
+    hi = right if right is not None else float(duration_sec)
+    inside = onsets[(onsets > lo) & (onsets < hi)]
+
+    # expected slots are always candidates (with a penalty), so k <= m and nothing is dropped
+    candidates = np.concatenate([inside, expected])
+    extra = np.concatenate([np.zeros(len(inside)), np.full(k, snap_sec ** 2)])
+    order = np.argsort(candidates, kind="stable")
+    candidates, extra = candidates[order], extra[order]
+
+    # wide enough for any onset that could beat the expected slot, plus slack for crowding
+    window = 4.0 * max(snap_sec, step)
+    return candidates[_monotonic_assign(expected, candidates, extra, window)]
+
+
+def align_units_to_onsets(
+    units: List[dict],
+    onset_times: Optional[Sequence[float]],
+    duration_sec: float,
+    snap_sec: float = DEFAULT_SNAP_SEC,
+    min_spacing_sec: float = MIN_SPACING_SEC,
+) -> List[dict]:
+    """
+    Fills in "t" for every unit that has none, keeping timed units as anchors.
+
+    Each run of untimed units between two anchors (or before the first / after
+    the last) is matched to the detected onsets inside that gap by a monotonic
+    DP alignment. A unit with no onset close to its expected time gets the
+    expected time instead, so every unit comes back timed. A run with no room
+    (before an anchor at 0, between equal anchors) is spread min_spacing_sec
+    apart, pushing the following anchors later; see _enforce_spacing.
+    """
+    if not units:
+        return []
+
+    out = [dict(u) for u in units]
+    onsets = np.sort(np.asarray(onset_times if onset_times is not None else [], dtype=np.float64))
+
+    anchors: List[Tuple[int, float]] = [(i, float(u["t"])) for i, u in enumerate(out) if u.get("t") is not None]
+    anchor_ts = np.array([t for _, t in anchors], dtype=np.float64)
+    gaps = np.diff(anchor_ts)
+    gaps = gaps[gaps > 0]
+    step = float(np.median(gaps)) if len(gaps) else float(duration_sec) / (len(out) + 1)
+
+    run_start = 0
+    left: Optional[float] = None
+    for idx, t in anchors + [(len(out), None)]:
+        k = idx - run_start
+        if k > 0:
+            times = _align_run(k, left, t, onsets, step, float(duration_sec), snap_sec)
+            for j, tj in enumerate(times):
+                out[run_start + j]["t"] = float(max(0.0, tj))
+        run_start = idx + 1
+        left = t
+
+    _enforce_spacing(out, [u.get("t") is None for u in units], float(duration_sec), min_spacing_sec)
+    return out
+
+
+def _enforce_spacing(out: List[dict], filled: List[bool], duration_sec: float, spacing: float) -> None:
+    """
+    Moves units later, in place, so that no filled-in unit shares a start with
+    its neighbours: a filled unit, the anchor right after one, and any anchor
+    after a moved one start at least `spacing` after the previous unit.
+    Consecutive anchors as written in the template are left alone.
+
+    Raises ValueError when a unit would be pushed to or past the end of the video.
+    """
+    prev: Optional[float] = None
+    moved = False
+    for i, u in enumerate(out):
+        t = float(u["t"])
+        if prev is not None and (filled[i] or filled[i - 1] or moved) and t < prev + spacing:
+            shifted = prev + spacing
+            if shifted >= duration_sec > t:
+                name = u.get("word") or u.get("letter") or f"#{i + 1}"
+                raise ValueError(
+                    f"Template line {i + 1} ({name}) cannot start {spacing:g}s after the line before it "
+                    f"within the {duration_sec:g}s video; add timestamps with more room between them."
+                )
+            u["t"] = shifted
+            moved = True
+        else:
+            moved = False
+        prev = float(u["t"])
+
+
+def min_gap_filter(times: Sequence[float], min_gap: float) -> np.ndarray:
+    """
+    Greedy "keep an onset only if it is >= min_gap after the last kept one".
+    Jumps with searchsorted, so the loop runs once per kept onset, not per input.
+    """
+    t = np.sort(np.asarray(times, dtype=np.float64))
+    t = t[t >= 0]
+    if len(t) == 0 or min_gap <= 0 or np.all(np.diff(t) >= min_gap):
+        return t
+
+    keep = [0]
+    while True:
+        nxt = int(np.searchsorted(t, t[keep[-1]] + min_gap, side="left"))
+        if nxt >= len(t):
+            break
+        keep.append(nxt)
+    return t[keep]
@@ -1,37 +1,143 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
 
-from PIL import Image, ImageDraw, ImageFont
+if TYPE_CHECKING:
+    # Pillow is imported where images are drawn, keeping `import core.assets` cheap
+    from PIL import Image, ImageDraw
+
+from core.cache import hash_file
+from core.render import card_layout
 
 
 ALPHABET_ANIMALS: Dict[str, str] = {
-    "A": "Alligator",
-    "B": "Bear",
-    "C": "Cat",
+    "A": "Alligator", "B": "Bear", "C": "Cat", "D": "Dog", "E": "Elephant", "F": "Fox",
+    "G": "Giraffe", "H": "Horse", "I": "Iguana", "J": "Jaguar", "K": "Kangaroo", "L": "Lion",
+    "M": "Monkey", "N": "Newt", "O": "Owl", "P": "Penguin", "Q": "Quail", "R": "Rabbit",
+    "S": "Snake", "T": "Tiger", "U": "Urchin", "V": "Vulture", "W": "Whale", "X": "X-ray Fish",
+    "Y": "Yak", "Z": "Zebra",
 }
 
+# Bump when the placeholder card drawing changes: every card is regenerated once.
+CARD_STYLE_VERSION = "1"
+CARD_INDEX = "cards.json"
+FONT_NAME = "DejaVuSans-Bold.ttf"
+
+
+def template_cards(units: Iterable[dict]) -> Dict[str, str]:
+    """
+    Letter -> word for every letter a template uses (first word wins).
+    """
+    out: Dict[str, str] = {}
+    for u in units:
+        letter = str(u.get("letter") or "").strip()
+        if letter and letter not in out:
+            out[letter] = str(u.get("word") or "").strip() or ALPHABET_ANIMALS.get(letter.upper(), letter)
+    return out
+
+
+def _card_filename(letter: str, word: str) -> str:
+    safe = "".join(c if c.isalnum() else "_" for c in word.lower())
+    return f"{letter}_{safe}.png"
+
+
+def _card_hash(letter: str, word: str) -> str:
+    payload = json.dumps([CARD_STYLE_VERSION, _font_digest(), letter, word], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 
-def ensure_alphabet_assets(assets_dir: Path) -> Dict[str, str]:
+@lru_cache(maxsize=None)
+def _font_digest() -> str:
     """
-    Ensures A/B/C placeholder PNGs exist. Returns a mapping of label->absolute filepath.
-    Generates simple kid-safe images (letter + animal word) so we don't depend on repo PNGs.
+    Content hash of the font file FONT_NAME resolves to, so installing a different
+    font regenerates the cards. Pillow's built-in fallback font hashes as its name.
+    """
+    path = getattr(_load_font(12), "path", None)
+    if path and Path(path).is_file():
+        return hash_file(Path(path))
+    return "builtin"
+
+
+def _read_index(path: Path) -> Dict[str, str]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def ensure_alphabet_assets(
+    assets_dir: Path,
+    cards: Optional[Dict[str, str]] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, str]:
+    """
+    Ensures a placeholder PNG (letter + word) exists for every card, A-Z animals by
+    default or e.g. template_cards(template.units). Returns label->absolute filepath.
+
+    Cards whose inputs are unchanged (same content hash in <assets_dir>/cards.json
+    and the file still present) are skipped; the rest are drawn in parallel.
     """
     assets_dir.mkdir(parents=True, exist_ok=True)
+    cards = ALPHABET_ANIMALS if cards is None else cards
+    index_path = assets_dir / CARD_INDEX
+    index = _read_index(index_path)
 
     out: Dict[str, str] = {}
-    for letter, animal in ALPHABET_ANIMALS.items():
-        filename = f"{letter}_{animal.lower()}.png"
-        path = assets_dir / filename
-        if not path.exists():
-            _generate_placeholder_letter_animal_image(letter, animal, path)
+    todo = []
+    for letter, word in cards.items():
+        path = assets_dir / _card_filename(letter, word)
+        digest = _card_hash(letter, word)
+        if not (path.exists() and index.get(path.name) == digest):
+            todo.append((letter, word, path, digest))
         out[letter] = str(path.resolve())
 
+    if len(todo) > 1 and (workers or os.cpu_count() or 1) > 1:
+        # text rasterizing holds the GIL, so cards are drawn in worker processes
+        with ProcessPoolExecutor(max_workers=workers or min(len(todo), os.cpu_count() or 1)) as pool:
+            list(pool.map(_generate_placeholder_letter_animal_image, *zip(*[t[:3] for t in todo])))
+    else:
+        for letter, word, path, _ in todo:
+            _generate_placeholder_letter_animal_image(letter, word, path)
+    if todo:
+        index.update({path.name: digest for _, _, path, digest in todo})
+        tmp = index_path.with_name(f".{index_path.name}.tmp")
+        tmp.write_text(json.dumps(index, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, index_path)
+
     return out
 
 
+@lru_cache(maxsize=None)
+def _load_font(size: int):
+    # Try to load a default font (works on Streamlit Cloud). If not, use PIL built-in.
+    # Cached: each size is opened once per process instead of once per card.
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(FONT_NAME, size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def _centered_text_pos(d: ImageDraw.ImageDraw, text: str, font, width: int, y: int) -> Tuple[int, int, int, int]:
+    """
+    Returns (x, y, text_w, text_h) for text horizontally centered in `width`.
+    """
+    bbox = d.textbbox((0, 0), text, font=font)
+    tw = bbox[2] - bbox[0]
+    th = bbox[3] - bbox[1]
+    return (width - tw) // 2, y, tw, th
+
+
 def _generate_placeholder_letter_animal_image(letter: str, animal: str, out_path: Path) -> None:
+    from PIL import Image, ImageDraw
+
     # 1024x1024 square image, high-contrast, kid-friendly
     size = (1024, 1024)
     img = Image.new("RGBA", size, (245, 245, 245, 255))
@@ -40,19 +146,12 @@ def _generate_placeholder_letter_animal_image(letter: str, animal: str, out_path
     # Border
     d.rounded_rectangle([30, 30, size[0] - 30, size[1] - 30], radius=60, outline=(20, 20, 20, 255), width=10)
 
-    # Try to load a default font (works on Streamlit Cloud). If not, use PIL built-in.
-    try:
-        big_font = ImageFont.truetype("DejaVuSans-Bold.ttf", 520)
-        small_font = ImageFont.truetype("DejaVuSans-Bold.ttf", 90)
-    except Exception:
-        big_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
+    big_font = _load_font(520)
+    small_font = _load_font(90)
 
     # Big letter
-    letter_bbox = d.textbbox((0, 0), letter, font=big_font)
-    lw = letter_bbox[2] - letter_bbox[0]
-    lh = letter_bbox[3] - letter_bbox[1]
-    letter_pos = ((size[0] - lw) // 2, 170)
+    lx, ly, _, _ = _centered_text_pos(d, letter, big_font, size[0], 170)
+    letter_pos = (lx, ly)
 
     # Slight “shadow” for pop
     d.text((letter_pos[0] + 10, letter_pos[1] + 10), letter, font=big_font, fill=(0, 0, 0, 80))
@@ -60,10 +159,8 @@ def _generate_placeholder_letter_animal_image(letter: str, animal: str, out_path
 
     # Animal label
     text = f"{animal}"
-    t_bbox = d.textbbox((0, 0), text, font=small_font)
-    tw = t_bbox[2] - t_bbox[0]
-    th = t_bbox[3] - t_bbox[1]
-    t_pos = ((size[0] - tw) // 2, 760)
+    tx, ty, tw, th = _centered_text_pos(d, text, small_font, size[0], 760)
+    t_pos = (tx, ty)
 
     # Highlight pill behind animal
     pill = [t_pos[0] - 40, t_pos[1] - 20, t_pos[0] + tw + 40, t_pos[1] + th + 20]
@@ -82,6 +179,8 @@ def ensure_default_background(bg_path: Path, resolution: Tuple[int, int] = (1280
     bg_path.parent.mkdir(parents=True, exist_ok=True)
 
     if not bg_path.exists():
+        from PIL import Image, ImageDraw
+
         w, h = resolution
         img = Image.new("RGB", (w, h), (230, 245, 255))
         d = ImageDraw.Draw(img)
@@ -93,3 +192,50 @@ def ensure_default_background(bg_path: Path, resolution: Tuple[int, int] = (1280
         img.save(bg_path, "PNG")
 
     return str(bg_path.resolve())
+
+
+def render_event_card(
+    letter: str,
+    word: str,
+    icon_path: Optional[Path],
+    resolution: Tuple[int, int],
+    background: Tuple[int, int, int] = (230, 245, 255),
+) -> Image.Image:
+    """
+    Full video frame for one storyboard event, laid out like the ffmpeg drawtext
+    renderer: background, translucent card, big letter, word, centered icon.
+    letter=None draws the empty background frame.
+    """
+    from PIL import Image, ImageDraw
+
+    lay = card_layout(resolution)
+    img = Image.new("RGBA", (lay.w, lay.h), background + (255,))
+    if letter is None:
+        return img.convert("RGB")
+
+    # black@0.30 card box
+    box = Image.new("RGBA", (lay.w, lay.h), (0, 0, 0, 0))
+    ImageDraw.Draw(box).rectangle(
+        [lay.card_x, lay.card_y, lay.card_x + lay.card_w - 1, lay.card_y + lay.card_h - 1],
+        fill=(0, 0, 0, int(255 * 0.30)),
+    )
+    img = Image.alpha_composite(img, box)
+    d = ImageDraw.Draw(img)
+
+    big_font = _load_font(lay.big_fs)
+    lx, ly, _, _ = _centered_text_pos(d, letter, big_font, lay.w, lay.big_y)
+    d.text((lx, ly), letter, font=big_font, fill=(255, 255, 255, 255))
+
+    if word:
+        word_font = _load_font(lay.word_fs)
+        wx, wy, _, _ = _centered_text_pos(d, word, word_font, lay.w, lay.word_y)
+        d.text((wx, wy), word, font=word_font, fill=(255, 255, 255, 255))
+
+    if icon_path is not None and Path(icon_path).exists() and lay.icon_h > 0:
+        with Image.open(icon_path) as src:
+            icon = src.convert("RGBA")
+        iw = max(1, round(icon.width * lay.icon_h / icon.height))
+        icon = icon.resize((iw, lay.icon_h), Image.LANCZOS)
+        img.alpha_composite(icon, ((lay.w - iw) // 2, (lay.h - lay.icon_h) // 2))
+
+    return img.convert("RGB")
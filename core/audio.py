@@ -1,17 +1,27 @@
 from __future__ import annotations
 
+import os
+import shutil
+import subprocess
+import uuid
 from pathlib import Path
-from typing import Tuple, List
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
-import librosa
 import numpy as np
 
+# librosa (numba, scipy) is imported inside the functions that analyse audio,
+# so code paths that only use timestamped templates never load it.
+
+from core.align import min_gap_filter
+from core.cache import PCM_CACHE_DIR, hash_file, touch
+
 
 def load_audio_from_upload(uploaded_file, outputs_dir: Path) -> Tuple[np.ndarray, int, Path]:
     """
     Save uploaded file to disk and load via librosa.
     Returns (y, sr, temp_audio_path).
     """
+    import librosa
     outputs_dir.mkdir(exist_ok=True, parents=True)
 
     tmp_path = outputs_dir / f"tmp_{uploaded_file.name}"
@@ -24,22 +34,25 @@ def load_audio_from_upload(uploaded_file, outputs_dir: Path) -> Tuple[np.ndarray
     return y, sr, tmp_path
 
 
-def get_onset_times(y: np.ndarray, sr: int, max_events: int = 3, min_gap: float = 0.5) -> List[float]:
+def get_all_onset_times(y: np.ndarray, sr: int, min_gap: float = 0.5) -> List[float]:
     """
-    Detect onset times (moments sound starts). We only need a few events (A,B,C).
-    Adds a small min-gap filter to avoid near-duplicate onsets common with TTS.
+    Every detected onset (seconds), with the min-gap filter applied. Used for
+    aligning whole templates; get_onset_times keeps only the first few.
     """
+    import librosa
     onset_frames = librosa.onset.onset_detect(y=y, sr=sr, backtrack=True)
     onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-    onset_times = sorted(float(t) for t in onset_times if t >= 0)
 
     # Min-gap filter (prevents B and C almost on top of each other)
-    filtered = []
-    for t in onset_times:
-        if not filtered or (t - filtered[-1]) >= min_gap:
-            filtered.append(t)
+    return [float(t) for t in min_gap_filter(onset_times, min_gap)]
+
 
-    onset_times = filtered
+def get_onset_times(y: np.ndarray, sr: int, max_events: int = 3, min_gap: float = 0.5) -> List[float]:
+    """
+    Detect onset times (moments sound starts). We only need a few events (A,B,C).
+    Adds a small min-gap filter to avoid near-duplicate onsets common with TTS.
+    """
+    onset_times = get_all_onset_times(y, sr, min_gap=min_gap)
 
     # If enough, take first N
     if len(onset_times) >= max_events:
@@ -47,6 +60,10 @@ def get_onset_times(y: np.ndarray, sr: int, max_events: int = 3, min_gap: float
 
     # Fallback: evenly space across duration if detection is weak
     duration = len(y) / float(sr) if sr else 0
+    return _pad_onset_times(onset_times, duration, max_events)
+
+
+def _pad_onset_times(onset_times: List[float], duration: float, max_events: int) -> List[float]:
     if duration <= 0:
         return []
 
@@ -64,3 +81,249 @@ def get_onset_times(y: np.ndarray, sr: int, max_events: int = 3, min_gap: float
 
     return onset_times[:max_events]
 
+
+# ---- streaming analysis (bounded memory for long files) ----
+
+ANALYSIS_SR = 22050
+
+
+def iter_pcm_blocks(path: Path, sr: int = ANALYSIS_SR, block_samples: int = ANALYSIS_SR * 10) -> Iterator[np.ndarray]:
+    """
+    Decodes any ffmpeg-readable file to mono float32 at `sr`, yielding fixed-size
+    blocks (the last one may be shorter). Only one block is in memory at a time.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", str(path),
+        "-f", "f32le", "-ac", "1", "-ar", str(sr),
+        "pipe:1",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    block_bytes = block_samples * 4
+    try:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            usable = len(data) - len(data) % 4
+            yield np.frombuffer(data[:usable], dtype=np.float32)
+        if proc.wait() != 0:
+            raise RuntimeError(f"FFMPEG DECODE FAILED\n\nSTDERR:\n{proc.stderr.read().decode(errors='replace')}\n")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def _mel_power_blocks(
+    blocks: Iterable[np.ndarray],
+    sr: int,
+    n_fft: int,
+    hop_length: int,
+) -> Iterator[np.ndarray]:
+    """
+    Mel power frames (n_mels x t) of a block stream, exactly as melspectrogram
+    with center=True would frame the whole signal: zero padding of n_fft // 2 at
+    both ends, and the last n_fft - hop samples carried into the next block.
+    """
+    import librosa
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft)
+    tail = np.zeros(n_fft // 2, dtype=np.float32)
+    n_samples = 0
+    emitted = 0
+
+    def _frames(buf: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n = 1 + (len(buf) - n_fft) // hop_length if len(buf) >= n_fft else 0
+        if n == 0:
+            return np.zeros((len(mel_basis), 0), dtype=np.float32), buf
+        S = np.abs(librosa.stft(buf[: n_fft + (n - 1) * hop_length], n_fft=n_fft, hop_length=hop_length, center=False)) ** 2
+        return librosa.feature.melspectrogram(S=S, sr=sr, n_fft=n_fft), buf[n * hop_length:]
+
+    for block in blocks:
+        n_samples += len(block)
+        mel, tail = _frames(np.concatenate([tail, np.asarray(block, dtype=np.float32)]))
+        emitted += mel.shape[1]
+        if mel.shape[1]:
+            yield mel
+
+    mel, _ = _frames(np.concatenate([tail, np.zeros(n_fft // 2, dtype=np.float32)]))
+    # batch framing yields 1 + n // hop frames; the end padding may add one more
+    yield mel[:, : max(0, 1 + n_samples // hop_length - emitted)]
+
+
+def onset_strength_blocks(
+    blocks: Callable[[], Iterable[np.ndarray]],
+    sr: int = ANALYSIS_SR,
+    hop_length: int = 512,
+    n_fft: int = 2048,
+) -> np.ndarray:
+    """
+    librosa.onset.onset_strength (default mel flux) of a signal given as PCM
+    blocks, holding one block in memory at a time.
+
+    power_to_db floors every bin at the global maximum - 80 dB, so `blocks` is
+    called twice: once to find that maximum, once to compute the flux with the
+    previous mel frame carried across block boundaries. The result (one value
+    per hop) equals the batch envelope.
+    """
+    gmax = np.float32(0.0)
+    for mel in _mel_power_blocks(blocks(), sr, n_fft, hop_length):
+        if mel.size:
+            gmax = max(gmax, mel.max())
+    floor = 10.0 * np.log10(np.maximum(np.float32(1e-10), gmax)) - 80.0
+
+    lag = 1
+    parts: List[np.ndarray] = [np.zeros(lag + n_fft // (2 * hop_length), dtype=np.float32)]
+    prev: Optional[np.ndarray] = None
+    total = 0
+    for mel in _mel_power_blocks(blocks(), sr, n_fft, hop_length):
+        db = np.maximum(10.0 * np.log10(np.maximum(np.float32(1e-10), mel)), floor)
+        total += db.shape[1]
+        if prev is not None:
+            db = np.concatenate([prev, db], axis=1)
+        if db.shape[1] > lag:
+            parts.append(np.maximum(0.0, db[:, lag:] - db[:, :-lag]).mean(axis=0))
+        prev = db[:, -lag:]
+
+    return np.concatenate(parts)[:total]
+
+
+def _detect_onsets(env: np.ndarray, sr: int, hop_length: int, min_gap: float) -> List[float]:
+    import librosa
+    onset_frames = librosa.onset.onset_detect(onset_envelope=env, sr=sr, hop_length=hop_length, backtrack=True)
+    onset_times = librosa.frames_to_time(onset_frames, sr=sr, hop_length=hop_length)
+    return [float(t) for t in min_gap_filter(onset_times, min_gap)]
+
+
+def get_onset_times_streaming(
+    path: Path,
+    max_events: Optional[int] = 3,
+    min_gap: float = 0.5,
+    sr: int = ANALYSIS_SR,
+    hop_length: int = 512,
+    block_sec: float = 10.0,
+) -> List[float]:
+    """
+    get_onset_times / get_all_onset_times (max_events=None) for a file of any
+    length: decodes in blocks (twice, see onset_strength_blocks) instead of
+    loading the whole signal, and returns the same onsets.
+    """
+    n_samples = 0
+
+    def _blocks() -> Iterator[np.ndarray]:
+        nonlocal n_samples
+        n_samples = 0
+        for block in iter_pcm_blocks(Path(path), sr=sr, block_samples=int(block_sec * sr)):
+            n_samples += len(block)
+            yield block
+
+    env = onset_strength_blocks(_blocks, sr=sr, hop_length=hop_length)
+    onset_times = _detect_onsets(env, sr, hop_length, min_gap)
+    if max_events is None or len(onset_times) >= max_events:
+        return onset_times if max_events is None else onset_times[:max_events]
+
+    duration = n_samples / float(sr)
+    return _pad_onset_times(onset_times, duration, max_events)
+
+
+# ---- decoded-PCM cache (decode once per content hash, then mmap) ----
+
+def _write_npy(blocks: Iterator[np.ndarray], out_path: Path) -> None:
+    """
+    Streams float32 blocks to a 1-D .npy without holding the whole signal:
+    raw samples go to a temp file first, since the header needs the final length.
+    """
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    token = uuid.uuid4().hex
+    raw = out_path.with_name(f".{out_path.stem}.{token}.raw")
+    tmp = out_path.with_name(f".{out_path.stem}.{token}.npy")
+    try:
+        n = 0
+        with open(raw, "wb") as f:
+            for block in blocks:
+                f.write(np.ascontiguousarray(block, dtype="<f4").tobytes())
+                n += len(block)
+        with open(tmp, "wb") as f, open(raw, "rb") as src:
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype("<f4")), "fortran_order": False, "shape": (n,)}
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(src, f, 1024 * 1024)
+        os.replace(tmp, out_path)
+    finally:
+        raw.unlink(missing_ok=True)
+        tmp.unlink(missing_ok=True)
+
+
+def load_pcm_cached(
+    path: Path,
+    sr: int = ANALYSIS_SR,
+    audio_hash: Optional[str] = None,
+    cache_dir: Path = PCM_CACHE_DIR,
+) -> np.ndarray:
+    """
+    Mono float32 samples at `sr`, decoded by ffmpeg once per (content hash, sr)
+    and memory-mapped read-only on every later call.
+    """
+    digest = audio_hash or hash_file(Path(path))
+    npy = cache_dir / f"{digest}_{sr}.npy"
+    if npy.exists():
+        touch(npy)
+    else:
+        _write_npy(iter_pcm_blocks(Path(path), sr=sr), npy)
+    return np.load(npy, mmap_mode="r")
+
+
+def onset_envelope_cached(
+    path: Path,
+    sr: int = ANALYSIS_SR,
+    hop_length: int = 512,
+    audio_hash: Optional[str] = None,
+    cache_dir: Path = PCM_CACHE_DIR,
+) -> np.ndarray:
+    """
+    Onset strength of the cached PCM (onset_strength_blocks over the memory map,
+    so the signal is never loaded whole), itself cached next to it: sweeps over
+    max_events / min_gap and repeat renders of one upload only re-run peak picking.
+    """
+    digest = audio_hash or hash_file(Path(path))
+    npy = cache_dir / f"{digest}_{sr}_h{hop_length}_env.npy"
+    if npy.exists():
+        touch(npy)
+    else:
+        y = load_pcm_cached(path, sr, digest, cache_dir)
+        n = sr * 10
+        env = onset_strength_blocks(lambda: (y[i:i + n] for i in range(0, len(y), n)), sr=sr, hop_length=hop_length)
+        _write_npy(iter([env]), npy)
+    return np.load(npy, mmap_mode="r")
+
+
+def get_onset_times_cached(
+    path: Path,
+    max_events: Optional[int] = 3,
+    min_gap: float = 0.5,
+    sr: int = ANALYSIS_SR,
+    hop_length: int = 512,
+    audio_hash: Optional[str] = None,
+) -> List[float]:
+    """
+    get_onset_times / get_all_onset_times (max_events=None) on the cached PCM and
+    envelope: same detection, but decode and onset strength run once per file.
+    """
+    digest = audio_hash or hash_file(Path(path))
+    env = np.asarray(onset_envelope_cached(path, sr, hop_length, digest))
+    onset_times = _detect_onsets(env, sr, hop_length, min_gap)
+    if max_events is None or len(onset_times) >= max_events:
+        return onset_times if max_events is None else onset_times[:max_events]
+
+    duration = len(load_pcm_cached(path, sr, digest)) / float(sr)
+    return _pad_onset_times(onset_times, duration, max_events)
+
+
+def template_onsets(units: List[dict], audio_path: Path, audio_hash: Optional[str] = None) -> Optional[List[float]]:
+    """
+    Onsets to align a template's untimed lines to (build_storyboard_table's
+    onset_times), or None when every line has a timestamp, so fully timed
+    templates never decode the audio or load librosa.
+    """
+    if all(u.get("t") is not None for u in units):
+        return None
+    return get_onset_times_cached(Path(audio_path), max_events=None, audio_hash=audio_hash)
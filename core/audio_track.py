@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from core.cache import AUDIO_CACHE_DIR, hash_file, touch
+from core.metrics import span
+from core.profiles import EncodeProfile, get_profile
+from core.scheduler import get_scheduler
+
+# Bump when the normalization below changes (old tracks are then ignored).
+AUDIO_TRACK_VERSION = "1"
+
+TRACK_SAMPLE_RATE = 44100
+TRACK_CHANNELS = 2
+# EBU R128 targets for speech/music streamed on the web
+LOUDNORM = "loudnorm=I=-16:TP=-1.5:LRA=11"
+
+# Output args for renders muxing a prepared track.
+COPY_AUDIO_ARGS = ["-c:a", "copy"]
+
+
+def audio_track_key(
+    audio_hash: str,
+    duration_sec: float,
+    bitrate: str,
+    sample_rate: int = TRACK_SAMPLE_RATE,
+    loudnorm: bool = True,
+) -> str:
+    payload = {
+        "v": AUDIO_TRACK_VERSION,
+        "audio": audio_hash,
+        "duration": round(float(duration_sec), 3),
+        "bitrate": bitrate,
+        "sr": int(sample_rate),
+        "channels": TRACK_CHANNELS,
+        "loudnorm": LOUDNORM if loudnorm else "",
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def audio_track_path(
+    audio_hash: str,
+    duration_sec: float,
+    profile: Optional[EncodeProfile] = None,
+    sample_rate: int = TRACK_SAMPLE_RATE,
+    loudnorm: bool = True,
+    cache_dir: Path = AUDIO_CACHE_DIR,
+) -> Path:
+    """Where prepare_audio_track() keeps the track for these settings (it may not exist yet)."""
+    profile = profile or get_profile()
+    key = audio_track_key(audio_hash, duration_sec, profile.audio_bitrate, sample_rate, loudnorm)
+    return cache_dir / f"{key[:32]}.m4a"
+
+
+def prepare_audio_track(
+    audio_path: str,
+    duration_sec: float,
+    profile: Optional[EncodeProfile] = None,
+    sample_rate: int = TRACK_SAMPLE_RATE,
+    loudnorm: bool = True,
+    audio_hash: Optional[str] = None,
+    cache_dir: Path = AUDIO_CACHE_DIR,
+    cancel_event: Optional[threading.Event] = None,
+) -> Path:
+    """
+    The soundtrack as a finished AAC .m4a: looped or trimmed to duration_sec,
+    resampled, loudness-normalized and encoded at the profile's bitrate.
+    Made once per (audio content, settings); renders mux it with COPY_AUDIO_ARGS.
+    Tracks live under RenderCache's byte budget and TTL (a hit refreshes the
+    LRU clock). Pass audio_hash when known to skip hashing the file.
+    """
+    profile = profile or get_profile()
+    digest = audio_hash or hash_file(Path(audio_path))
+    out = audio_track_path(digest, duration_sec, profile, sample_rate, loudnorm, cache_dir)
+    if out.exists():
+        touch(out)
+        return out
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # unique tmp name: parallel renders of one song may prepare it at once
+    tmp = out.with_name(f".{out.stem}.{uuid.uuid4().hex}.tmp.m4a")
+    filters = ([LOUDNORM] if loudnorm else []) + [f"aresample={sample_rate}"]  # loudnorm upsamples internally
+    cmd = [
+        "ffmpeg", "-y",
+        "-hide_banner", "-loglevel", "error",
+        "-stream_loop", "-1", "-i", str(audio_path),
+        "-map", "0:a:0",
+        "-vn",
+        "-t", str(duration_sec),
+        "-af", ",".join(filters),
+        "-ac", str(TRACK_CHANNELS),
+        "-ar", str(sample_rate),
+        *profile.audio_args(),
+        "-movflags", "+faststart",
+        str(tmp),
+    ]
+    with span("audio_track", duration_sec=duration_sec, loudnorm=loudnorm), get_scheduler().slot(cancel_event):
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(
+            f"FFMPEG FAILED\n\nReturn code: {proc.returncode}\n\nSTDERR:\n{proc.stderr}\n"
+        )
+    os.replace(tmp, out)
+    return out
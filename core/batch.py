@@ -0,0 +1,330 @@
+"""
+Headless batch renderer.
+
+    python -m core.batch manifest.jsonl --results outputs/batch/results.jsonl --workers 4
+
+One JSON object per manifest line; only "audio" is required:
+
+    {"audio": "songs/abc.mp3", "template": "abc", "resolution": "1280x720",
+     "fps": 24, "duration": 60, "engine": "drawtext", "profile": "standard",
+     "output": "out/abc_720p.mp4", "thumbnails": true}
+
+With "renditions" the line renders a ladder in one ffmpeg pass (drawtext engine
+only): "output": "out/abc.mp4" gives out/abc_480p.mp4, out/abc_720p.mp4, ...,
+or out/abc_hls/master.m3u8 with "hls": true.
+
+    {"audio": "songs/abc.mp3", "renditions": ["854x480", "1280x720", "1920x1080"],
+     "hls": false, "output": "out/abc.mp4"}
+
+Relative paths are taken relative to the manifest. Without "output" the video
+goes to outputs/batch/<id>.mp4. A profile's own resolution/fps (e.g. "preview")
+apply unless the line sets them explicitly. With "thumbnails" (the default) a
+poster, thumbnail strip and WebVTT index go to <output stem>_thumbs/. Each
+finished line appends one result record (status, timings, error) to the
+results JSONL. Re-running the same manifest skips every line whose output
+already exists, so a crashed run resumes where it stopped; outputs are written
+to a temp name and renamed only when complete.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.audio import template_onsets
+from core.engines import ENGINES, get_engine
+from core.ladder import render_ladder_drawtext, rendition_name
+from core.metrics import TRACE_DIR, span, trace
+from core.profiles import get_profile
+from core.scheduler import available_cores, configure_scheduler
+from core.songs import get_template_by_key
+from core.storyboard import build_storyboard_table
+from core.thumbnails import build_thumbnails
+from core.warmup import prewarm
+
+BATCH_DIR = ROOT / "outputs" / "batch"
+
+DEFAULTS = {
+    "template": "abc",
+    "resolution": "854x480",
+    "fps": 24,
+    "duration": 60,
+    "engine": "drawtext",
+    "profile": "standard",
+    "thumbnails": True,
+    "renditions": None,
+    "hls": False,
+}
+
+
+def _parse_resolution(value) -> Tuple[int, int]:
+    if isinstance(value, str):
+        w, h = value.lower().split("x")
+        return int(w), int(h)
+    w, h = value
+    return int(w), int(h)
+
+
+def normalize_item(raw: dict, base_dir: Path, line_no: int) -> dict:
+    """
+    Manifest line -> fully specified job (absolute paths, defaults filled in).
+    Raises ValueError for a line that cannot be rendered.
+    """
+    if not isinstance(raw, dict) or not raw.get("audio"):
+        raise ValueError("manifest line needs an \"audio\" path")
+    item = {**DEFAULTS, **raw}
+    if item["engine"] not in ENGINES:
+        raise ValueError(f"unknown engine {item['engine']!r} (choose from {', '.join(sorted(ENGINES))})")
+    try:
+        profile = get_profile(item["profile"])
+    except KeyError as e:
+        raise ValueError(e.args[0]) from None
+
+    renditions = None
+    if item["renditions"] is not None:
+        if item["engine"] != "drawtext":
+            raise ValueError("\"renditions\" needs the drawtext engine (the ladder composites with drawtext)")
+        if not isinstance(item["renditions"], list) or not item["renditions"]:
+            raise ValueError("\"renditions\" must be a non-empty list like [\"854x480\", \"1280x720\"]")
+        renditions = sorted({_parse_resolution(r) for r in item["renditions"]}, key=lambda r: r[1])
+
+    # explicit values on the line win over the profile's, which win over DEFAULTS
+    if renditions:
+        w, h = renditions[-1]  # thumbnails are drawn at the largest rendition
+    else:
+        w, h = _parse_resolution(raw.get("resolution") or profile.resolution or DEFAULTS["resolution"])
+    fps = int(raw.get("fps") or profile.fps or DEFAULTS["fps"])
+    audio = Path(item["audio"])
+    audio = audio if audio.is_absolute() else base_dir / audio
+
+    size = "_".join(rendition_name(r) for r in renditions) if renditions else f"{w}x{h}"
+    job_id = str(item.get("id") or f"{audio.stem}_{item['template']}_{size}_{fps}fps_{item['engine']}_{profile.name}")
+    output = Path(item["output"]) if item.get("output") else BATCH_DIR / f"{job_id}.mp4"
+    output = output if output.is_absolute() else base_dir / output
+
+    return {
+        "line": line_no,
+        "id": job_id,
+        "audio": str(audio.resolve()),
+        "template": str(item["template"]),
+        "resolution": [w, h],
+        "fps": fps,
+        "duration": int(item["duration"]),
+        "engine": item["engine"],
+        "profile": profile.name,
+        "output": str(output.resolve()),
+        "thumbnails": bool(item["thumbnails"]),
+        "renditions": [list(r) for r in renditions] if renditions else None,
+        "hls": bool(item["hls"]),
+    }
+
+
+def expected_outputs(item: dict) -> List[Path]:
+    """
+    Files a finished line leaves behind: its output, or for a ladder one file
+    per rendition (or the HLS master playlist).
+    """
+    output = Path(item["output"])
+    if not item["renditions"]:
+        return [output]
+    if item["hls"]:
+        return [output.with_name(f"{output.stem}_hls") / "master.m3u8"]
+    return [output.with_name(f"{output.stem}_{rendition_name(tuple(r))}.mp4") for r in item["renditions"]]
+
+
+def read_manifest(path: Path) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Yields (line_no, item, error) per non-empty manifest line.
+    """
+    base_dir = path.resolve().parent
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                yield line_no, normalize_item(json.loads(line), base_dir, line_no), None
+            except (ValueError, TypeError) as e:
+                yield line_no, None, f"{type(e).__name__}: {e}"
+
+
+def _init_worker(workers: int) -> None:
+    """
+    Runs once per worker process: parse every template and index the icon
+    directory up front, so jobs in this process only do dict lookups. Each
+    worker's ffmpeg gets an equal share of the cores.
+    """
+    configure_scheduler(slots=1, cores=max(1, available_cores() // workers))
+    prewarm(resolution=None)  # lines differ in resolution, so no size-specific stages
+
+
+def render_item(item: dict) -> dict:
+    """
+    Storyboard + render for one normalized manifest item. Never raises;
+    failures come back as a result record with status "failed".
+    """
+    timings: Dict[str, float] = {}
+    result = {**item, "status": "done", "timings": timings, "error": None}
+    output = Path(item["output"])
+    tmp = output.with_name(f".{output.stem}.{os.getpid()}.tmp{output.suffix}")
+    t_job = time.perf_counter()
+    result["trace"] = str(TRACE_DIR / f"{item['id']}.json")
+    try:
+        with trace(item["id"], engine=item["engine"], profile=item["profile"], template=item["template"]):
+            t0 = time.perf_counter()
+            template = get_template_by_key(item["template"])
+            timings["template_sec"] = round(time.perf_counter() - t0, 6)
+
+            if not Path(item["audio"]).exists():
+                raise FileNotFoundError(f"Missing audio file: {item['audio']}")
+
+            t0 = time.perf_counter()
+            with span("onsets"):
+                onsets = template_onsets(template.units, Path(item["audio"]))
+            timings["onsets_sec"] = round(time.perf_counter() - t0, 6)
+
+            t0 = time.perf_counter()
+            events = build_storyboard_table(template.units, duration_sec=item["duration"], onset_times=onsets)
+            timings["storyboard_sec"] = round(time.perf_counter() - t0, 6)
+
+            output.parent.mkdir(parents=True, exist_ok=True)
+            if item["thumbnails"]:
+                t0 = time.perf_counter()
+                with span("thumbnails"):
+                    thumbs = build_thumbnails(
+                        events, item["duration"], output.with_name(f"{output.stem}_thumbs"), tuple(item["resolution"])
+                    )
+                timings["thumbnails_sec"] = round(time.perf_counter() - t0, 6)
+                result["thumbnails"] = thumbs
+
+            t0 = time.perf_counter()
+            if item["renditions"]:
+                with span("render", engine="ladder", profile=item["profile"]) as s:
+                    # the ladder writes each file under its final name only once the run succeeds
+                    outputs = render_ladder_drawtext(
+                        audio_path=item["audio"],
+                        events=events,
+                        output_dir=str(output.parent),
+                        renditions=[tuple(r) for r in item["renditions"]],
+                        duration_sec=item["duration"],
+                        fps=item["fps"],
+                        profile=get_profile(item["profile"]),
+                        hls=item["hls"],
+                        basename=output.stem,
+                    )
+                    s["output_bytes"] = _output_bytes(outputs)
+                result["outputs"] = outputs
+            else:
+                with span("render", engine=item["engine"], profile=item["profile"]) as s:
+                    get_engine(item["engine"]).render(
+                        audio_path=item["audio"],
+                        events=events,
+                        output_path=str(tmp),
+                        duration_sec=item["duration"],
+                        resolution=tuple(item["resolution"]),
+                        fps=item["fps"],
+                        profile=get_profile(item["profile"]),
+                    )
+                    os.replace(tmp, output)
+                    s["output_bytes"] = output.stat().st_size
+            timings["render_sec"] = round(time.perf_counter() - t0, 6)
+            result["output_bytes"] = s["output_bytes"]
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc(limit=5)
+    finally:
+        tmp.unlink(missing_ok=True)
+        timings["total_sec"] = round(time.perf_counter() - t_job, 6)
+    return result
+
+
+def _output_bytes(outputs: Dict[str, str]) -> int:
+    paths = {Path(p) for p in outputs.values()}
+    # HLS: count every segment next to the playlists, not just the playlists
+    dirs = {p.parent for p in paths if p.suffix == ".m3u8"}
+    files = {f for d in dirs for f in d.rglob("*") if f.is_file()} | {p for p in paths if p.suffix != ".m3u8"}
+    return sum(f.stat().st_size for f in files)
+
+
+def default_workers() -> int:
+    # libx264 already spreads one encode over several cores, so two per job
+    return max(1, available_cores() // 2)
+
+
+def run_batch(
+    manifest: Path,
+    results_path: Path,
+    workers: Optional[int] = None,
+    force: bool = False,
+) -> Dict[str, int]:
+    """
+    Renders every manifest line not already rendered, appending one record per
+    line to results_path. Returns counts per status.
+    """
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+
+    with open(results_path, "a", encoding="utf-8") as out:
+        def record(r: dict) -> None:
+            r["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            out.write(json.dumps(r) + "\n")
+            out.flush()
+            counts[r["status"]] += 1
+            print(f"[{r['status']:>7}] line {r['line']}: {r.get('id') or '-'} {r.get('error') or ''}".rstrip())
+
+        todo: List[dict] = []
+        seen_outputs = set()
+        for line_no, item, error in read_manifest(manifest):
+            if error is not None:
+                record({"line": line_no, "status": "failed", "error": error})
+                continue
+            outputs = expected_outputs(item)
+            if seen_outputs.intersection(outputs) or (not force and all(p.exists() for p in outputs)):
+                record({**item, "status": "skipped", "error": None})
+                continue
+            seen_outputs.update(outputs)
+            todo.append(item)
+
+        if not todo:
+            return counts
+
+        workers = workers or default_workers()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,)) as pool:
+            futures = [pool.submit(render_item, item) for item in todo]
+            for fut in as_completed(futures):
+                record(fut.result())
+
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("manifest", type=Path, help="JSONL, one render per line")
+    ap.add_argument("--results", type=Path, default=None, help="results JSONL (appended)")
+    ap.add_argument("--workers", type=int, default=None, help=f"processes (default {default_workers()})")
+    ap.add_argument("--force", action="store_true", help="re-render even if the output exists")
+    args = ap.parse_args(argv)
+
+    results = args.results or BATCH_DIR / f"results_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"
+    t0 = time.perf_counter()
+    counts = run_batch(args.manifest, results, workers=args.workers, force=args.force)
+    print(
+        f"{counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed "
+        f"in {time.perf_counter() - t0:.1f}s -> {results}"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.metrics import inc
+from core.storyboard import StoryEvent
+
+ROOT = Path(__file__).resolve().parents[1]
+ICONS_DIR = ROOT / "assets" / "icons"
+CACHE_DIR = ROOT / "outputs" / "cache"
+# prepared soundtracks (core.audio_track); evicted with the renders
+AUDIO_CACHE_DIR = CACHE_DIR / "audio"
+# poster / thumbnail sets (core.thumbnails), one directory per render key
+THUMBS_DIR = CACHE_DIR / "thumbs"
+# decoded analysis PCM and onset envelopes (core.audio), .npy per content hash
+PCM_CACHE_DIR = CACHE_DIR / "pcm"
+
+# Bump when the renderer output changes for the same inputs (invalidates old entries).
+RENDER_CACHE_VERSION = "4"
+
+DEFAULT_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+DEFAULT_TTL_SEC = float(os.environ.get("RENDER_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+
+_CHUNK = 1024 * 1024
+
+# resolved path -> number of renders in this process still reading it
+_pinned: Dict[Path, int] = {}
+_pinned_lock = threading.Lock()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@contextmanager
+def pinned(*paths: Path) -> Iterator[None]:
+    """
+    Keeps paths (an upload, a prepared soundtrack) out of every RenderCache.evict()
+    in this process while the block runs, e.g. while a render job reads them and
+    another job finishes and evicts.
+    """
+    resolved = [Path(p).resolve() for p in paths]
+    with _pinned_lock:
+        for p in resolved:
+            _pinned[p] = _pinned.get(p, 0) + 1
+    try:
+        yield
+    finally:
+        with _pinned_lock:
+            for p in resolved:
+                _pinned[p] -= 1
+                if not _pinned[p]:
+                    del _pinned[p]
+
+
+def render_cache_key(
+    audio_hash: str,
+    events: Iterable[StoryEvent],
+    resolution: Tuple[int, int],
+    fps: int,
+    duration_sec: int,
+    icons_dir: Path = ICONS_DIR,
+    extra: Optional[dict] = None,
+) -> str:
+    """
+    Content hash of everything that affects the rendered MP4:
+    audio bytes, storyboard, icon file contents and render settings.
+    """
+    icon_hashes = {}
+    storyboard = []
+    for e in events:
+        storyboard.append([round(float(e.t_start), 3), round(float(e.t_end), 3), e.letter, e.word, e.icon or ""])
+        if e.icon and e.icon not in icon_hashes:
+            p = (icons_dir / e.icon).resolve()
+            icon_hashes[e.icon] = hash_file(p) if p.exists() else ""
+
+    payload = {
+        "v": RENDER_CACHE_VERSION,
+        "audio": audio_hash,
+        "events": storyboard,
+        "icons": icon_hashes,
+        "resolution": list(resolution),
+        "fps": int(fps),
+        "duration": int(duration_sec),
+        "extra": extra or {},
+    }
+    return hash_bytes(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+
+@dataclass
+class CacheEntry:
+    path: Path
+    size: int
+    mtime: float
+
+
+class RenderCache:
+    """
+    Content-addressed store for uploads and rendered videos under a byte budget.
+
+    Layout:
+      <root>/uploads/<sha256><suffix>   deduped audio uploads
+      <root>/renders/<key>.mp4          finished renders
+      <root>/audio/<key>.m4a            prepared soundtracks (core.audio_track)
+      <root>/pcm/<sha256>_<sr>*.npy     decoded analysis PCM and onset envelopes (core.audio)
+      <root>/thumbs/<key[:32]>/         a render's poster and thumbnails (core.thumbnails),
+                                        deleted together with the render
+
+    File mtime doubles as the LRU clock: every hit touches the file.
+    """
+
+    def __init__(
+        self,
+        root: Path = CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_sec: float = DEFAULT_TTL_SEC,
+    ):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.ttl_sec = float(ttl_sec)
+        self.uploads_dir = self.root / "uploads"
+        self.renders_dir = self.root / "renders"
+        self.audio_dir = self.root / "audio"
+        self.pcm_dir = self.root / "pcm"
+        self.thumbs_dir = self.root / "thumbs"
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        self.renders_dir.mkdir(parents=True, exist_ok=True)
+
+    # ---- uploads ----
+
+    def store_upload(self, data: bytes, suffix: str = "") -> Tuple[Path, str]:
+        """
+        Store upload bytes once per content hash. Returns (path, sha256).
+        """
+        digest = hash_bytes(data)
+        path = self.uploads_dir / f"{digest}{suffix.lower()}"
+        if path.exists():
+            touch(path)
+        else:
+            tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return path, digest
+
+    def store_upload_stream(self, stream: BinaryIO, suffix: str = "") -> Tuple[Path, str]:
+        """
+        store_upload for a file-like object: copied to disk in chunks and hashed
+        on the way, so the upload is never held as one bytes object.
+        """
+        h = hashlib.sha256()
+        tmp = self.uploads_dir / f".upload.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in iter(lambda: stream.read(_CHUNK), b""):
+                    h.update(chunk)
+                    f.write(chunk)
+            digest = h.hexdigest()
+            path = self.uploads_dir / f"{digest}{suffix.lower()}"
+            if path.exists():
+                touch(path)
+            else:
+                os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return path, digest
+
+    # ---- renders ----
+
+    def render_path(self, key: str) -> Path:
+        return self.renders_dir / f"{key}.mp4"
+
+    def thumbs_path(self, key: str) -> Path:
+        return self.thumbs_dir / key[:32]
+
+    def _remove_render(self, path: Path) -> None:
+        path.unlink(missing_ok=True)
+        shutil.rmtree(self.thumbs_path(path.stem), ignore_errors=True)
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.render_path(key)
+        if not path.exists():
+            return None
+        if self.ttl_sec > 0 and (time.time() - path.stat().st_mtime) > self.ttl_sec:
+            self._remove_render(path)
+            return None
+        touch(path)
+        return path
+
+    def get_or_render(
+        self,
+        key: str,
+        render: Callable[[Path], str],
+        keep: Iterable[Path] = (),
+    ) -> Tuple[Path, bool]:
+        """
+        Returns (path, hit). On a miss, `render(tmp_path)` writes the video and the
+        result is moved into the store atomically. Entries in `keep` (e.g. other
+        pieces of the same render) are never evicted to make room for it.
+        """
+        hit = self.get(key)
+        inc("render_cache_requests_total", result="hit" if hit is not None else "miss")
+        if hit is not None:
+            return hit, True
+
+        final = self.render_path(key)
+        tmp = final.with_name(f".{key}.{uuid.uuid4().hex}.mp4")
+        try:
+            produced = Path(render(tmp))
+            os.replace(produced, final)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        self.evict(keep=[final, *keep])
+        return final, False
+
+    # ---- eviction ----
+
+    def entries(self) -> List[CacheEntry]:
+        out: List[CacheEntry] = []
+        for d in (self.uploads_dir, self.renders_dir, self.audio_dir, self.pcm_dir):
+            if not d.is_dir():
+                continue
+            for p in d.iterdir():
+                if p.name.startswith(".") or not p.is_file():
+                    continue
+                st = p.stat()
+                out.append(CacheEntry(path=p, size=st.st_size, mtime=st.st_mtime))
+        return out
+
+    def total_bytes(self) -> int:
+        return sum(e.size for e in self.entries())
+
+    def evict(self, keep: Iterable[Path] = ()) -> int:
+        """
+        Drop expired entries, then least-recently-used ones until under max_bytes.
+        A render takes its thumbnail set with it. Returns number of bytes freed.
+        """
+        keep_set = {Path(p).resolve() for p in keep}
+        with _pinned_lock:
+            keep_set.update(_pinned)
+        now = time.time()
+        entries = sorted(self.entries(), key=lambda e: e.mtime)
+        total = sum(e.size for e in entries)
+        freed = 0
+
+        for e in entries:
+            if e.path.resolve() in keep_set:
+                continue
+            expired = self.ttl_sec > 0 and (now - e.mtime) > self.ttl_sec
+            if not expired and total <= self.max_bytes:
+                continue
+            if e.path.parent == self.renders_dir:
+                self._remove_render(e.path)
+            else:
+                e.path.unlink(missing_ok=True)
+            total -= e.size
+            freed += e.size
+
+        self._evict_orphan_thumbs(now)
+        return freed
+
+    def _evict_orphan_thumbs(self, now: float) -> None:
+        """
+        Thumbnail sets whose render never finished (failed, cancelled) or was
+        removed elsewhere; kept until the TTL since one may belong to a render in progress.
+        """
+        if self.ttl_sec <= 0 or not self.thumbs_dir.is_dir():
+            return
+        live = {p.stem[:32] for p in self.renders_dir.glob("*.mp4")}
+        for d in self.thumbs_dir.iterdir():
+            if d.is_dir() and d.name not in live and (now - d.stat().st_mtime) > self.ttl_sec:
+                shutil.rmtree(d, ignore_errors=True)
+
+
+def touch(path: Path) -> None:
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from core.profiles import EncodeProfile
+from core.render import ProgressCallback, render_video_ffmpeg_drawtext
+from core.render_numpy import render_video_numpy
+from core.render_stills import render_video_ffmpeg_stills
+from core.render_timed import render_video_ffmpeg_timed
+from core.segments import render_video_incremental, render_video_parallel
+from core.storyboard import StoryEvent
+
+
+class Renderer(Protocol):
+    """
+    What every engine is called with (by keyword); returns output_path.
+    audio_hash (sha256 of the audio file, if the caller has it) saves
+    re-hashing the upload to find its prepared soundtrack.
+    Engines may take further options of their own, with defaults.
+    """
+
+    def __call__(
+        self,
+        audio_path: str,
+        events: List[StoryEvent],
+        output_path: str,
+        duration_sec: int = 60,
+        resolution: Tuple[int, int] = (854, 480),
+        fps: int = 24,
+        profile: Optional[EncodeProfile] = None,
+        progress_cb: Optional[ProgressCallback] = None,
+        cancel_event: Optional[threading.Event] = None,
+        audio_hash: Optional[str] = None,
+    ) -> str: ...
+
+
+@dataclass(frozen=True)
+class RenderEngine:
+    name: str
+    label: str
+    render: Renderer
+
+
+ENGINES: Dict[str, RenderEngine] = {}
+
+
+def register_engine(name: str, label: str, render: Renderer) -> RenderEngine:
+    """Adds (or replaces) an engine; the app, batch CLI and benchmark all list ENGINES."""
+    engine = RenderEngine(name, label, render)
+    ENGINES[name] = engine
+    return engine
+
+
+def get_engine(name: str) -> RenderEngine:
+    if name not in ENGINES:
+        raise KeyError(f"Unknown render engine {name!r}. Available: {', '.join(ENGINES)}")
+    return ENGINES[name]
+
+
+register_engine("drawtext", "drawtext (per-event filters)", render_video_ffmpeg_drawtext)
+register_engine("parallel", "drawtext, parallel segments", render_video_parallel)
+register_engine("incremental", "drawtext, cached segments (fast re-render after edits)", render_video_incremental)
+register_engine("timed", "timed commands (constant graph)", render_video_ffmpeg_timed)
+register_engine("stills", "still cards (pre-rasterized)", render_video_ffmpeg_stills)
+register_engine("numpy", "NumPy compositor (animated transitions)", render_video_numpy)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from core.cache import CACHE_DIR, hash_file
+
+ICON_CACHE_DIR = CACHE_DIR / "icons"
+
+# Bump when the resizing below changes (old prepared files are then ignored).
+ICON_CACHE_VERSION = "1"
+
+# (path, mtime_ns, size) -> sha256, so an unchanged icon is hashed once per process
+_hashes: Dict[Tuple[str, int, int], str] = {}
+_hashes_lock = threading.Lock()
+
+
+def icon_file_hash(path: Path) -> str:
+    """sha256 of an icon file, memoized on (path, mtime, size)."""
+    st = path.stat()
+    sig = (str(path), st.st_mtime_ns, st.st_size)
+    digest = _hashes.get(sig)
+    if digest is None:
+        digest = hash_file(path)
+        with _hashes_lock:
+            _hashes[sig] = digest
+    return digest
+
+
+def prepare_icon(
+    src: Path,
+    height: int,
+    box_width: Optional[int] = None,
+    cache_dir: Path = ICON_CACHE_DIR,
+) -> Path:
+    """
+    RGBA PNG of `src` scaled to `height` (aspect kept), made once per
+    (file content, size) and reused from cache_dir afterwards.
+
+    With box_width the icon is instead fitted inside box_width x height and
+    centered on a transparent canvas of exactly that size.
+    """
+    src = Path(src)
+    size_tag = f"h{height}" + (f"_box{box_width}" if box_width else "")
+    out = cache_dir / f"{icon_file_hash(src)[:24]}_{size_tag}_v{ICON_CACHE_VERSION}.png"
+    if out.exists():
+        return out
+
+    from PIL import Image  # only on a cache miss
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with Image.open(src) as im:
+        icon = im.convert("RGBA")
+
+    if box_width:
+        scale = min(box_width / icon.width, height / icon.height)
+        w, h = max(1, round(icon.width * scale)), max(1, round(icon.height * scale))
+        icon = icon.resize((w, h), Image.LANCZOS)
+        canvas = Image.new("RGBA", (box_width, height), (0, 0, 0, 0))
+        canvas.paste(icon, ((box_width - w) // 2, (height - h) // 2))
+        icon = canvas
+    else:
+        w = max(1, round(icon.width * height / icon.height))
+        icon = icon.resize((w, height), Image.LANCZOS)
+
+    # unique tmp name: parallel renders may prepare the same icon at once
+    tmp = out.with_name(f".{out.stem}.{uuid.uuid4().hex}.tmp.png")
+    icon.save(tmp, "PNG")
+    os.replace(tmp, out)
+    return out
+
+
+def prepare_icons(
+    paths: Iterable[Path],
+    height: int,
+    box_width: Optional[int] = None,
+) -> Dict[str, Path]:
+    """
+    Original icon path (as str) -> prepared PNG, for each distinct path.
+    """
+    return {str(p): prepare_icon(Path(p), height, box_width) for p in dict.fromkeys(paths)}
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from core.metrics import inc, trace
+from core.render import RenderCancelled, RenderProgress
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+DEFAULT_WORKERS = int(os.environ.get("RENDER_JOB_WORKERS", "2"))
+# Finished jobs stay queryable this long (seconds) so reconnecting sessions can pick them up.
+JOB_RETENTION_SEC = float(os.environ.get("RENDER_JOB_RETENTION_SEC", "3600"))
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stage: str = ""
+    result: Optional[str] = None
+    error: Optional[str] = None
+    meta: dict = field(default_factory=dict)
+    progress: Optional[RenderProgress] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+    future: Optional[Future] = field(default=None, repr=False, compare=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def set_stage(self, stage: str) -> None:
+        self.stage = stage
+
+    def set_progress(self, progress: RenderProgress) -> None:
+        self.progress = progress
+
+
+class JobManager:
+    """
+    Process-wide render job table plus a worker pool.
+
+    Jobs live outside any Streamlit session, so they keep running across
+    reruns and can be looked up again by id after a reconnect. Submitting a
+    key that is already queued, running or done returns the existing job
+    instead of starting a second render. Keys should cover everything that
+    changes the output (the app uses core.cache.render_cache_key).
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, retention_sec: float = JOB_RETENTION_SEC):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="render-job")
+        self._lock = threading.Lock()
+        self._by_id: Dict[str, Job] = {}
+        self._by_key: Dict[str, Job] = {}
+        self.retention_sec = retention_sec
+
+    def submit(self, key: str, fn: Callable[[Job], str], meta: Optional[dict] = None) -> Job:
+        """
+        `fn(job)` runs on a worker and returns the output path.
+        """
+        with self._lock:
+            self._prune_locked()
+
+            existing = self._by_key.get(key)
+            if existing is not None and existing.status not in (FAILED, CANCELLED):
+                # a finished job whose output was evicted from disk is re-run
+                if not (existing.status == DONE and existing.result and not os.path.exists(existing.result)):
+                    return existing
+
+            job = Job(id=uuid.uuid4().hex, key=key, meta=dict(meta or {}))
+            self._by_id[job.id] = job
+            self._by_key[key] = job
+            job.future = self._pool.submit(self._run, job, fn)
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._by_id.get(job_id)
+
+    def find(self, key: str) -> Optional[Job]:
+        with self._lock:
+            return self._by_key.get(key)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Stops a queued or running job; a running ffmpeg is killed and its partial output removed.
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        return True
+
+    def queue_position(self, job_id: str) -> int:
+        """
+        1-based place of a queued job among all queued jobs (the pool runs them
+        in submission order); 0 if it is not queued.
+        """
+        with self._lock:
+            job = self._by_id.get(job_id)
+            if job is None or job.status != QUEUED or job.cancel_event.is_set():
+                return 0
+            ahead = [j for j in self._by_id.values()
+                     if j.status == QUEUED and not j.cancel_event.is_set() and j.created_at < job.created_at]
+            return len(ahead) + 1
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._by_id.values())
+
+    def _run(self, job: Job, fn: Callable[[Job], str]) -> None:
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            # one trace per job, under the job id (outputs/cache/traces/<id>.json)
+            with trace(job.id, **{**job.meta, "key": job.key}):
+                job.result = fn(job)
+            job.status = DONE
+        except RenderCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            inc("render_jobs_total", status=job.status)
+
+    def _prune_locked(self) -> None:
+        if self.retention_sec <= 0:
+            return
+        cutoff = time.time() - self.retention_sec
+        stale = [j for j in self._by_id.values() if j.finished and (j.finished_at or 0) < cutoff]
+        for j in stale:
+            self._by_id.pop(j.id, None)
+            if self._by_key.get(j.key) is j:
+                self._by_key.pop(j.key, None)
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """
+    Module-level singleton; Streamlit reruns re-execute app.py but keep imported modules.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
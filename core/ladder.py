@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from core.audio_track import COPY_AUDIO_ARGS, prepare_audio_track
+from core.icons import prepare_icons
+from core.metrics import annotate, observe
+from core.profiles import EncodeProfile, get_profile
+from core.render import (
+    ProgressCallback,
+    build_drawtext_filtergraph,
+    card_layout,
+    collect_icon_paths,
+    keyframe_args,
+    run_ffmpeg,
+)
+from core.storyboard import StoryEvent
+
+DEFAULT_LADDER: List[Tuple[int, int]] = [(854, 480), (1280, 720), (1920, 1080)]
+
+# Nominal x264 rate for these mostly static card videos, per megapixel. HLS caps each
+# rendition's CRF encode at it, which is also what ffmpeg reports as the variant's
+# BANDWIDTH in master.m3u8 (uncapped CRF streams carry no rate to report).
+HLS_KBPS_PER_MEGAPIXEL = 2700
+
+
+def rendition_name(resolution: Tuple[int, int]) -> str:
+    return f"{resolution[1]}p"
+
+
+def nominal_video_kbps(resolution: Tuple[int, int]) -> int:
+    """Peak video bitrate for one HLS rendition, rounded to 100 kbit/s."""
+    w, h = resolution
+    return max(200, int(round(w * h * HLS_KBPS_PER_MEGAPIXEL / 1e6 / 100.0)) * 100)
+
+
+def _tee_escape(path: Path) -> str:
+    # tee slave names: these characters separate slaves / options
+    s = str(path)
+    for ch in ("\\", "|", "[", "]", "'"):
+        s = s.replace(ch, "\\" + ch)
+    return s
+
+
+def build_ladder_filtergraph(
+    events: List[StoryEvent],
+    icon_input_idx: Dict[str, int],
+    duration_sec: float,
+    renditions: Sequence[Tuple[int, int]],
+    fps: int,
+) -> Tuple[str, List[str]]:
+    """
+    Composites once at renditions[0] (the largest), then splits and downscales
+    for the rest. Returns (filter_complex, one output label per rendition).
+    """
+    graph, current = build_drawtext_filtergraph(events, icon_input_idx, duration_sec, renditions[0], fps)
+    if len(renditions) == 1:
+        return graph, [current]
+
+    branches = [f"[r{i}]" for i in range(len(renditions))]
+    parts = [graph, f"{current}split={len(renditions)}{''.join(branches)}"]
+    labels = [branches[0]]
+    for i, (w, h) in enumerate(renditions[1:], start=1):
+        parts.append(f"{branches[i]}scale={w}:{h}:flags=lanczos[s{i}]")
+        labels.append(f"[s{i}]")
+    return ";".join(parts), labels
+
+
+def render_ladder_drawtext(
+    audio_path: str,
+    events: List[StoryEvent],
+    output_dir: str,
+    renditions: Sequence[Tuple[int, int]] = DEFAULT_LADDER,
+    duration_sec: int = 60,
+    fps: int = 24,
+    profile: Optional[EncodeProfile] = None,
+    hls: bool = False,
+    hls_segment_sec: int = 4,
+    basename: str = "video",
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    audio_hash: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Every rendition from one ffmpeg run: one graph, one composite, one audio encode.
+
+    hls=False -> <basename>_<height>p.mp4 per rendition, written through the tee
+                 muxer so the single AAC stream is shared by all files.
+    hls=True  -> <basename>_hls/ with fMP4 segments per rendition, one audio
+                 rendition group and master.m3u8; keyframes are pinned to the
+                 segment length so every rendition switches on the same boundary,
+                 and each rendition is capped at nominal_video_kbps.
+
+    Returns rendition name -> file (and "master" -> playlist for HLS).
+    """
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    profile = profile or get_profile()
+    audio_track = prepare_audio_track(audio_path, duration_sec, profile, audio_hash=audio_hash, cancel_event=cancel_event)
+    renditions = sorted({tuple(r) for r in renditions}, key=lambda r: r[1], reverse=True)
+    names = [rendition_name(r) for r in renditions]
+
+    icon_paths_unique = collect_icon_paths(events)
+    prepared = prepare_icons(icon_paths_unique, card_layout(renditions[0]).icon_h)
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-hide_banner", "-loglevel", "error",
+        "-i", str(audio_track),
+    ]
+    for p in icon_paths_unique:
+        cmd += ["-i", str(prepared[str(p)])]
+    icon_input_idx = {str(p): i + 1 for i, p in enumerate(icon_paths_unique)}  # audio=0, icons start=1
+
+    filter_complex, labels = build_ladder_filtergraph(events, icon_input_idx, duration_sec, renditions, fps)
+    observe("filtergraph_bytes", len(filter_complex), engine="ladder")
+    annotate(filtergraph_bytes=len(filter_complex))
+    cmd += ["-filter_complex", filter_complex]
+    for label in labels:
+        cmd += ["-map", label]
+    cmd += [
+        "-map", "0:a",
+        "-t", str(duration_sec),
+        "-r", str(fps),
+        *profile.video_args(),
+        *keyframe_args(events, duration_sec),
+        *COPY_AUDIO_ARGS,
+        "-shortest",
+    ]
+
+    work_dir = Path(tempfile.mkdtemp(prefix=".ladder_", dir=out_dir))
+    try:
+        if hls:
+            gop = str(max(1, int(fps * hls_segment_sec)))
+            streams = ["a:0,agroup:aud,name:audio"] + [
+                f"v:{i},agroup:aud,name:{name}" for i, name in enumerate(names)
+            ]
+            for i, r in enumerate(renditions):
+                kbps = nominal_video_kbps(r)
+                cmd += [f"-maxrate:v:{i}", f"{kbps}k", f"-bufsize:v:{i}", f"{2 * kbps}k"]
+            cmd += [
+                "-g", gop, "-keyint_min", gop, "-sc_threshold", "0",
+                "-f", "hls",
+                "-hls_time", str(hls_segment_sec),
+                "-hls_playlist_type", "vod",
+                "-hls_segment_type", "fmp4",
+                "-hls_segment_filename", str(work_dir / "%v" / "seg_%05d.m4s"),
+                "-master_pl_name", "master.m3u8",
+                "-var_stream_map", " ".join(streams),
+                str(work_dir / "%v" / "index.m3u8"),
+            ]
+            run_ffmpeg(cmd, duration_sec, progress_cb, cancel_event)
+
+            # mkdtemp creates the directory 0700; the published one must be readable by the web server
+            os.chmod(work_dir, 0o755)
+            final = out_dir / f"{basename}_hls"
+            if final.exists():
+                shutil.rmtree(final)
+            os.replace(work_dir, final)
+            result = {name: str(final / name / "index.m3u8") for name in names}
+            result["master"] = str(final / "master.m3u8")
+            return result
+
+        slaves = [
+            f"[select=\\'v:{i},a\\':f=mp4:movflags=+faststart]{_tee_escape(work_dir / f'{name}.mp4')}"
+            for i, name in enumerate(names)
+        ]
+        cmd += ["-f", "tee", "|".join(slaves)]
+        run_ffmpeg(cmd, duration_sec, progress_cb, cancel_event)
+
+        result = {}
+        for name in names:
+            final = out_dir / f"{basename}_{name}.mp4"
+            os.replace(work_dir / f"{name}.mp4", final)
+            result[name] = str(final)
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
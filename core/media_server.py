@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import mmap
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from core.cache import CACHE_DIR
+
+# Off unless a port is configured; MEDIA_BASE_URL is what browsers use to reach it
+# (e.g. behind a reverse proxy), defaulting to http://localhost:<port>.
+MEDIA_SERVER_PORT = int(os.environ.get("MEDIA_SERVER_PORT", "0"))
+# There is no auth: loopback only unless explicitly opened up (e.g. 0.0.0.0 in a container).
+MEDIA_SERVER_HOST = os.environ.get("MEDIA_SERVER_HOST", "127.0.0.1")
+MEDIA_BASE_URL = os.environ.get("MEDIA_BASE_URL", "")
+MEDIA_ROOT = CACHE_DIR / "renders"
+
+_CHUNK = 1024 * 1024
+_NAME = re.compile(r"^[A-Za-z0-9_.-]+\.mp4$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single byte range -> inclusive (start, end), or None for the whole file.
+    Raises ValueError for an unsatisfiable range.
+    """
+    if not header:
+        return None
+    m = _RANGE.match(header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        raise ValueError(header)
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        # suffix range: last N bytes
+        start = max(0, size - int(m.group(2)))
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    root: Path = MEDIA_ROOT
+
+    def do_HEAD(self) -> None:
+        self._serve(send_body=False)
+
+    def do_GET(self) -> None:
+        self._serve(send_body=True)
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # Streamlit owns the console
+
+    def _serve(self, send_body: bool) -> None:
+        url = urlsplit(self.path)
+        name = url.path.rsplit("/", 1)[-1]
+        path = self.root / name
+        if not _NAME.match(name) or not path.is_file():
+            self.send_error(404)
+            return
+
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            try:
+                rng = _parse_range(self.headers.get("Range"), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+
+            start, end = rng if rng is not None else (0, size - 1)
+            self.send_response(206 if rng is not None else 200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1 if size else 0))
+            if rng is not None:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            if "download" in parse_qs(url.query):
+                self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+            self.end_headers()
+
+            if not send_body or size == 0:
+                return
+
+            # pages come from the page cache via the mapping; nothing is copied into the Python heap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for off in range(start, end + 1, _CHUNK):
+                        self.wfile.write(view[off: min(off + _CHUNK, end + 1)])
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # player seeked away
+                finally:
+                    view.release()
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def ensure_media_server(
+    port: int = MEDIA_SERVER_PORT, root: Path = MEDIA_ROOT, host: str = MEDIA_SERVER_HOST
+) -> Optional[ThreadingHTTPServer]:
+    """
+    Starts the ranged file server once per process (if a port is configured).
+    """
+    global _server
+    if port <= 0:
+        return None
+    with _server_lock:
+        if _server is None:
+            handler = type("MediaHandler", (_MediaHandler,), {"root": Path(root)})
+            _server = ThreadingHTTPServer((host, port), handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="media-server", daemon=True).start()
+        return _server
+
+
+def media_url(path: Path, download: bool = False) -> Optional[str]:
+    """
+    Browser URL for a rendered file, or None when the media server is off or
+    the file is not under its root.
+    """
+    server = ensure_media_server()
+    path = Path(path)
+    if server is None or path.resolve().parent != MEDIA_ROOT.resolve():
+        return None
+    base = (MEDIA_BASE_URL or f"http://localhost:{server.server_address[1]}").rstrip("/")
+    return f"{base}/renders/{path.name}" + ("?download=1" if download else "")
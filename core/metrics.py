@@ -0,0 +1,352 @@
+"""
+Render pipeline metrics and traces.
+
+Counters, gauges and histograms are kept in-process and exported as Prometheus
+text (render_prometheus(), or GET /metrics when METRICS_PORT is set). A trace
+is the list of timed spans of one job; it is written to outputs/cache/traces/
+<id>.json when the job ends and served at GET /traces/<id>; the newest
+TRACE_KEEP files (none older than TRACE_TTL_SEC) are kept.
+
+The current trace and span live in context variables, so work handed to a
+thread pool must run in the caller's context to land in the same trace:
+
+    pool.submit(bind_context(render_segment), ...)
+
+    with trace(job.id, engine="drawtext"):
+        with span("storyboard") as s:
+            events = build_storyboard_table(...)
+            s["events"] = len(events)
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+ROOT = Path(__file__).resolve().parents[1]
+# under the cache dir (core.cache.CACHE_DIR); this module imports nothing from core
+TRACE_DIR = ROOT / "outputs" / "cache" / "traces"
+# Off unless a port is configured.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# Traces kept in memory for /traces/<id>.
+MAX_RECENT_TRACES = 200
+# Trace files kept on disk: the newest TRACE_KEEP, and none older than TRACE_TTL_SEC.
+TRACE_KEEP = int(os.environ.get("RENDER_TRACE_KEEP", "1000"))
+TRACE_TTL_SEC = float(os.environ.get("RENDER_TRACE_TTL_SEC", str(7 * 24 * 3600)))
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+BYTES_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(11))  # 1 KiB .. 1 GiB
+COUNT_BUCKETS = (1.0, 5.0, 10.0, 26.0, 50.0, 100.0, 250.0, 1000.0, 2500.0, 10000.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+F = TypeVar("F", bound=Callable)
+
+# name -> (type, help, histogram buckets)
+_DEFS: Dict[str, Tuple[str, str, Sequence[float]]] = {}
+_values: Dict[str, Dict[LabelKey, object]] = {}
+_lock = threading.Lock()
+
+
+def define(name: str, kind: str, help: str, buckets: Sequence[float] = SECONDS_BUCKETS) -> None:
+    """Declares a metric; kind is "counter", "gauge" or "histogram"."""
+    with _lock:
+        _DEFS[name] = (kind, help, tuple(sorted(buckets)))
+        _values.setdefault(name, {})
+
+
+define("render_stage_seconds", "histogram", "Wall time per pipeline stage (span).")
+define("render_stage_errors_total", "counter", "Spans that ended in an exception, by stage.")
+define("storyboard_events", "histogram", "Events per built storyboard.", COUNT_BUCKETS)
+define("filtergraph_bytes", "histogram", "Size of generated ffmpeg filtergraphs / command scripts.", BYTES_BUCKETS)
+define("ffmpeg_runs_total", "counter", "Finished ffmpeg processes by exit status.")
+define("ffmpeg_queue_wait_seconds", "histogram", "Time spent waiting for an ffmpeg slot.")
+define("ffmpeg_running", "gauge", "ffmpeg slots in use (a segment-parallel job may hold several).")
+define("ffmpeg_queued", "gauge", "Jobs waiting for an ffmpeg slot.")
+define("render_output_bytes", "histogram", "Size of finished renders.", BYTES_BUCKETS)
+define("render_cache_requests_total", "counter", "Render cache lookups by result (hit/miss).")
+define("render_jobs_total", "counter", "Finished render jobs by status.")
+
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    k = _key(labels)
+    with _lock:
+        series = _values[name]
+        series[k] = series.get(k, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _values[name][_key(labels)] = float(value)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    buckets = _DEFS[name][2]
+    k = _key(labels)
+    with _lock:
+        h = _values[name].get(k)
+        if h is None:
+            h = _values[name][k] = {"counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, le in enumerate(buckets):
+            if value <= le:
+                h["counts"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(k: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = k + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in items) + "}"
+
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines: List[str] = []
+    with _lock:
+        for name, (kind, help, buckets) in _DEFS.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for k, v in sorted(_values[name].items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_fmt_labels(k)} {_fmt_num(v)}")
+                    continue
+                for le, c in zip(buckets, v["counts"]):
+                    lines.append(f"{name}_bucket{_fmt_labels(k, (('le', _fmt_num(le)),))} {c}")
+                lines.append(f"{name}_bucket{_fmt_labels(k, (('le', '+Inf'),))} {v['count']}")
+                lines.append(f"{name}_sum{_fmt_labels(k)} {_fmt_num(v['sum'])}")
+                lines.append(f"{name}_count{_fmt_labels(k)} {v['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """
+    Spans of one job, in start order; each span names its parent span id.
+    Spans may be opened from several threads at once (see bind_context).
+    """
+
+    def __init__(self, trace_id: str, attrs: Optional[dict] = None):
+        self.id = trace_id
+        self.attrs = dict(attrs or {})
+        self.started_at = time.time()
+        self.status = "running"
+        self.spans: List[dict] = []
+        self._lock = threading.Lock()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "trace_id": self.id,
+                "attrs": dict(self.attrs),
+                "started_at": self.started_at,
+                "status": self.status,
+                "spans": [dict(s, attrs=dict(s["attrs"])) for s in self.spans],
+            }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("render_trace", default=None)
+# innermost open span of this context (thread / task): the parent of the next one
+_current_span: ContextVar[Optional[dict]] = ContextVar("render_span", default=None)
+_recent: "OrderedDict[str, Trace]" = OrderedDict()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def bind_context(fn: F) -> F:
+    """
+    fn bound to a copy of the caller's context (current trace and span), for
+    running on another thread. Bind once per submitted call: one context
+    cannot be entered by two threads at once.
+    """
+    ctx = copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+
+    return run  # type: ignore[return-value]
+
+
+def _status_of(exc: BaseException) -> str:
+    return "cancelled" if type(exc).__name__ == "RenderCancelled" else "error"
+
+
+@contextmanager
+def trace(trace_id: Optional[str] = None, **attrs) -> Iterator[Trace]:
+    """
+    Makes a new Trace current for the block (this thread / context only) and
+    writes it to TRACE_DIR/<id>.json at the end, whatever the outcome.
+    """
+    tr = Trace(trace_id or uuid.uuid4().hex, attrs)
+    with _lock:
+        _recent[tr.id] = tr
+        while len(_recent) > MAX_RECENT_TRACES:
+            _recent.popitem(last=False)
+    token = _current.set(tr)
+    span_token = _current_span.set(None)
+    try:
+        yield tr
+        tr.status = "ok"
+    except BaseException as e:
+        tr.status = _status_of(e)
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current.reset(token)
+        try:
+            TRACE_DIR.mkdir(parents=True, exist_ok=True)
+            (TRACE_DIR / f"{tr.id}.json").write_text(json.dumps(tr.to_dict(), indent=2), encoding="utf-8")
+            prune_traces()
+        except OSError:
+            pass  # traces are best effort; never fail a render over one
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[dict]:
+    """
+    Times the block as stage `name` (render_stage_seconds{stage=name}) and, if
+    a trace is current, records it there. Yields the span's attrs dict, which
+    the block may fill in (event counts, sizes, ...).
+    """
+    tr = _current.get()
+    parent = _current_span.get()
+    rec = {
+        "id": uuid.uuid4().hex[:16],
+        "name": name,
+        "parent": parent["id"] if parent is not None else None,
+        "start": time.time(),
+        "duration_sec": None,
+        "status": "ok",
+        "attrs": dict(attrs),
+    }
+    if tr is not None:
+        with tr._lock:
+            tr.spans.append(rec)
+    token = _current_span.set(rec)
+    t0 = time.perf_counter()
+    try:
+        yield rec["attrs"]
+    except BaseException as e:
+        rec["status"] = _status_of(e)
+        rec["error"] = f"{type(e).__name__}: {str(e)[:500]}"
+        if rec["status"] == "error":
+            inc("render_stage_errors_total", stage=name)
+        raise
+    finally:
+        _current_span.reset(token)
+        rec["duration_sec"] = round(time.perf_counter() - t0, 6)
+        observe("render_stage_seconds", rec["duration_sec"], stage=name)
+
+
+def annotate(**attrs) -> None:
+    """Adds attributes to the innermost open span of this context, if any."""
+    tr, rec = _current.get(), _current_span.get()
+    if tr is None or rec is None:
+        return
+    with tr._lock:
+        rec["attrs"].update(attrs)
+
+
+def get_trace(trace_id: str) -> Optional[dict]:
+    """A recent trace from memory, else from TRACE_DIR."""
+    with _lock:
+        tr = _recent.get(trace_id)
+    if tr is not None:
+        return tr.to_dict()
+    path = TRACE_DIR / f"{trace_id}.json"
+    if path.parent == TRACE_DIR and path.is_file():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return None
+
+
+def prune_traces(keep: int = TRACE_KEEP, ttl_sec: float = TRACE_TTL_SEC, trace_dir: Path = TRACE_DIR) -> int:
+    """
+    Deletes trace files beyond the newest `keep` or older than ttl_sec
+    (0 disables either limit). Returns the number of files removed.
+    """
+    now = time.time()
+    files = []
+    for p in trace_dir.glob("*.json"):
+        try:
+            files.append((p.stat().st_mtime, p))
+        except OSError:
+            continue  # removed by a concurrent prune
+    files.sort(reverse=True)
+    removed = 0
+    for i, (mtime, p) in enumerate(files):
+        if (keep > 0 and i >= keep) or (ttl_sec > 0 and now - mtime > ttl_sec):
+            p.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/metrics":
+            self._send(200, "text/plain; version=0.0.4; charset=utf-8", render_prometheus().encode("utf-8"))
+        elif path == "/traces":
+            with _lock:
+                ids = list(reversed(_recent))
+            self._send(200, "application/json", json.dumps(ids).encode("utf-8"))
+        elif path.startswith("/traces/"):
+            tr = get_trace(path[len("/traces/"):]) if "/" not in path[len("/traces/"):] else None
+            if tr is None:
+                self.send_error(404)
+            else:
+                self._send(200, "application/json", json.dumps(tr).encode("utf-8"))
+        else:
+            self.send_error(404)
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # Streamlit owns the console
+
+    def _send(self, code: int, content_type: str, body: bytes) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def ensure_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """
+    Starts the /metrics + /traces endpoint once per process (if a port is configured).
+    Binds to localhost by default: traces carry file paths.
+    """
+    global _server
+    if port <= 0:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class EncodeProfile:
+    """
+    x264 settings plus optional output size / frame rate overrides.
+    threads=0 leaves the thread count to ffmpeg; resolution/fps=None keep the caller's.
+    """
+    name: str
+    preset: str
+    crf: int
+    threads: int = 0
+    resolution: Optional[Tuple[int, int]] = None
+    fps: Optional[int] = None
+    audio_bitrate: str = "128k"
+
+    def video_args(self, threads: Optional[int] = None) -> List[str]:
+        """libx264 output args; `threads` overrides the profile's thread count."""
+        n = self.threads if threads is None else threads
+        args = [
+            "-c:v", "libx264",
+            "-preset", self.preset,
+            "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p",
+        ]
+        if n:
+            args += ["-threads", str(n)]
+        return args
+
+    def audio_args(self) -> List[str]:
+        return ["-c:a", "aac", "-b:a", self.audio_bitrate]
+
+    def resolve(self, resolution: Tuple[int, int], fps: int) -> Tuple[Tuple[int, int], int]:
+        """(resolution, fps) to render at: the profile's overrides, else the given ones."""
+        return tuple(self.resolution or resolution), int(self.fps or fps)
+
+    def cache_fields(self) -> dict:
+        return asdict(self)
+
+
+PROFILES: Dict[str, EncodeProfile] = {
+    # seconds-fast proxy for checking timing; blocky but readable
+    "preview": EncodeProfile("preview", preset="ultrafast", crf=30, resolution=(426, 240), fps=12, audio_bitrate="64k"),
+    # libx264's own defaults, i.e. what the renderers produced before profiles existed
+    "standard": EncodeProfile("standard", preset="medium", crf=23),
+    "archive": EncodeProfile("archive", preset="slow", crf=18, audio_bitrate="192k"),
+}
+
+DEFAULT_PROFILE = "standard"
+
+
+def get_profile(name: Optional[str] = None) -> EncodeProfile:
+    key = name or DEFAULT_PROFILE
+    if key not in PROFILES:
+        raise KeyError(f"Unknown encode profile {key!r}. Available: {', '.join(PROFILES)}")
+    return PROFILES[key]
@@ -47,6 +47,12 @@ def parse_prompt_lines(lines: List[str]) -> List[Dict]:
     B) Non-timestamped:
        A|Apple|a.png
 
+    C) Label only (colors_song.txt):
+       RED
+
+    D) Label and word separated by whitespace (numbers_song.txt):
+       1 Apple
+
     Returns list of units:
       {"t": float_seconds_or_None, "letter": str, "word": str, "icon": str}
     """
@@ -65,8 +71,10 @@ def parse_prompt_lines(lines: List[str]) -> List[Dict]:
             rest = m.group(2)
             t = ts_to_seconds(ts)
             parts = [p.strip() for p in rest.split("|")]
-        else:
+        elif "|" in line:
             parts = [p.strip() for p in line.split("|")]
+        else:
+            parts = line.split(None, 1)
 
         letter = parts[0] if len(parts) > 0 else ""
         word = parts[1] if len(parts) > 1 else ""
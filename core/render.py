@@ -1,10 +1,19 @@
 from __future__ import annotations
 
 import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
 
-from core.storyboard import StoryEvent
+from core.audio_track import COPY_AUDIO_ARGS, prepare_audio_track
+from core.icons import prepare_icons
+from core.metrics import annotate, inc, observe, span
+from core.profiles import EncodeProfile, get_profile
+from core.scheduler import apply_thread_budget, get_scheduler
+from core.storyboard import StoryEvent, Storyboard
 
 ROOT = Path(__file__).resolve().parents[1]
 ICONS_DIR = ROOT / "assets" / "icons"
@@ -22,70 +31,139 @@ def _escape_text(s: str) -> str:
     )
 
 
-def render_video_ffmpeg_drawtext(
-    audio_path: str,
-    events: List[StoryEvent],
-    output_path: str,
-    duration_sec: int = 60,
-    resolution: Tuple[int, int] = (854, 480),
-    fps: int = 24,
-) -> str:
-    out = Path(output_path)
-    out.parent.mkdir(parents=True, exist_ok=True)
+@dataclass(frozen=True)
+class CardLayout:
+    """Pixel positions for the card, texts and icon at a given resolution."""
+    w: int
+    h: int
+    card_x: int
+    card_y: int
+    card_w: int
+    card_h: int
+    big_fs: int
+    word_fs: int
+    big_y: int
+    word_y: int
+    icon_h: int
+    icon_y: int
+
 
+def card_layout(resolution: Tuple[int, int]) -> CardLayout:
     w, h = resolution
 
     # ---- pixel constants (NO expressions like w*0.12 on Streamlit Cloud) ----
-    card_x = int(w * 0.12)
-    card_y = int(h * 0.14)
-    card_w = int(w * 0.76)
-    card_h = int(h * 0.72)
+    return CardLayout(
+        w=w,
+        h=h,
+        card_x=int(w * 0.12),
+        card_y=int(h * 0.14),
+        card_w=int(w * 0.76),
+        card_h=int(h * 0.72),
+        big_fs=int(h * 0.22),
+        word_fs=int(h * 0.10),
+        big_y=int(h * 0.22),
+        word_y=int(h * 0.50),
+        icon_h=int(h * 0.20),
+        icon_y=int(h * 0.62),
+    )
+
+
+_icon_index: Tuple[int, Dict[str, Path]] = (-1, {})
+_icon_index_lock = threading.Lock()
 
-    big_fs = int(h * 0.22)
-    word_fs = int(h * 0.10)
 
-    big_y = int(h * 0.22)
-    word_y = int(h * 0.50)
+def icon_index() -> Dict[str, Path]:
+    """
+    File name -> resolved path for everything in ICONS_DIR.
+    Rescanned only when the directory's mtime changes (a file added or removed).
+    """
+    global _icon_index
+    try:
+        sig = ICONS_DIR.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _icon_index[0] != sig:
+        with _icon_index_lock:
+            if _icon_index[0] != sig:
+                _icon_index = (sig, {p.name: p.resolve() for p in ICONS_DIR.iterdir() if p.is_file()})
+    return _icon_index[1]
 
-    icon_h = int(h * 0.20)
-    icon_y = int(h * 0.62)
 
-    # Collect icons used
-    icon_paths: List[Path] = []
-    for e in events:
-        if e.icon:
-            p = (ICONS_DIR / e.icon).resolve()
-            if p.exists():
-                icon_paths.append(p)
+def resolve_icon(name: str) -> Path:
+    """Path of an icon named in a storyboard (may not exist)."""
+    return icon_index().get(name) or (ICONS_DIR / name).resolve()
 
-    # unique preserve order
+
+def collect_icon_paths(events: Iterable[StoryEvent]) -> List[Path]:
+    """
+    Existing icon files referenced by events, unique, in first-use order.
+    Each distinct icon name is resolved once, not once per event.
+    """
+    if isinstance(events, Storyboard):
+        names = events.unique_icons()
+    else:
+        names = list(dict.fromkeys(e.icon for e in events if e.icon))
+
+    index = icon_index()
     seen = set()
     icon_paths_unique: List[Path] = []
-    for p in icon_paths:
-        if str(p) not in seen:
-            seen.add(str(p))
-            icon_paths_unique.append(p)
+    for name in names:
+        p = index.get(name)
+        if p is None:
+            # not a plain file name in ICONS_DIR (e.g. a sub-path): resolve it directly
+            p = resolve_icon(name)
+            if not p.exists():
+                continue
+        if str(p) in seen:
+            continue
+        seen.add(str(p))
+        icon_paths_unique.append(p)
+    return icon_paths_unique
 
-    # ffmpeg inputs (audio + icons as looped images)
-    cmd = [
-        "ffmpeg", "-y",
-        "-hide_banner", "-loglevel", "error",
-        "-stream_loop", "-1", "-i", audio_path,
-    ]
-    for p in icon_paths_unique:
-        cmd += ["-loop", "1", "-i", str(p)]
+
+def build_drawtext_filtergraph(
+    events: List[StoryEvent],
+    icon_input_idx: Dict[str, int],
+    duration_sec: float,
+    resolution: Tuple[int, int],
+    fps: int,
+) -> Tuple[str, str]:
+    """
+    Builds the per-event drawbox/drawtext/overlay chain.
+    Returns (filter_complex, output_label).
+
+    Icon inputs must already be scaled to the layout's icon height (core.icons)
+    and are single still frames: each is decoded once, split into one copy per
+    event that shows it, and held by overlay (eof_action=repeat) for the rest
+    of the video.
+    """
+    lay = card_layout(resolution)
 
     # background
-    filter_parts = [f"color=c=#E6F5FF:s={w}x{h}:r={fps}:d={duration_sec}[bg];"]
+    filter_parts = [f"color=c=#E6F5FF:s={lay.w}x{lay.h}:r={fps}:d={duration_sec}[bg];"]
     current = "[bg]"
 
-    icon_input_idx = {str(p): i + 1 for i, p in enumerate(icon_paths_unique)}  # audio=0, icons start=1
-
+    shown = []
     for i, e in enumerate(events):
         start = max(0.0, float(e.t_start))
         end = min(float(duration_sec), float(e.t_end))
-        if end <= start:
-            continue
+        if end > start:
+            idx = icon_input_idx.get(str(resolve_icon(e.icon))) if e.icon else None
+            shown.append((i, e, start, end, idx))
+
+    uses: Dict[int, int] = {}
+    for _, _, _, _, idx in shown:
+        if idx is not None:
+            uses[idx] = uses.get(idx, 0) + 1
+    icon_labels: Dict[int, List[str]] = {}
+    for idx, n in uses.items():
+        if n == 1:
+            icon_labels[idx] = [f"[{idx}:v]"]
+        else:
+            icon_labels[idx] = [f"[ic{idx}_{k}]" for k in range(n)]
+            filter_parts.append(f"[{idx}:v]split={n}{''.join(icon_labels[idx])};")
+
+    for i, e, start, end, idx in shown:
 
         enable = f"between(t\\,{start:.3f}\\,{end:.3f})"
         next_label = f"[v{i}]"
@@ -96,42 +174,275 @@ def render_video_ffmpeg_drawtext(
         # Base card + texts
         chain = (
             f"{current}"
-            f"drawbox=x={card_x}:y={card_y}:w={card_w}:h={card_h}:color=black@0.30:t=fill:enable='{enable}',"
-            f"drawtext=fontfile='{FONT_LINUX}':fontsize={big_fs}:fontcolor=white:x=(w-text_w)/2:y={big_y}:text='{letter}':enable='{enable}',"
+            f"drawbox=x={lay.card_x}:y={lay.card_y}:w={lay.card_w}:h={lay.card_h}:color=black@0.30:t=fill:enable='{enable}',"
+            f"drawtext=fontfile='{FONT_LINUX}':fontsize={lay.big_fs}:fontcolor=white:x=(w-text_w)/2:y={lay.big_y}:text='{letter}':enable='{enable}',"
         )
 
         if word:
             chain += (
-                f"drawtext=fontfile='{FONT_LINUX}':fontsize={word_fs}:fontcolor=white:x=(w-text_w)/2:y={word_y}:text='{word}':enable='{enable}',"
+                f"drawtext=fontfile='{FONT_LINUX}':fontsize={lay.word_fs}:fontcolor=white:x=(w-text_w)/2:y={lay.word_y}:text='{word}':enable='{enable}',"
             )
 
         # Optional icon overlay
-        if e.icon:
-            p_icon = (ICONS_DIR / e.icon).resolve()
-            if p_icon.exists():
-                idx = icon_input_idx.get(str(p_icon))
-                if idx is not None:
-                    chain = chain.rstrip(",") + f"{next_label};"
-                    filter_parts.append(chain)
-
-                    ic_label = f"[ic{i}]"
-                    filter_parts.append(f"[{idx}:v]scale=-1:{icon_h}{ic_label};")
-
-                    out_label = f"[v{i}_o]"
-                    filter_parts.append(
-                        f"{next_label}{ic_label}"
-                        f"overlay=x=(w-overlay_w)/2:y=(h-overlay_h)/2:enable='{enable}'"
-                        f"{out_label};"
-                    )
-                    current = out_label
-                    continue
+        if idx is not None:
+            chain = chain.rstrip(",") + f"{next_label};"
+            filter_parts.append(chain)
+
+            ic_label = icon_labels[idx].pop()
+            out_label = f"[v{i}_o]"
+            # overlay's w/h are the icon's own size; centering on the frame needs main_w/main_h
+            filter_parts.append(
+                f"{next_label}{ic_label}"
+                f"overlay=x=(main_w-overlay_w)/2:y=(main_h-overlay_h)/2:eof_action=repeat:enable='{enable}'"
+                f"{out_label};"
+            )
+            current = out_label
+            continue
 
         # no icon case: just close
         chain = chain.rstrip(",") + f"{next_label};"
         filter_parts.append(chain)
         current = next_label
 
-    filter_complex = "".join(filter_parts).rstrip(";")
+    return "".join(filter_parts).rstrip(";"), current
+
+
+class RenderCancelled(RuntimeError):
+    pass
+
+
+class FfmpegError(RuntimeError):
+    """ffmpeg exited non-zero; the message carries the full stderr."""
+
+    def __init__(self, returncode: int, stderr: str):
+        super().__init__(f"FFMPEG FAILED\n\nReturn code: {returncode}\n\nSTDERR:\n{stderr}\n")
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+@dataclass
+class RenderProgress:
+    """One ffmpeg `-progress` report."""
+    frame: int = 0
+    fps: float = 0.0
+    speed: float = 0.0
+    out_time_sec: float = 0.0
+    total_sec: float = 0.0
+    elapsed_sec: float = 0.0
+    done: bool = False
+    queue_position: int = 0  # >0 while waiting for an ffmpeg slot
+
+    @property
+    def fraction(self) -> float:
+        if self.done:
+            return 1.0
+        if self.total_sec <= 0:
+            return 0.0
+        return max(0.0, min(1.0, self.out_time_sec / self.total_sec))
+
+    @property
+    def eta_sec(self) -> Optional[float]:
+        if self.done:
+            return 0.0
+        remaining = max(0.0, self.total_sec - self.out_time_sec)
+        if self.speed > 0:
+            return remaining / self.speed
+        if self.out_time_sec > 0 and self.elapsed_sec > 0:
+            return remaining * self.elapsed_sec / self.out_time_sec
+        return None
+
+
+ProgressCallback = Callable[[RenderProgress], None]
+
+
+def _parse_progress_value(key: str, value: str, prog: RenderProgress) -> None:
+    try:
+        if key == "frame":
+            prog.frame = int(value)
+        elif key == "fps":
+            prog.fps = float(value)
+        elif key == "speed":
+            prog.speed = float(value.rstrip("x"))
+        elif key == "out_time_us":
+            prog.out_time_sec = int(value) / 1_000_000.0
+        elif key == "progress":
+            prog.done = value == "end"
+    except ValueError:
+        pass  # "N/A" before the first frame
+
+
+def keyframe_args(events: Iterable[StoryEvent], duration_sec: float) -> List[str]:
+    """
+    `-force_key_frames` at every event start, so seeking to any card is a
+    keyframe seek (no decode from an earlier GOP). Empty for no events.
+    """
+    times = sorted({round(float(e.t_start), 3) for e in events if 0.0 < float(e.t_start) < float(duration_sec)})
+    if not times:
+        return []
+    return ["-force_key_frames", ",".join(f"{t:.3f}" for t in times)]
+
+
+def run_ffmpeg(
+    cmd: List[str],
+    duration_sec: Optional[float] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    output_path: Optional[str] = None,
+    feed_stdin: Optional[Callable[[BinaryIO], None]] = None,
+) -> None:
+    """
+    Runs ffmpeg with machine-readable `-progress` on stdout.
+    Calls progress_cb once per report. Setting cancel_event kills ffmpeg,
+    removes the partial output_path and raises RenderCancelled.
+
+    feed_stdin, if given, runs on its own thread with ffmpeg's stdin (for
+    `-i pipe:0` inputs); stdin is closed when it returns.
+
+    Waits for a slot from the process-wide scheduler first (reporting the
+    queue position through progress_cb) and runs within its thread budget.
+    """
+    def _queued(position: int) -> None:
+        if progress_cb is not None:
+            progress_cb(RenderProgress(total_sec=float(duration_sec or 0.0), queue_position=position))
+
+    with span("ffmpeg", output=Path(output_path).name if output_path else None) as s:
+        t_queued = time.perf_counter()
+        with get_scheduler().slot(cancel_event, _queued) as budget:
+            s["queue_wait_sec"] = round(time.perf_counter() - t_queued, 6)
+            s["threads"] = budget.threads
+            observe("ffmpeg_queue_wait_seconds", s["queue_wait_sec"])
+            try:
+                _run_ffmpeg_process(
+                    apply_thread_budget(cmd, budget), duration_sec, progress_cb, cancel_event, output_path, feed_stdin
+                )
+            except RenderCancelled:
+                s["exit_code"] = None
+                inc("ffmpeg_runs_total", status="cancelled", exit_code="")
+                raise
+            except FfmpegError as e:
+                s["exit_code"] = e.returncode
+                inc("ffmpeg_runs_total", status="failed", exit_code=e.returncode)
+                raise
+            s["exit_code"] = 0
+            inc("ffmpeg_runs_total", status="ok", exit_code=0)
+            if output_path and Path(output_path).is_file():
+                s["output_bytes"] = Path(output_path).stat().st_size
+
+
+def _run_ffmpeg_process(
+    cmd: List[str],
+    duration_sec: Optional[float],
+    progress_cb: Optional[ProgressCallback],
+    cancel_event: Optional[threading.Event],
+    output_path: Optional[str],
+    feed_stdin: Optional[Callable[[BinaryIO], None]],
+) -> None:
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8", errors="replace") as err:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if feed_stdin is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=err,
+        )
+        finished = threading.Event()
+        feed_error: List[BaseException] = []
+
+        def _feed() -> None:
+            try:
+                feed_stdin(proc.stdin)
+            except (BrokenPipeError, ValueError):
+                pass  # ffmpeg exited (failed or cancelled); its return code says which
+            except BaseException as e:
+                feed_error.append(e)
+                proc.kill()
+            finally:
+                try:
+                    proc.stdin.close()
+                except (BrokenPipeError, OSError):
+                    pass
+
+        def _watch_cancel() -> None:
+            while not finished.is_set():
+                if cancel_event.wait(0.2):
+                    proc.kill()
+                    return
+
+        if cancel_event is not None:
+            threading.Thread(target=_watch_cancel, daemon=True).start()
+        feeder = None
+        if feed_stdin is not None:
+            feeder = threading.Thread(target=_feed, daemon=True)
+            feeder.start()
+
+        started = time.monotonic()
+        prog = RenderProgress(total_sec=float(duration_sec or 0.0))
+        try:
+            for raw in proc.stdout:
+                key, _, value = raw.decode("utf-8", "replace").strip().partition("=")
+                _parse_progress_value(key, value.strip(), prog)
+                if key == "progress" and progress_cb is not None:
+                    prog.elapsed_sec = time.monotonic() - started
+                    progress_cb(RenderProgress(**vars(prog)))
+            returncode = proc.wait()
+        finally:
+            finished.set()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            if feeder is not None:
+                feeder.join()
+
+        if cancel_event is not None and cancel_event.is_set():
+            if output_path:
+                Path(output_path).unlink(missing_ok=True)
+            raise RenderCancelled("Render cancelled")
+
+        if feed_error:
+            if output_path:
+                Path(output_path).unlink(missing_ok=True)
+            raise feed_error[0]
+
+        if returncode != 0:
+            err.seek(0)
+            raise FfmpegError(returncode, err.read())
+
+
+def render_video_ffmpeg_drawtext(
+    audio_path: str,
+    events: List[StoryEvent],
+    output_path: str,
+    duration_sec: int = 60,
+    resolution: Tuple[int, int] = (854, 480),
+    fps: int = 24,
+    profile: Optional[EncodeProfile] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    audio_hash: Optional[str] = None,
+) -> str:
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    profile = profile or get_profile()
+    audio_track = prepare_audio_track(audio_path, duration_sec, profile, audio_hash=audio_hash, cancel_event=cancel_event)
+
+    icon_paths_unique = collect_icon_paths(events)
+    prepared = prepare_icons(icon_paths_unique, card_layout(resolution).icon_h)
+
+    # ffmpeg inputs (audio + each icon once, as a single pre-scaled frame)
+    cmd = [
+        "ffmpeg", "-y",
+        "-hide_banner", "-loglevel", "error",
+        "-i", str(audio_track),
+    ]
+    for p in icon_paths_unique:
+        cmd += ["-i", str(prepared[str(p)])]
+
+    icon_input_idx = {str(p): i + 1 for i, p in enumerate(icon_paths_unique)}  # audio=0, icons start=1
+
+    filter_complex, current = build_drawtext_filtergraph(events, icon_input_idx, duration_sec, resolution, fps)
+    observe("filtergraph_bytes", len(filter_complex), engine="drawtext")
+    annotate(filtergraph_bytes=len(filter_complex))
 
     cmd += [
         "-filter_complex", filter_complex,
@@ -139,15 +450,13 @@ def render_video_ffmpeg_drawtext(
         "-map", "0:a",
         "-t", str(duration_sec),
         "-r", str(fps),
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-c:a", "aac",
+        *profile.video_args(),
+        *keyframe_args(events, duration_sec),
+        *COPY_AUDIO_ARGS,
         "-shortest",
         str(out),
     ]
 
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if p.returncode != 0:
-        raise RuntimeError(f"FFMPEG FAILED\n\nReturn code: {p.returncode}\n\nSTDERR:\n{p.stderr}\n")
+    run_ffmpeg(cmd, duration_sec, progress_cb, cancel_event, str(out))
 
     return str(out)
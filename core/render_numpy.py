@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.assets import render_event_card
+from core.audio_track import COPY_AUDIO_ARGS, prepare_audio_track
+from core.icons import prepare_icon
+from core.profiles import EncodeProfile, get_profile
+from core.render import (
+    ProgressCallback,
+    RenderCancelled,
+    card_layout,
+    keyframe_args,
+    resolve_icon,
+    run_ffmpeg,
+)
+from core.render_stills import CardKey, plan_still_spans
+from core.storyboard import StoryEvent
+
+EMPTY_CARD: CardKey = (None, "", "")
+
+TRANSITIONS = ("cut", "fade", "zoom", "bounce")
+
+# zoom / bounce start with the card at this fraction of its size
+ZOOM_FROM = 0.6
+
+
+def _ease_out_cubic(t: np.ndarray) -> np.ndarray:
+    return 1.0 - (1.0 - t) ** 3
+
+
+def _ease_in_out(t: np.ndarray) -> np.ndarray:
+    return t * t * (3.0 - 2.0 * t)
+
+
+def _ease_out_back(t: np.ndarray, overshoot: float = 1.70158) -> np.ndarray:
+    u = t - 1.0
+    return 1.0 + (overshoot + 1.0) * u ** 3 + overshoot * u ** 2
+
+
+EASINGS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "linear": lambda t: t,
+    "ease_in_out": _ease_in_out,
+    "ease_out_cubic": _ease_out_cubic,
+    "ease_out_back": _ease_out_back,
+}
+
+
+@lru_cache(maxsize=None)
+def easing_table(name: str, n: int) -> np.ndarray:
+    """
+    Eased progress for the n frames of a transition, strictly inside (0, 1)
+    at both ends so the first frame already moves and the last is not yet static.
+    """
+    t = np.arange(1, n + 1, dtype=np.float64) / (n + 1)
+    table = EASINGS[name](t).astype(np.float32)
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def _zoom_index(h: int, w: int, scale: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nearest-neighbour source rows/cols that scale a frame by `scale` about its
+    center. Out-of-frame sources clamp to the border, which is plain background.
+    """
+    cy, cx = (h - 1) / 2.0, (w - 1) / 2.0
+    rows = np.clip(np.rint(cy + (np.arange(h) - cy) / scale), 0, h - 1).astype(np.intp)
+    cols = np.clip(np.rint(cx + (np.arange(w) - cx) / scale), 0, w - 1).astype(np.intp)
+    return rows, cols
+
+
+def card_frames(
+    keys: List[CardKey],
+    resolution: Tuple[int, int],
+) -> Dict[CardKey, np.ndarray]:
+    """
+    Each distinct card drawn once with Pillow, as an (h, w, 3) uint8 array.
+    """
+    icon_h = card_layout(resolution).icon_h
+    out: Dict[CardKey, np.ndarray] = {}
+    for key in [EMPTY_CARD, *keys]:
+        if key in out:
+            continue
+        letter, word, icon = key
+        src = resolve_icon(icon) if icon else None
+        icon_path = prepare_icon(src, icon_h) if src is not None and src.exists() else None
+        frame = np.asarray(render_event_card(letter, word, icon_path, resolution), dtype=np.uint8)
+        frame.setflags(write=False)
+        out[key] = frame
+    return out
+
+
+class _Compositor:
+    """
+    Builds transition frames into one reused buffer: alpha blending in uint16
+    integer math (weights out of 256) with no per-frame allocations.
+    """
+
+    def __init__(self, h: int, w: int):
+        self.out = np.empty((h, w, 3), dtype=np.uint8)
+        self._acc = np.empty((h, w, 3), dtype=np.uint16)
+        self._tmp = np.empty((h, w, 3), dtype=np.uint16)
+        # zoom gathers: rows first, then columns of the row-gathered frame
+        self._rows = np.empty((h, w, 3), dtype=np.uint8)
+        self._zoom = np.empty((h, w, 3), dtype=np.uint8)
+
+    def blend(self, a: np.ndarray, b: np.ndarray, alpha: float) -> np.ndarray:
+        """out = a * (1 - alpha) + b * alpha"""
+        wb = int(round(float(alpha) * 256))
+        np.multiply(a, 256 - wb, out=self._acc, dtype=np.uint16)
+        np.multiply(b, wb, out=self._tmp, dtype=np.uint16)
+        self._acc += self._tmp
+        self._acc += 128
+        self._acc >>= 8
+        np.copyto(self.out, self._acc, casting="unsafe")
+        return self.out
+
+    def zoom_blend(self, a: np.ndarray, b: np.ndarray, scale: float, alpha: float) -> np.ndarray:
+        """b scaled about the frame center, blended over a."""
+        h, w = b.shape[:2]
+        rows, cols = _zoom_index(h, w, round(float(scale), 3))
+        # mode="clip": the indices are already in range, and "raise" would buffer `out`
+        np.take(b, rows, axis=0, out=self._rows, mode="clip")
+        np.take(self._rows, cols, axis=1, out=self._zoom, mode="clip")
+        return self.blend(a, self._zoom, alpha)
+
+
+def plan_frames(
+    spans: List[Tuple[int, int, CardKey]],
+    transition: str,
+    transition_frames: int,
+) -> List[Tuple[int, int, Optional[CardKey], CardKey]]:
+    """
+    Splits each span into an animated head and a static tail.
+    Returns [(start_frame, end_frame, from_key, to_key)]; from_key=None marks
+    a static run that repeats the finished to_key frame.
+    """
+    plan: List[Tuple[int, int, Optional[CardKey], CardKey]] = []
+    prev = EMPTY_CARD
+    for f0, f1, key in spans:
+        n = 0
+        if transition != "cut" and key != EMPTY_CARD and key != prev:
+            n = min(transition_frames, f1 - f0)
+        if n:
+            plan.append((f0, f0 + n, prev, key))
+        if f0 + n < f1:
+            plan.append((f0 + n, f1, None, key))
+        prev = key
+    return plan
+
+
+def _frame_writer(
+    plan: List[Tuple[int, int, Optional[CardKey], CardKey]],
+    cards: Dict[CardKey, np.ndarray],
+    resolution: Tuple[int, int],
+    transition: str,
+    cancel_event: Optional[threading.Event],
+) -> Callable[[BinaryIO], None]:
+    w, h = resolution
+    comp = _Compositor(h, w)
+
+    def feed(stdin: BinaryIO) -> None:
+        for f0, f1, src, dst in plan:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RenderCancelled("Render cancelled")
+            if src is None:
+                # static span: the same finished frame, nothing recomputed
+                frame = memoryview(cards[dst]).cast("B")
+                for _ in range(f1 - f0):
+                    stdin.write(frame)
+                continue
+
+            n = f1 - f0
+            a, b = cards[src], cards[dst]
+            if transition == "fade":
+                for alpha in easing_table("ease_in_out", n):
+                    stdin.write(memoryview(comp.blend(a, b, alpha)).cast("B"))
+            else:
+                curve = "ease_out_back" if transition == "bounce" else "ease_out_cubic"
+                scales = ZOOM_FROM + (1.0 - ZOOM_FROM) * easing_table(curve, n)
+                for scale, alpha in zip(scales, easing_table("ease_out_cubic", n)):
+                    stdin.write(memoryview(comp.zoom_blend(a, b, scale, alpha)).cast("B"))
+
+    return feed
+
+
+def render_video_numpy(
+    audio_path: str,
+    events: List[StoryEvent],
+    output_path: str,
+    duration_sec: int = 60,
+    resolution: Tuple[int, int] = (854, 480),
+    fps: int = 24,
+    transition: str = "fade",
+    transition_sec: float = 0.25,
+    profile: Optional[EncodeProfile] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    audio_hash: Optional[str] = None,
+) -> str:
+    """
+    Composites frames in NumPy from cards pre-rendered with Pillow and pipes
+    them as rawvideo into a single ffmpeg encode: no filtergraph expressions.
+
+    transition: "cut", "fade" (crossfade), "zoom" (scale + fade in) or
+    "bounce" (zoom with overshoot). Only the first transition_sec of each
+    card is computed frame by frame; the rest of the span resends the
+    finished card buffer.
+    """
+    if transition not in TRANSITIONS:
+        raise ValueError(f"Unknown transition {transition!r}. Available: {', '.join(TRANSITIONS)}")
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    profile = profile or get_profile()
+    audio_track = prepare_audio_track(audio_path, duration_sec, profile, audio_hash=audio_hash, cancel_event=cancel_event)
+    w, h = resolution
+
+    spans = plan_still_spans(events, duration_sec, fps)
+    cards = card_frames([s[2] for s in spans], resolution)
+    plan = plan_frames(spans, transition, max(0, int(round(transition_sec * fps))))
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-hide_banner", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-r", str(fps), "-i", "pipe:0",
+        "-i", str(audio_track),
+        "-map", "0:v",
+        "-map", "1:a",
+        "-t", str(duration_sec),
+        *profile.video_args(),
+        *keyframe_args(events, duration_sec),
+        *COPY_AUDIO_ARGS,
+        "-shortest",
+        str(out),
+    ]
+    run_ffmpeg(
+        cmd, duration_sec, progress_cb, cancel_event, str(out),
+        feed_stdin=_frame_writer(plan, cards, resolution, transition, cancel_event),
+    )
+    return str(out)
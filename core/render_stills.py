@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.assets import render_event_card
+from core.audio_track import COPY_AUDIO_ARGS, prepare_audio_track
+from core.icons import prepare_icon
+from core.profiles import EncodeProfile, get_profile
+from core.render import ProgressCallback, card_layout, keyframe_args, resolve_icon, run_ffmpeg
+from core.storyboard import StoryEvent
+
+# (letter, word, icon); letter=None is the empty background frame
+CardKey = Tuple[Optional[str], str, str]
+
+
+def plan_still_spans(
+    events: List[StoryEvent],
+    duration_sec: float,
+    fps: int,
+) -> List[Tuple[int, int, CardKey]]:
+    """
+    Partitions [0, duration] into frame-aligned spans of constant picture.
+    Returns [(start_frame, end_frame, card_key)], adjacent identical cards merged.
+    """
+    total = int(round(float(duration_sec) * fps))
+    if total <= 0:
+        return []
+
+    marks = []
+    for e in sorted(events, key=lambda e: float(e.t_start)):
+        f0 = max(0, int(round(float(e.t_start) * fps)))
+        f1 = min(total, int(round(float(e.t_end) * fps)))
+        if f1 > f0:
+            marks.append((f0, f1, (e.letter, e.word or "", e.icon or "")))
+
+    empty: CardKey = (None, "", "")
+    spans: List[Tuple[int, int, CardKey]] = []
+    cursor = 0
+    for f0, f1, key in marks:
+        f0 = max(f0, cursor)  # overlapping events start once the previous one ends
+        if f1 <= f0:
+            continue
+        if f0 > cursor:
+            spans.append((cursor, f0, empty))
+        spans.append((f0, f1, key))
+        cursor = f1
+    if cursor < total:
+        spans.append((cursor, total, empty))
+
+    merged: List[Tuple[int, int, CardKey]] = []
+    for s in spans:
+        if merged and merged[-1][2] == s[2] and merged[-1][1] == s[0]:
+            merged[-1] = (merged[-1][0], s[1], s[2])
+        else:
+            merged.append(s)
+    return merged
+
+
+def rasterize_cards(
+    keys: List[CardKey],
+    resolution: Tuple[int, int],
+    out_dir: Path,
+) -> Dict[CardKey, Path]:
+    """
+    Draws each distinct card once with Pillow.
+    """
+    out: Dict[CardKey, Path] = {}
+    icon_h = card_layout(resolution).icon_h
+    for key in keys:
+        if key in out:
+            continue
+        letter, word, icon = key
+        src = resolve_icon(icon) if icon else None
+        # already at icon height, so render_event_card's resize is a no-op
+        icon_path = prepare_icon(src, icon_h) if src is not None and src.exists() else None
+        path = out_dir / f"card_{len(out):05d}.png"
+        render_event_card(letter, word, icon_path, resolution).save(path, "PNG")
+        out[key] = path
+    return out
+
+
+def _concat_line(path: Path) -> str:
+    return "file '" + str(path).replace("'", "'\\''") + "'\n"
+
+
+def build_concat_script(spans: List[Tuple[int, int, CardKey]], cards: Dict[CardKey, Path], fps: int) -> str:
+    """
+    Concat demuxer script, one entry per span. The last span ends with a
+    one-frame entry so that, with one frame per entry (VFR), a frame still
+    starts at the final frame time and the stream lasts the whole duration.
+    """
+    if spans and spans[-1][1] - spans[-1][0] > 1:
+        f0, f1, key = spans[-1]
+        spans = spans[:-1] + [(f0, f1 - 1, key), (f1 - 1, f1, key)]
+    lines = []
+    for f0, f1, key in spans:
+        lines.append(_concat_line(cards[key]))
+        lines.append(f"duration {(f1 - f0) / fps:.6f}\n")
+    if spans:
+        # concat demuxer ignores the last duration unless the file is repeated
+        # (the repeat starts at duration_sec and is cut by -t)
+        lines.append(_concat_line(cards[spans[-1][2]]))
+    return "".join(lines)
+
+
+def render_video_ffmpeg_stills(
+    audio_path: str,
+    events: List[StoryEvent],
+    output_path: str,
+    duration_sec: int = 60,
+    resolution: Tuple[int, int] = (854, 480),
+    fps: int = 24,
+    vfr: bool = True,
+    profile: Optional[EncodeProfile] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    audio_hash: Optional[str] = None,
+) -> str:
+    """
+    Renders each distinct card once as a still and encodes the timeline as a
+    slideshow: no per-frame compositing. vfr=True emits one frame per span;
+    vfr=False keeps constant fps and relies on -tune stillimage skip blocks.
+    """
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    profile = profile or get_profile()
+    audio_track = prepare_audio_track(audio_path, duration_sec, profile, audio_hash=audio_hash, cancel_event=cancel_event)
+
+    spans = plan_still_spans(events, duration_sec, fps)
+
+    work_dir = Path(tempfile.mkdtemp(prefix=".stills_", dir=out.parent))
+    try:
+        cards = rasterize_cards([s[2] for s in spans], resolution, work_dir)
+        list_path = work_dir / "stills.txt"
+        list_path.write_text(build_concat_script(spans, cards, fps), encoding="utf-8")
+
+        cmd = [
+            "ffmpeg", "-y",
+            "-hide_banner", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", str(list_path),
+            "-i", str(audio_track),
+            "-map", "0:v",
+            "-map", "1:a",
+            "-t", str(duration_sec),
+        ]
+        cmd += ["-fps_mode", "vfr"] if vfr else ["-r", str(fps)]
+        cmd += [
+            *profile.video_args(),
+            *keyframe_args(events, duration_sec),
+            "-tune", "stillimage",
+            *COPY_AUDIO_ARGS,
+            "-shortest",
+            str(out),
+        ]
+
+        run_ffmpeg(cmd, duration_sec, progress_cb, cancel_event, str(out))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return str(out)
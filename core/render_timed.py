@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import heapq
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.audio_track import COPY_AUDIO_ARGS, prepare_audio_track
+from core.render import (
+    FONT_LINUX,
+    ProgressCallback,
+    _escape_text,
+    card_layout,
+    collect_icon_paths,
+    keyframe_args,
+    resolve_icon,
+    run_ffmpeg,
+)
+from core.icons import prepare_icons
+from core.metrics import annotate, observe
+from core.profiles import EncodeProfile, get_profile
+from core.storyboard import StoryEvent
+
+# Named filter instances targeted by sendcmd.
+CARD = "drawbox@card"
+LETTER = "drawtext@letter"
+WORD = "drawtext@word"
+ICON_SELECT = "streamselect@icons"
+ICON_OVERLAY = "overlay@icon"
+
+
+@dataclass(frozen=True)
+class _ScreenState:
+    letter: Optional[str] = None
+    word: Optional[str] = None
+    icon_idx: Optional[int] = None
+
+    @property
+    def visible(self) -> bool:
+        return self.letter is not None
+
+
+def _quote_cmd_arg(arg: str) -> str:
+    # sendcmd tokenizes on spaces/,/; -> single-quote the whole argument
+    return "'" + arg.replace("'", "'\\''") + "'"
+
+
+def _reinit_text(target: str, text: str) -> str:
+    # drawtext refuses an empty text on reinit
+    return f"{target} reinit {_quote_cmd_arg('text=' + _escape_text(text or ' '))}"
+
+
+def _state_for(e: Optional[StoryEvent], icon_slot: Dict[str, int]) -> _ScreenState:
+    if e is None:
+        return _ScreenState()
+    icon_idx = icon_slot.get(str(resolve_icon(e.icon))) if e.icon else None
+    return _ScreenState(letter=e.letter, word=e.word or None, icon_idx=icon_idx)
+
+
+def build_sendcmd_script(
+    events: List[StoryEvent],
+    duration_sec: float,
+    icon_slot: Dict[str, int],
+) -> str:
+    """
+    One sendcmd interval per screen change. Only filters whose state actually
+    changes get a command, so back-to-back events don't blink the card.
+    """
+    clipped = []
+    for e in events:
+        start = max(0.0, float(e.t_start))
+        end = min(float(duration_sec), float(e.t_end))
+        if end > start:
+            clipped.append(StoryEvent(t_start=start, t_end=end, letter=e.letter, word=e.word, icon=e.icon))
+
+    points = sorted({e.t_start for e in clipped} | {e.t_end for e in clipped})
+    order = sorted(range(len(clipped)), key=lambda i: (clipped[i].t_start, i))
+
+    # sweep: the last-starting active event is on top, as in the drawtext engine
+    active: List[Tuple[float, int]] = []
+    k = 0
+
+    lines: List[str] = []
+    prev = _ScreenState()
+    for t in points:
+        while k < len(order) and clipped[order[k]].t_start <= t:
+            i = order[k]
+            heapq.heappush(active, (-clipped[i].t_start, -i))
+            k += 1
+        while active and clipped[-active[0][1]].t_end <= t:
+            heapq.heappop(active)
+
+        cur = _state_for(clipped[-active[0][1]] if active else None, icon_slot)
+        cmds: List[str] = []
+
+        if cur.visible != prev.visible:
+            cmds.append(f"{CARD} enable {int(cur.visible)}")
+            cmds.append(f"{LETTER} enable {int(cur.visible)}")
+        if cur.visible and cur.letter != prev.letter:
+            cmds.append(_reinit_text(LETTER, cur.letter))
+
+        if cur.word != prev.word:
+            if cur.word is not None:
+                cmds.append(_reinit_text(WORD, cur.word))
+            if (cur.word is None) != (prev.word is None):
+                cmds.append(f"{WORD} enable {int(cur.word is not None)}")
+
+        if cur.icon_idx != prev.icon_idx:
+            if cur.icon_idx is not None:
+                cmds.append(f"{ICON_SELECT} map {cur.icon_idx}")
+            if (cur.icon_idx is None) != (prev.icon_idx is None):
+                cmds.append(f"{ICON_OVERLAY} enable {int(cur.icon_idx is not None)}")
+
+        if cmds:
+            lines.append(f"{t:.3f} " + ", ".join(cmds) + ";")
+        prev = cur
+
+    return "\n".join(lines) + "\n"
+
+
+def build_timed_filtergraph(
+    cmd_file: Path,
+    n_icons: int,
+    first_icon_input: int,
+    duration_sec: float,
+    resolution: Tuple[int, int],
+    fps: int,
+) -> Tuple[str, str]:
+    """
+    Fixed-size graph: one box, two drawtexts and (if any icons) one overlay fed
+    by a streamselect over the distinct icons. Size does not depend on event count.
+    Icon inputs are expected pre-fitted to card_w x icon_h (core.icons.prepare_icon).
+    Returns (filter_complex, output_label).
+    """
+    lay = card_layout(resolution)
+    parts = [
+        f"color=c=#E6F5FF:s={lay.w}x{lay.h}:r={fps}:d={duration_sec},"
+        f"sendcmd=f={_escape_text(str(cmd_file))},"
+        f"{CARD}=x={lay.card_x}:y={lay.card_y}:w={lay.card_w}:h={lay.card_h}:color=black@0.30:t=fill:enable=0,"
+        f"{LETTER}=fontfile='{FONT_LINUX}':fontsize={lay.big_fs}:fontcolor=white:x=(w-text_w)/2:y={lay.big_y}:text=' ':enable=0,"
+        f"{WORD}=fontfile='{FONT_LINUX}':fontsize={lay.word_fs}:fontcolor=white:x=(w-text_w)/2:y={lay.word_y}:text=' ':enable=0"
+        "[base];"
+    ]
+
+    if n_icons == 0:
+        return "".join(parts).rstrip(";"), "[base]"
+
+    # inputs are single frames already padded into the same box (core.icons), so
+    # streamselect can switch between them; loop repeats the decoded frame in memory
+    labels = ""
+    for i in range(n_icons):
+        parts.append(f"[{first_icon_input + i}:v]loop=loop=-1:size=1,setpts=N/{fps}/TB[ic{i}];")
+        labels += f"[ic{i}]"
+
+    parts.append(f"{labels}{ICON_SELECT}=inputs={n_icons}:map=0[icon];")
+    parts.append(f"[base][icon]{ICON_OVERLAY}=x=(W-w)/2:y=(H-h)/2:enable=0[vout]")
+    return "".join(parts), "[vout]"
+
+
+def render_video_ffmpeg_timed(
+    audio_path: str,
+    events: List[StoryEvent],
+    output_path: str,
+    duration_sec: int = 60,
+    resolution: Tuple[int, int] = (854, 480),
+    fps: int = 24,
+    profile: Optional[EncodeProfile] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    audio_hash: Optional[str] = None,
+) -> str:
+    """
+    Drop-in alternative to render_video_ffmpeg_drawtext whose per-frame cost is
+    flat in the number of events: text and icon changes are sendcmd commands.
+    """
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    profile = profile or get_profile()
+    audio_track = prepare_audio_track(audio_path, duration_sec, profile, audio_hash=audio_hash, cancel_event=cancel_event)
+
+    icon_paths_unique = collect_icon_paths(events)
+    icon_slot = {str(p): i for i, p in enumerate(icon_paths_unique)}
+
+    work_dir = Path(tempfile.mkdtemp(prefix=".timed_", dir=out.parent))
+    try:
+        cmd_file = work_dir / "commands.txt"
+        script = build_sendcmd_script(events, duration_sec, icon_slot)
+        cmd_file.write_text(script, encoding="utf-8")
+        observe("filtergraph_bytes", len(script), engine="timed")
+        annotate(filtergraph_bytes=len(script))
+
+        cmd = [
+            "ffmpeg", "-y",
+            "-hide_banner", "-loglevel", "error",
+            "-i", str(audio_track),
+        ]
+        lay = card_layout(resolution)
+        prepared = prepare_icons(icon_paths_unique, lay.icon_h, box_width=lay.card_w)
+        for p in icon_paths_unique:
+            cmd += ["-i", str(prepared[str(p)])]
+
+        filter_complex, current = build_timed_filtergraph(
+            cmd_file, len(icon_paths_unique), 1, duration_sec, resolution, fps
+        )
+
+        cmd += [
+            "-filter_complex", filter_complex,
+            "-map", current,
+            "-map", "0:a",
+            "-t", str(duration_sec),
+            "-r", str(fps),
+            *profile.video_args(),
+            *keyframe_args(events, duration_sec),
+            *COPY_AUDIO_ARGS,
+            "-shortest",
+            str(out),
+        ]
+
+        run_ffmpeg(cmd, duration_sec, progress_cb, cancel_event, str(out))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return str(out)
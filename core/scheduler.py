@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Deque, Iterator, List, Optional, Tuple
+
+from core.metrics import set_gauge
+
+# Overrides for the automatic sizing below (0 = automatic).
+FFMPEG_SLOTS = int(os.environ.get("RENDER_FFMPEG_SLOTS", "0"))
+FFMPEG_CORES = int(os.environ.get("RENDER_FFMPEG_CORES", "0"))
+
+# libx264 scales well up to about this many threads per encode; beyond it
+# another concurrent encode gets more out of the cores than a wider one.
+THREADS_PER_SLOT = 4
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects affinity / container cpusets)."""
+    if FFMPEG_CORES > 0:
+        return FFMPEG_CORES
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:  # not on Linux
+        return max(1, os.cpu_count() or 1)
+
+
+@dataclass(frozen=True)
+class ThreadBudget:
+    threads: int
+    filter_threads: int
+
+
+# Per-process budget of the job admitted by fan_out() in this context: its ffmpeg
+# runs (on any thread started through metrics.bind_context) use it without queueing again.
+_granted: ContextVar[Optional[ThreadBudget]] = ContextVar("ffmpeg_granted", default=None)
+
+
+class FfmpegScheduler:
+    """
+    Process-wide admission control for ffmpeg: at most `slots` processes run at
+    once, each with an explicit share of the cores, and callers beyond that
+    wait in strict FIFO order (a later caller never overtakes an earlier one).
+    A job that runs several processes at once (fan_out) is one queue entry.
+    """
+
+    def __init__(self, slots: Optional[int] = None, cores: Optional[int] = None):
+        self.cores = cores or available_cores()
+        self.slots = max(1, slots or FFMPEG_SLOTS or -(-self.cores // THREADS_PER_SLOT))
+        threads = max(1, self.cores // self.slots)
+        # the filtergraph runs alongside the encoder, so it gets the smaller share
+        self.budget = ThreadBudget(threads=threads, filter_threads=max(1, threads // 2))
+        self._cond = threading.Condition()
+        self._queue: Deque[int] = deque()
+        self._tickets = itertools.count()
+        self._running = 0
+
+    @contextmanager
+    def slot(
+        self,
+        cancel_event: Optional[threading.Event] = None,
+        on_wait: Optional[Callable[[int], None]] = None,
+    ) -> Iterator[ThreadBudget]:
+        """
+        Holds one ffmpeg slot for the duration of the block and yields its
+        thread budget. While queued, on_wait(position) is called whenever the
+        1-based queue position changes; setting cancel_event leaves the queue
+        and raises RenderCancelled. Inside fan_out() the job's slots are
+        already held, so this yields the per-process budget right away.
+        """
+        granted = _granted.get()
+        if granted is not None:
+            yield granted
+            return
+        with self._admit(1, cancel_event, on_wait):
+            yield self.budget
+
+    @contextmanager
+    def fan_out(
+        self,
+        processes: int,
+        cancel_event: Optional[threading.Event] = None,
+        on_wait: Optional[Callable[[int], None]] = None,
+    ) -> Iterator[Tuple[int, ThreadBudget]]:
+        """
+        Admits a job that wants up to `processes` concurrent ffmpeg runs (e.g.
+        timeline segments) as one queue entry. Once at the head it takes the
+        free slots it can use, at least one, and splits their threads evenly:
+        yields (how many processes to run at once, budget of each).
+        """
+        granted = _granted.get()
+        if granted is not None:
+            yield 1, granted
+            return
+        want = max(1, -(-int(processes) // self.budget.threads))
+        with self._admit(want, cancel_event, on_wait) as taken:
+            total = taken * self.budget.threads
+            n = max(1, min(int(processes), total))
+            threads = max(1, total // n)
+            budget = ThreadBudget(threads=threads, filter_threads=max(1, threads // 2))
+            token = _granted.set(budget)
+            try:
+                yield n, budget
+            finally:
+                _granted.reset(token)
+
+    @contextmanager
+    def _admit(
+        self,
+        want: int,
+        cancel_event: Optional[threading.Event],
+        on_wait: Optional[Callable[[int], None]],
+    ) -> Iterator[int]:
+        """Queues one ticket; at the head, takes up to `want` free slots and yields how many."""
+        from core.render import RenderCancelled  # core.render imports this module
+
+        ticket = next(self._tickets)
+        with self._cond:
+            self._queue.append(ticket)
+            self._publish_locked()
+            last_pos = None
+            while not (self._queue[0] == ticket and self._running < self.slots):
+                pos = self._queue.index(ticket) + 1
+                if on_wait is not None and pos != last_pos:
+                    on_wait(pos)
+                    last_pos = pos
+                if cancel_event is not None and cancel_event.is_set():
+                    self._queue.remove(ticket)
+                    self._publish_locked()
+                    self._cond.notify_all()
+                    raise RenderCancelled("Render cancelled")
+                self._cond.wait(0.2)
+            self._queue.popleft()
+            taken = min(want, self.slots - self._running)
+            self._running += taken
+            self._publish_locked()
+            self._cond.notify_all()  # the next ticket may fit in a free slot too
+        try:
+            yield taken
+        finally:
+            with self._cond:
+                self._running -= taken
+                self._publish_locked()
+                self._cond.notify_all()
+
+    def _publish_locked(self) -> None:
+        set_gauge("ffmpeg_running", self._running)
+        set_gauge("ffmpeg_queued", len(self._queue))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "cores": self.cores,
+                "running": self._running,
+                "queued": len(self._queue),
+                "threads": self.budget.threads,
+                "filter_threads": self.budget.filter_threads,
+            }
+
+
+def apply_thread_budget(cmd: List[str], budget: ThreadBudget) -> List[str]:
+    """
+    ffmpeg argv with output `-threads` capped at the budget (added if absent or
+    0 = auto) and `-filter_complex_threads` set when there is a filter_complex.
+    """
+    cmd = list(cmd)
+    last_input = max((i for i, a in enumerate(cmd) if a == "-i"), default=0)
+    capped = False
+    for i in range(last_input + 1, len(cmd) - 1):
+        if cmd[i] == "-threads":
+            n = int(cmd[i + 1])
+            cmd[i + 1] = str(budget.threads if n <= 0 else min(n, budget.threads))
+            capped = True
+    if not capped:
+        cmd[-1:-1] = ["-threads", str(budget.threads)]
+    if "-filter_complex" in cmd and "-filter_complex_threads" not in cmd:
+        cmd[1:1] = ["-filter_complex_threads", str(budget.filter_threads)]
+    return cmd
+
+
+_scheduler: Optional[FfmpegScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> FfmpegScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FfmpegScheduler()
+        return _scheduler
+
+
+def configure_scheduler(slots: Optional[int] = None, cores: Optional[int] = None) -> FfmpegScheduler:
+    """
+    Replaces the process-wide scheduler, e.g. in a batch worker process that
+    owns only a share of the machine.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = FfmpegScheduler(slots, cores)
+        return _scheduler
@@ -0,0 +1,452 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from core.audio_track import COPY_AUDIO_ARGS, prepare_audio_track
+from core.cache import CACHE_DIR, RENDER_CACHE_VERSION, RenderCache, hash_bytes
+from core.icons import icon_file_hash, prepare_icons
+from core.metrics import bind_context
+from core.render import (
+    ProgressCallback,
+    RenderProgress,
+    build_drawtext_filtergraph,
+    card_layout,
+    collect_icon_paths,
+    keyframe_args,
+    resolve_icon,
+    run_ffmpeg,
+)
+from core.profiles import EncodeProfile, get_profile
+from core.scheduler import get_scheduler
+from core.storyboard import StoryEvent, Storyboard
+
+SEGMENT_CACHE_DIR = CACHE_DIR / "segments"
+
+
+@dataclass(frozen=True)
+class Segment:
+    """A frame-aligned slice of the timeline with events shifted to start at t=0."""
+    index: int
+    start_frame: int
+    end_frame: int
+    events: List[StoryEvent]
+
+    @property
+    def n_frames(self) -> int:
+        return self.end_frame - self.start_frame
+
+
+def _frame(t: float, fps: int) -> int:
+    return int(round(float(t) * fps))
+
+
+def _cut_frames_at_events(events: List[StoryEvent], total_frames: int, fps: int, n_segments: int) -> List[int]:
+    """
+    Picks up to n_segments-1 cut points from event starts, each as close as
+    possible to an even split of the timeline.
+    """
+    candidates = sorted({_frame(e.t_start, fps) for e in events if 0 < _frame(e.t_start, fps) < total_frames})
+    if not candidates or n_segments <= 1:
+        return []
+
+    cuts: List[int] = []
+    for k in range(1, n_segments):
+        ideal = total_frames * k / n_segments
+        best = min(candidates, key=lambda f: abs(f - ideal))
+        if (not cuts or best > cuts[-1]) and best not in cuts:
+            cuts.append(best)
+    return cuts
+
+
+def plan_segments(
+    events: List[StoryEvent],
+    duration_sec: float,
+    fps: int,
+    n_segments: int = 4,
+    chunk_sec: Optional[float] = None,
+) -> List[Segment]:
+    """
+    Cuts the storyboard into frame-aligned segments.
+
+    chunk_sec=None -> cut at event boundaries into ~n_segments pieces.
+    chunk_sec=X    -> fixed-length chunks of X seconds (rounded to whole frames);
+                      events straddling a cut are clipped into both sides.
+    """
+    total_frames = _frame(duration_sec, fps)
+    if total_frames <= 0:
+        return []
+
+    if chunk_sec:
+        step = max(1, _frame(chunk_sec, fps))
+        cuts = list(range(step, total_frames, step))
+    else:
+        cuts = _cut_frames_at_events(events, total_frames, fps, n_segments)
+
+    board = events if isinstance(events, Storyboard) else Storyboard.from_events(events)
+    return _segments_between([0] + cuts + [total_frames], board, fps)
+
+
+def _segments_between(bounds: List[int], board: Storyboard, fps: int) -> List[Segment]:
+    segments: List[Segment] = []
+    for i in range(len(bounds) - 1):
+        f0, f1 = bounds[i], bounds[i + 1]
+        t0, t1 = f0 / fps, f1 / fps
+
+        shifted: List[StoryEvent] = []
+        for j in board.overlapping(t0, t1):
+            e = board[int(j)]
+            start = max(float(e.t_start), t0)
+            end = min(float(e.t_end), t1)
+            if end <= start:
+                continue
+            shifted.append(StoryEvent(t_start=start - t0, t_end=end - t0, letter=e.letter, word=e.word, icon=e.icon))
+
+        segments.append(Segment(index=i, start_frame=f0, end_frame=f1, events=shifted))
+    return segments
+
+
+def _is_content_cut(e: StoryEvent, frame: int, target_events: int) -> bool:
+    digest = hashlib.sha1(f"{frame}|{e.letter}|{e.word}|{e.icon or ''}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % target_events == 0
+
+
+def plan_content_segments(
+    events: List[StoryEvent],
+    duration_sec: float,
+    fps: int,
+    target_events: int = 4,
+    max_segment_sec: float = 10.0,
+) -> List[Segment]:
+    """
+    Content-defined cuts: a segment starts at an event whose own (start frame,
+    letter, word, icon) hashes to 0 mod target_events, so on average every
+    `target_events` events. Whether an event is a cut depends on nothing else,
+    so editing or moving one event only changes the segment(s) around it and
+    every other segment keeps its exact boundaries and cache key.
+    A fixed grid every max_segment_sec (also edit-independent) bounds the length.
+    """
+    total_frames = _frame(duration_sec, fps)
+    if total_frames <= 0:
+        return []
+
+    board = events if isinstance(events, Storyboard) else Storyboard.from_events(events)
+    step = max(1, _frame(max_segment_sec, fps))
+    cuts = set(range(step, total_frames, step))
+    for e in board:
+        f = _frame(e.t_start, fps)
+        if 0 < f < total_frames and _is_content_cut(e, f, max(1, target_events)):
+            cuts.add(f)
+    return _segments_between([0] + sorted(cuts) + [total_frames], board, fps)
+
+
+def segment_cache_key(
+    segment: Segment,
+    fps: int,
+    resolution: Tuple[int, int],
+    profile: EncodeProfile,
+) -> str:
+    """
+    Hash of what a segment's frames depend on: its length, its events in
+    segment-relative frames, icon contents and encode settings (not its position).
+    """
+    events = []
+    for e in segment.events:
+        icon = resolve_icon(e.icon) if e.icon else None
+        icon_hash = icon_file_hash(icon) if icon is not None and icon.exists() else ""
+        events.append([_frame(e.t_start, fps), _frame(e.t_end, fps), e.letter, e.word, e.icon or "", icon_hash])
+    payload = {
+        "v": RENDER_CACHE_VERSION,
+        "frames": segment.n_frames,
+        "events": events,
+        "resolution": list(resolution),
+        "fps": int(fps),
+        "profile": profile.cache_fields(),
+    }
+    return hash_bytes(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+
+def render_segment(
+    segment: Segment,
+    output_path: str,
+    fps: int,
+    resolution: Tuple[int, int],
+    threads: int = 1,
+    profile: Optional[EncodeProfile] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> str:
+    """
+    Renders one video-only segment with the drawtext engine.
+    Every segment of a video must use the same profile so the concat demuxer can stream-copy.
+    """
+    profile = profile or get_profile()
+    icon_paths_unique = collect_icon_paths(segment.events)
+    prepared = prepare_icons(icon_paths_unique, card_layout(resolution).icon_h)
+
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"]
+    for p in icon_paths_unique:
+        cmd += ["-i", str(prepared[str(p)])]
+
+    icon_input_idx = {str(p): i for i, p in enumerate(icon_paths_unique)}  # no audio input: icons start=0
+    duration = segment.n_frames / float(fps)
+
+    filter_complex, current = build_drawtext_filtergraph(segment.events, icon_input_idx, duration, resolution, fps)
+
+    cmd += [
+        "-filter_complex", filter_complex,
+        "-map", current,
+        "-frames:v", str(segment.n_frames),
+        "-r", str(fps),
+        *profile.video_args(threads),
+        *keyframe_args(segment.events, duration),
+        "-an",
+        str(output_path),
+    ]
+    run_ffmpeg(cmd, duration, progress_cb, cancel_event, str(output_path))
+    return str(output_path)
+
+
+class _ProgressAggregator:
+    """Folds per-segment progress into one report over the whole timeline."""
+
+    def __init__(self, n_segments: int, total_sec: float, progress_cb: Optional[ProgressCallback]):
+        self._lock = threading.Lock()
+        self._done_sec = [0.0] * n_segments
+        self._frames = [0] * n_segments
+        self._started = time.monotonic()
+        self.total_sec = total_sec
+        self.progress_cb = progress_cb
+
+    def callback(self, index: int) -> Optional[ProgressCallback]:
+        if self.progress_cb is None:
+            return None
+
+        def _cb(p: RenderProgress) -> None:
+            with self._lock:
+                self._done_sec[index] = p.out_time_sec
+                self._frames[index] = p.frame
+                self._emit(done=False)
+
+        return _cb
+
+    def finish(self) -> None:
+        if self.progress_cb is not None:
+            with self._lock:
+                self._emit(done=True)
+
+    def _emit(self, done: bool) -> None:
+        elapsed = time.monotonic() - self._started
+        out_time = sum(self._done_sec)
+        frames = sum(self._frames)
+        self.progress_cb(
+            RenderProgress(
+                frame=frames,
+                fps=frames / elapsed if elapsed > 0 else 0.0,
+                speed=out_time / elapsed if elapsed > 0 else 0.0,
+                out_time_sec=out_time,
+                total_sec=self.total_sec,
+                elapsed_sec=elapsed,
+                done=done,
+            )
+        )
+
+
+def _queue_reporter(total_sec: float, progress_cb: Optional[ProgressCallback]) -> Callable[[int], None]:
+    def _queued(position: int) -> None:
+        if progress_cb is not None:
+            progress_cb(RenderProgress(total_sec=float(total_sec), queue_position=position))
+
+    return _queued
+
+
+def _forward_event(src: threading.Event, dst: threading.Event) -> None:
+    while not dst.is_set():
+        if src.wait(0.2):
+            dst.set()
+
+
+def _concat_list_line(path: Path) -> str:
+    return "file '" + str(path).replace("'", "'\\''") + "'\n"
+
+
+def concat_segments_with_audio(
+    segment_paths: List[Path],
+    audio_path: str,
+    output_path: str,
+    duration_sec: float,
+    cancel_event: Optional[threading.Event] = None,
+    profile: Optional[EncodeProfile] = None,
+    audio_hash: Optional[str] = None,
+) -> str:
+    """
+    Joins segments with the concat demuxer (no video re-encode) and muxes the audio once.
+    """
+    out = Path(output_path)
+    profile = profile or get_profile()
+    audio_track = prepare_audio_track(audio_path, duration_sec, profile, audio_hash=audio_hash, cancel_event=cancel_event)
+    list_path = out.with_name(f".{out.stem}.concat.txt")
+    list_path.write_text("".join(_concat_list_line(p.resolve()) for p in segment_paths), encoding="utf-8")
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", str(list_path),
+        "-i", str(audio_track),
+        "-map", "0:v",
+        "-map", "1:a",
+        "-t", str(duration_sec),
+        "-c:v", "copy",
+        *COPY_AUDIO_ARGS,
+        "-shortest",
+        str(out),
+    ]
+    try:
+        run_ffmpeg(cmd, duration_sec, None, cancel_event, str(out))
+    finally:
+        list_path.unlink(missing_ok=True)
+    return str(out)
+
+
+def render_video_parallel(
+    audio_path: str,
+    events: List[StoryEvent],
+    output_path: str,
+    duration_sec: int = 60,
+    resolution: Tuple[int, int] = (854, 480),
+    fps: int = 24,
+    workers: Optional[int] = None,
+    chunk_sec: Optional[float] = None,
+    profile: Optional[EncodeProfile] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    audio_hash: Optional[str] = None,
+) -> str:
+    """
+    Same output as render_video_ffmpeg_drawtext, but the timeline is split into
+    segments that are encoded concurrently (one ffmpeg process each), then
+    stream-copied together.
+    """
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    profile = profile or get_profile()
+
+    scheduler = get_scheduler()
+    workers = max(1, workers or scheduler.cores)
+    segments = plan_segments(events, duration_sec, fps, n_segments=workers, chunk_sec=chunk_sec)
+
+    work_dir = Path(tempfile.mkdtemp(prefix=".segments_", dir=out.parent))
+    try:
+        paths = [work_dir / f"seg_{s.index:05d}.mp4" for s in segments]
+        tracker = _ProgressAggregator(len(segments), float(duration_sec), progress_cb)
+        # one failing segment (or a user cancel) stops all the others
+        stop = threading.Event()
+        if cancel_event is not None:
+            threading.Thread(target=_forward_event, args=(cancel_event, stop), daemon=True).start()
+
+        # the job queues once; its segments split the threads of the slots it is given
+        queued = _queue_reporter(duration_sec, progress_cb)
+        with scheduler.fan_out(min(workers, len(segments)), cancel_event, queued) as (concurrent, budget):
+            threads = profile.threads or budget.threads
+            # ffmpeg does the heavy lifting in its own process; threads here just wait on it.
+            with ThreadPoolExecutor(max_workers=concurrent) as pool:
+                futures = [
+                    pool.submit(
+                        bind_context(render_segment),
+                        s, str(p), fps, resolution, threads, profile, tracker.callback(s.index), stop,
+                    )
+                    for s, p in zip(segments, paths)
+                ]
+                try:
+                    for f in futures:
+                        f.result()
+                finally:
+                    stop.set()  # cancels stragglers on failure, releases the forwarding thread
+
+            concat_segments_with_audio(paths, audio_path, str(out), duration_sec, cancel_event, profile, audio_hash)
+        tracker.finish()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return str(out)
+
+
+def render_video_incremental(
+    audio_path: str,
+    events: List[StoryEvent],
+    output_path: str,
+    duration_sec: int = 60,
+    resolution: Tuple[int, int] = (854, 480),
+    fps: int = 24,
+    workers: Optional[int] = None,
+    target_events: int = 4,
+    max_segment_sec: float = 10.0,
+    profile: Optional[EncodeProfile] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    segment_cache: Optional[RenderCache] = None,
+    stats: Optional[dict] = None,
+    audio_hash: Optional[str] = None,
+) -> str:
+    """
+    Like render_video_parallel, but segments are content-defined and cached by
+    segment_cache_key: after a template edit only segments whose events changed
+    are encoded; the rest come from the cache and everything is stream-copied
+    together. Fills `stats` (if given) with segment counts.
+    """
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    profile = profile or get_profile()
+    cache = segment_cache or RenderCache(root=SEGMENT_CACHE_DIR)
+
+    segments = plan_content_segments(events, duration_sec, fps, target_events, max_segment_sec)
+    keys = [segment_cache_key(s, fps, resolution, profile) for s in segments]
+    paths: List[Optional[Path]] = [cache.get(k) for k in keys]
+    # a segment repeated within this storyboard is encoded once
+    todo = {k: s for k, s, p in zip(keys, segments, paths) if p is None}
+
+    scheduler = get_scheduler()
+    workers = max(1, min(workers or scheduler.cores, len(todo) or 1))
+    todo_list = list(todo.items())
+    tracker = _ProgressAggregator(len(todo_list), sum(s.n_frames for _, s in todo_list) / float(fps), progress_cb)
+    keep = [p for p in paths if p is not None]
+
+    stop = threading.Event()
+    if cancel_event is not None:
+        threading.Thread(target=_forward_event, args=(cancel_event, stop), daemon=True).start()
+
+    def _render(i: int, key: str, seg: Segment, threads: int) -> Path:
+        path, _ = cache.get_or_render(
+            key,
+            lambda tmp: render_segment(seg, str(tmp), fps, resolution, threads, profile, tracker.callback(i), stop),
+            keep=keep,
+        )
+        keep.append(path)  # later misses in this run must not evict it
+        return path
+
+    # the job queues once; the segments to encode split the threads of the slots it is given
+    queued = _queue_reporter(duration_sec, progress_cb)
+    with scheduler.fan_out(workers, cancel_event, queued) as (concurrent, budget):
+        threads = profile.threads or budget.threads
+        with ThreadPoolExecutor(max_workers=concurrent) as pool:
+            futures = [pool.submit(bind_context(_render), i, k, s, threads) for i, (k, s) in enumerate(todo_list)]
+            try:
+                rendered = {k: f.result() for (k, _), f in zip(todo_list, futures)}
+            finally:
+                stop.set()  # cancels stragglers on failure, releases the forwarding thread
+
+        final_paths = [p if p is not None else rendered[k] for k, p in zip(keys, paths)]
+        concat_segments_with_audio(final_paths, audio_path, str(out), duration_sec, cancel_event, profile, audio_hash)
+    tracker.finish()
+
+    if stats is not None:
+        stats.update(segments=len(segments), reused=len(segments) - len(todo), encoded=len(todo))
+    return str(out)
@@ -1,13 +1,24 @@
 from __future__ import annotations
+
+import threading
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
+from core.metrics import span
 from core.prompt_parser import parse_prompt_lines
 
 ROOT = Path(__file__).resolve().parents[1]
 PROMPTS_DIR = ROOT / "prompts"
 
+# Display titles for known templates; anything else gets a title from its file name.
+_TITLES: Dict[str, str] = {
+    "abc": "ABC Song (Timestamped)",
+    "colors": "Colors Song",
+    "numbers": "Numbers Song",
+}
+
 
 @dataclass(frozen=True)
 class SongTemplate:
@@ -16,22 +27,108 @@ class SongTemplate:
     units: List[dict]
 
 
-def _load_prompt_lines(filename: str) -> List[str]:
-    path = PROMPTS_DIR / filename
+def _load_prompt_lines(path: Path) -> List[str]:
     if not path.exists():
         raise FileNotFoundError(f"Missing prompt file: {path}")
     return [l.strip() for l in path.read_text(encoding="utf-8").splitlines() if l.strip()]
 
 
-def get_template_by_key(key: str) -> SongTemplate:
-    if key != "abc":
-        key = "abc"
+def _key_for(path: Path) -> str:
+    stem = path.stem
+    return stem[: -len("_song")] if stem.endswith("_song") else stem
+
+
+class TemplateRegistry:
+    """
+    Every prompts/*.txt file as a template, keyed by file stem without "_song"
+    (abc_song.txt -> "abc").
+
+    Files are parsed lazily on first use and cached. A cached template is
+    re-parsed only when its file's (mtime, size) changes, and the stat check
+    itself runs at most once per `recheck_sec`, so a warm get() is a dict lookup.
+    Treat the returned units as read-only; they are shared between callers.
+    """
+
+    def __init__(self, prompts_dir: Path = PROMPTS_DIR, recheck_sec: float = 1.0):
+        self.prompts_dir = Path(prompts_dir)
+        self.recheck_sec = recheck_sec
+        self._lock = threading.Lock()
+        self._paths: Dict[str, Path] = {}
+        self._scanned_at = 0.0
+        # key -> (stat signature, checked_at, template)
+        self._cache: Dict[str, Tuple[Tuple[int, int], float, SongTemplate]] = {}
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            self._scan_locked(force=False)
+            return sorted(self._paths)
+
+    def get(self, key: str) -> SongTemplate:
+        now = time.monotonic()
+        hit = self._cache.get(key)
+        if hit is not None and now - hit[1] < self.recheck_sec:
+            return hit[2]
+
+        with self._lock:
+            path = self._path_locked(key)
+            st = path.stat()
+            sig = (st.st_mtime_ns, st.st_size)
+
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] == sig:
+                self._cache[key] = (sig, now, hit[2])
+                return hit[2]
 
-    abc_lines = _load_prompt_lines("abc_song.txt")
-    abc_units = parse_prompt_lines(abc_lines)
+            template = SongTemplate(
+                key=key,
+                title=_TITLES.get(key, key.replace("_", " ").title()),
+                units=parse_prompt_lines(_load_prompt_lines(path)),
+            )
+            self._cache[key] = (sig, now, template)
+            return template
 
-    return SongTemplate(
-        key="abc",
-        title="ABC Song (Timestamped)",
-        units=abc_units,
-    )
+    def prewarm(self) -> List[SongTemplate]:
+        return [self.get(k) for k in self.keys()]
+
+    def _path_locked(self, key: str) -> Path:
+        path = self._paths.get(key)
+        if path is None or not path.exists():
+            # new or renamed file since the last scan
+            self._scan_locked(force=True)
+            path = self._paths.get(key)
+        if path is None:
+            raise KeyError(f"Unknown template {key!r}. Available: {', '.join(sorted(self._paths)) or '(none)'}")
+        return path
+
+    def _scan_locked(self, force: bool) -> None:
+        now = time.monotonic()
+        if not force and self._paths and now - self._scanned_at < self.recheck_sec:
+            return
+        self._paths = {_key_for(p): p for p in sorted(self.prompts_dir.glob("*.txt"))}
+        self._scanned_at = now
+        for stale in set(self._cache) - set(self._paths):
+            self._cache.pop(stale, None)
+
+
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TemplateRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry()
+    return _registry
+
+
+def list_template_keys() -> List[str]:
+    return get_registry().keys()
+
+
+def get_template_by_key(key: str) -> SongTemplate:
+    with span("template", template=key) as s:
+        template = get_registry().get(key)
+        s["units"] = len(template.units)
+    return template
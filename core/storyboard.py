@@ -1,9 +1,16 @@
 from __future__ import annotations
+import heapq
+import sys
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
 
-@dataclass
+from core.align import align_units_to_onsets
+from core.metrics import observe, span
+
+
+@dataclass(slots=True)
 class StoryEvent:
     t_start: float
     t_end: float
@@ -12,58 +19,245 @@ class StoryEvent:
     icon: Optional[str] = None
 
 
-def build_storyboard_for_template(units: List[dict], duration_sec: int = 60) -> List[StoryEvent]:
+class _Interner:
+    """String table: each distinct value stored once, referenced by int32 id."""
+
+    __slots__ = ("values", "_ids")
+
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def id(self, value: str) -> int:
+        i = self._ids.get(value)
+        if i is None:
+            i = len(self.values)
+            self._ids[value] = i
+            self.values.append(sys.intern(str(value)))
+        return i
+
+    def ids(self, values: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.id(v) for v in values), dtype=np.int32)
+
+
+class Storyboard:
     """
-    If units have timestamps -> align events to timestamps (end = next timestamp).
-    If timestamps missing -> evenly space them.
+    Columnar storyboard: start/end times in float64 arrays, letters/words/icons
+    as int32 ids into interned string tables (icon id 0 is "no icon").
+
+    Iterating yields StoryEvent objects lazily, so it can be passed anywhere a
+    List[StoryEvent] is iterated. Interval queries, both O(log n) plus output:
+      at(t)            -> index of the event on screen at t (last-starting wins),
+                          from a step function over all start/end boundaries
+                          built on first use
+      overlapping(a,b) -> indices of events intersecting [a, b), from a
+                          start-sorted index with a running max of end times
+    """
+
+    __slots__ = ("starts", "ends", "letter_ids", "word_ids", "icon_ids", "letters", "words", "icons",
+                 "_order", "_sorted_starts", "_sorted_ends", "_max_end", "_step_bounds", "_step_active")
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        letter_ids: np.ndarray,
+        word_ids: np.ndarray,
+        icon_ids: np.ndarray,
+        letters: List[str],
+        words: List[str],
+        icons: List[str],
+    ):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.letter_ids = np.asarray(letter_ids, dtype=np.int32)
+        self.word_ids = np.asarray(word_ids, dtype=np.int32)
+        self.icon_ids = np.asarray(icon_ids, dtype=np.int32)
+        self.letters = letters
+        self.words = words
+        self.icons = icons
+
+        self._order = np.argsort(self.starts, kind="stable")
+        self._sorted_starts = self.starts[self._order]
+        self._sorted_ends = self.ends[self._order]
+        self._max_end = np.maximum.accumulate(self._sorted_ends) if len(self._order) else self._sorted_ends
+        self._step_bounds: Optional[np.ndarray] = None
+        self._step_active: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_columns(
+        cls,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        letters: Iterable[str],
+        words: Iterable[str],
+        icons: Iterable[Optional[str]],
+    ) -> "Storyboard":
+        lt, wt, it = _Interner(), _Interner(), _Interner()
+        it.id("")  # id 0 = no icon
+        return cls(
+            starts=np.asarray(starts, dtype=np.float64),
+            ends=np.asarray(ends, dtype=np.float64),
+            letter_ids=lt.ids(letters),
+            word_ids=wt.ids(words),
+            icon_ids=it.ids(i or "" for i in icons),
+            letters=lt.values,
+            words=wt.values,
+            icons=it.values,
+        )
+
+    @classmethod
+    def from_events(cls, events: Iterable[StoryEvent]) -> "Storyboard":
+        events = list(events)
+        return cls.from_columns(
+            [e.t_start for e in events],
+            [e.t_end for e in events],
+            (e.letter for e in events),
+            (e.word for e in events),
+            (e.icon for e in events),
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> StoryEvent:
+        return StoryEvent(
+            t_start=float(self.starts[i]),
+            t_end=float(self.ends[i]),
+            letter=self.letters[self.letter_ids[i]],
+            word=self.words[self.word_ids[i]],
+            icon=self.icons[self.icon_ids[i]] or None,
+        )
+
+    def __iter__(self) -> Iterator[StoryEvent]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_events(self) -> List[StoryEvent]:
+        return list(self)
+
+    def unique_icons(self) -> List[str]:
+        """
+        Icon names used by at least one event, in first-use order.
+        """
+        ids, first = np.unique(self.icon_ids, return_index=True)
+        return [self.icons[i] for i in ids[np.argsort(first)] if i != 0]
+
+    def _build_step(self) -> None:
+        """
+        Sweeps the sorted boundaries once with a heap of open events (latest
+        start on top, ended ones dropped lazily when they surface): _step_active[k]
+        is the event on screen over [_step_bounds[k], _step_bounds[k + 1]), -1 if none.
+        """
+        bounds = np.unique(np.concatenate([self._sorted_starts, self._sorted_ends]))
+        active = np.full(len(bounds), -1, dtype=np.int64)
+        starts, ends = self._sorted_starts.tolist(), self._sorted_ends.tolist()
+        heap: List[tuple] = []  # (-sorted position, end)
+        j, n = 0, len(starts)
+        for k, b in enumerate(bounds.tolist()):
+            while j < n and starts[j] <= b:
+                heapq.heappush(heap, (-j, ends[j]))
+                j += 1
+            while heap and heap[0][1] <= b:
+                heapq.heappop(heap)
+            if heap:
+                active[k] = self._order[-heap[0][0]]
+        self._step_bounds, self._step_active = bounds, active
+
+    def steps(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (bounds, active): the event on screen over [bounds[k], bounds[k + 1]) is
+        active[k], -1 if none. Overlaps resolve as in at(): the latest start wins.
+        """
+        if self._step_bounds is None:
+            self._build_step()
+        return self._step_bounds, self._step_active
+
+    def at(self, t: float) -> Optional[int]:
+        if self._step_bounds is None:
+            self._build_step()
+        k = int(np.searchsorted(self._step_bounds, t, side="right")) - 1
+        if k < 0:
+            return None
+        i = int(self._step_active[k])
+        return i if i >= 0 else None
+
+    def overlapping(self, a: float, b: float) -> np.ndarray:
+        hi = int(np.searchsorted(self._sorted_starts, b, side="left"))
+        lo = int(np.searchsorted(self._max_end, a, side="right"))
+        if hi <= lo:
+            return np.zeros(0, dtype=np.int64)
+        mask = self._sorted_ends[lo:hi] > a
+        return np.sort(self._order[lo:hi][mask])
+
+
+def build_storyboard_table(
+    units: List[dict],
+    duration_sec: int = 60,
+    onset_times: Optional[Sequence[float]] = None,
+) -> Storyboard:
     """
+    Columnar build_storyboard_for_template: same rules, computed on arrays.
+    """
+    with span("storyboard", units=len(units)) as s:
+        board = _build_storyboard_table(units, duration_sec, onset_times)
+        s["events"] = len(board)
+    observe("storyboard_events", len(board))
+    return board
+
+
+def _build_storyboard_table(
+    units: List[dict],
+    duration_sec: int,
+    onset_times: Optional[Sequence[float]],
+) -> Storyboard:
     if not units:
-        return []
+        return Storyboard.from_columns([], [], [], [], [])
 
     # If at least half units have timestamps, treat as timestamped
     ts_count = sum(1 for u in units if u.get("t") is not None)
-    use_ts = ts_count >= max(1, len(units) // 2)
-
-    events: List[StoryEvent] = []
+    use_ts = ts_count >= max(1, len(units) // 2) or onset_times is not None
+    duration = float(duration_sec)
 
     if use_ts:
-        # filter only timestamped lines and sort
-        timed = [u for u in units if u.get("t") is not None]
-        timed.sort(key=lambda x: float(x["t"]))
-
-        for i, u in enumerate(timed):
-            start = float(u["t"])
-            end = float(timed[i + 1]["t"]) if i + 1 < len(timed) else float(duration_sec)
-            # clamp
-            start = max(0.0, min(start, float(duration_sec)))
-            end = max(0.0, min(end, float(duration_sec)))
-            if end <= start:
-                continue
-
-            events.append(
-                StoryEvent(
-                    t_start=start,
-                    t_end=end,
-                    letter=str(u.get("letter", "")),
-                    word=str(u.get("word", "")),
-                    icon=(u.get("icon") or None),
-                )
-            )
-        return events
-
-    # fallback: evenly spaced
-    n = len(units)
-    step = duration_sec / float(n)
-    for i, u in enumerate(units):
-        start = i * step
-        end = (i + 1) * step
-        events.append(
-            StoryEvent(
-                t_start=start,
-                t_end=end,
-                letter=str(u.get("letter", "")),
-                word=str(u.get("word", "")),
-                icon=(u.get("icon") or None),
-            )
-        )
-    return events
+        # fill untimed lines from onsets / neighbours, then sort
+        timed = align_units_to_onsets(units, onset_times, duration_sec)
+        t = np.fromiter((float(u["t"]) for u in timed), dtype=np.float64, count=len(timed))
+        order = np.argsort(t, kind="stable")
+        t = t[order]
+        timed = [timed[i] for i in order]
+
+        starts = np.clip(t, 0.0, duration)
+        ends = np.clip(np.append(t[1:], duration), 0.0, duration)
+        keep = np.flatnonzero(ends > starts)
+        rows = [timed[i] for i in keep]
+        starts, ends = starts[keep], ends[keep]
+    else:
+        # fallback: evenly spaced
+        n = len(units)
+        step = duration_sec / float(n)
+        starts = np.arange(n, dtype=np.float64) * step
+        ends = np.arange(1, n + 1, dtype=np.float64) * step
+        rows = units
+
+    return Storyboard.from_columns(
+        starts,
+        ends,
+        (str(u.get("letter", "")) for u in rows),
+        (str(u.get("word", "")) for u in rows),
+        ((u.get("icon") or None) for u in rows),
+    )
+
+
+def build_storyboard_for_template(
+    units: List[dict],
+    duration_sec: int = 60,
+    onset_times: Optional[Sequence[float]] = None,
+) -> List[StoryEvent]:
+    """
+    If units have timestamps -> align events to timestamps (end = next timestamp).
+    Untimed units in between are placed on detected onsets (onset_times) or,
+    without audio analysis, interpolated between their timed neighbours.
+    If timestamps missing -> evenly space them (or snap to onset_times when given).
+    """
+    return build_storyboard_table(units, duration_sec, onset_times).to_events()
@@ -0,0 +1,183 @@
+"""
+Poster, thumbnail sprite strip and WebVTT thumbnail track, drawn from the
+storyboard (the same cards the renderers draw) instead of decoding the video.
+
+    out_dir/poster.jpg    first card at video resolution
+    out_dir/thumbs.jpg    one tile per event, `columns` tiles per row
+    out_dir/thumbs.vtt    WebVTT cues "start --> end" -> thumbs.jpg#xywh=x,y,w,h
+    out_dir/thumbs.json   the same index as JSON (letter, word, times, tile)
+
+Renderers place keyframes on event starts (core.render.keyframe_args), so a
+player seeking to a cue's start lands on a keyframe.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.assets import render_event_card
+from core.cache import THUMBS_DIR
+from core.icons import prepare_icon
+from core.render import card_layout, resolve_icon
+from core.storyboard import StoryEvent, Storyboard
+
+# Bump when the drawing below changes (existing strips are then rebuilt).
+THUMBS_VERSION = "1"
+
+POSTER_NAME = "poster.jpg"
+SPRITE_NAME = "thumbs.jpg"
+VTT_NAME = "thumbs.vtt"
+INDEX_NAME = "thumbs.json"
+
+# (letter, word, icon); letter=None is the empty background
+_CardKey = Tuple[Optional[str], str, str]
+_EMPTY: _CardKey = (None, "", "")
+
+
+def _vtt_time(t: float) -> str:
+    ms = int(round(max(0.0, t) * 1000))
+    h, ms = divmod(ms, 3_600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def timeline_cues(events: Iterable[StoryEvent], duration_sec: float) -> List[Tuple[float, float, _CardKey]]:
+    """
+    (start, end, card) covering [0, duration]: one cue per stretch of one event
+    on screen (clipped; on overlap the later start wins, as in the renderers, and
+    the earlier event resumes after it) and one empty-card cue per gap.
+    """
+    events = list(events)
+    duration = float(duration_sec)
+    bounds, active = Storyboard.from_events(events).steps()
+    edges = bounds.tolist() + [duration]
+
+    cues: List[Tuple[float, float, _CardKey]] = []
+    cursor = 0.0
+    last = -1
+    for k, i in enumerate(active.tolist()):
+        t0, t1 = max(edges[k], cursor), min(edges[k + 1], duration)
+        if i < 0 or t1 <= t0:
+            continue
+        e = events[i]
+        key = (e.letter, e.word or "", e.icon or "")
+        if i == last and cues[-1][1] == t0:
+            # the same event across a boundary where a hidden one ended
+            cues[-1] = (cues[-1][0], t1, key)
+        else:
+            if t0 > cursor:
+                cues.append((cursor, t0, _EMPTY))
+            cues.append((t0, t1, key))
+        cursor, last = t1, i
+    if cursor < duration:
+        cues.append((cursor, duration, _EMPTY))
+    return cues
+
+
+def _source_hash(cues: List[Tuple[float, float, _CardKey]], resolution: Tuple[int, int], tile_width: int,
+                 columns: int) -> str:
+    payload = {
+        "v": THUMBS_VERSION,
+        "cues": [[round(a, 3), round(b, 3), list(k)] for a, b, k in cues],
+        "resolution": list(resolution),
+        "tile_width": tile_width,
+        "columns": columns,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def build_thumbnails(
+    events: Iterable[StoryEvent],
+    duration_sec: float,
+    out_dir: Path,
+    resolution: Tuple[int, int] = (854, 480),
+    tile_width: int = 160,
+    columns: int = 10,
+) -> Dict[str, str]:
+    """
+    Writes poster, sprite strip, VTT and JSON index into out_dir and returns
+    {"poster", "sprite", "vtt", "index"} -> path. Each distinct card is drawn
+    once; an unchanged storyboard returns the existing files untouched.
+    """
+    from PIL import Image
+
+    out_dir = Path(out_dir)
+    cues = timeline_cues(events, duration_sec)
+    paths = {
+        "poster": out_dir / POSTER_NAME,
+        "sprite": out_dir / SPRITE_NAME,
+        "vtt": out_dir / VTT_NAME,
+        "index": out_dir / INDEX_NAME,
+    }
+    source = _source_hash(cues, resolution, tile_width, columns)
+    try:
+        existing = json.loads(paths["index"].read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        existing = {}
+    if existing.get("source") == source and all(p.exists() for p in paths.values()):
+        return {k: str(p) for k, p in paths.items()}
+
+    w, h = resolution
+    tile_w = int(tile_width)
+    tile_h = max(1, round(tile_w * h / w))
+    icon_h = card_layout(resolution).icon_h
+
+    cards: Dict[_CardKey, "Image.Image"] = {}
+
+    def card(key: _CardKey) -> "Image.Image":
+        if key not in cards:
+            letter, word, icon = key
+            src = resolve_icon(icon) if icon else None
+            icon_path = prepare_icon(src, icon_h) if src is not None and src.exists() else None
+            cards[key] = render_event_card(letter, word, icon_path, resolution)
+        return cards[key]
+
+    tiles: Dict[_CardKey, "Image.Image"] = {}
+    n = max(1, len(cues))
+    cols = max(1, min(columns, n))
+    rows = math.ceil(n / cols)
+    sprite = Image.new("RGB", (cols * tile_w, rows * tile_h), (0, 0, 0))
+    index: List[dict] = []
+    vtt = ["WEBVTT", ""]
+    for i, (t0, t1, key) in enumerate(cues):
+        if key not in tiles:
+            tiles[key] = card(key).resize((tile_w, tile_h), Image.LANCZOS)
+        x, y = (i % cols) * tile_w, (i // cols) * tile_h
+        sprite.paste(tiles[key], (x, y))
+        vtt += [f"{_vtt_time(t0)} --> {_vtt_time(t1)}", f"{SPRITE_NAME}#xywh={x},{y},{tile_w},{tile_h}", ""]
+        index.append({
+            "t_start": round(t0, 3), "t_end": round(t1, 3),
+            "letter": key[0], "word": key[1],
+            "x": x, "y": y, "w": tile_w, "h": tile_h,
+        })
+
+    first = next((k for _, _, k in cues if k != _EMPTY), _EMPTY)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tag = uuid.uuid4().hex
+
+    def _write(path: Path, save) -> None:
+        # tmp + rename: a catalog page never reads a half-written file
+        tmp = path.with_name(f".{path.name}.{tag}.tmp")
+        save(tmp)
+        os.replace(tmp, path)
+
+    _write(paths["poster"], lambda p: card(first).save(p, "JPEG", quality=85))
+    _write(paths["sprite"], lambda p: sprite.save(p, "JPEG", quality=80))
+    _write(paths["vtt"], lambda p: p.write_text("\n".join(vtt), encoding="utf-8"))
+    _write(paths["index"], lambda p: p.write_text(json.dumps({
+        "source": source,
+        "poster": POSTER_NAME,
+        "sprite": SPRITE_NAME,
+        "vtt": VTT_NAME,
+        "tile": [tile_w, tile_h],
+        "columns": cols,
+        "cues": index,
+    }, indent=2), encoding="utf-8"))
+    return {k: str(p) for k, p in paths.items()}
@@ -0,0 +1,218 @@
+"""
+Boot-time warm-up: does the work a first render would otherwise pay for.
+
+    python -m core.warmup                     # prewarm and print per-stage timings
+    python -m core.warmup --first-render song.mp3
+
+Parses every template, indexes the icon directory and reports icons that
+templates name but that do not exist, scales the icons once into the icon cache
+and opens the card fonts. Safe to run repeatedly; every step is cached.
+
+The CLI measures from fresh interpreters, so nothing this process already
+imported or warmed skews the numbers: cold import time of core.engines via
+`python -X importtime`, then prewarm and the first render in a new process.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.assets import render_event_card
+from core.engines import get_engine
+from core.icons import prepare_icons
+from core.render import card_layout, icon_index, resolve_icon
+from core.songs import get_registry, get_template_by_key
+from core.storyboard import build_storyboard_table
+
+# RENDER_PREWARM=0 turns the background warm-up in the app off
+PREWARM_ENABLED = os.environ.get("RENDER_PREWARM", "1") != "0"
+
+_started: Optional[threading.Thread] = None
+_started_lock = threading.Lock()
+_last_report: Dict[str, object] = {}
+
+
+def prewarm(resolution: Optional[Tuple[int, int]] = (854, 480)) -> Dict[str, object]:
+    """
+    Runs every warm-up stage and returns a report:
+    {"templates": n, "icons": n, "missing_icons": [...], "timings": {stage: sec}}.
+    resolution=None skips the size-specific stages (icon scaling, fonts).
+    """
+    timings: Dict[str, float] = {}
+
+    t0 = time.perf_counter()
+    templates = get_registry().prewarm()
+    timings["templates_sec"] = round(time.perf_counter() - t0, 6)
+
+    t0 = time.perf_counter()
+    index = icon_index()
+    names = list(dict.fromkeys(u["icon"] for t in templates for u in t.units if u.get("icon")))
+    found: List[Path] = []
+    missing: List[str] = []
+    for name in names:
+        p = index.get(name) or resolve_icon(name)
+        if p.exists():
+            found.append(p)
+        else:
+            missing.append(name)
+    timings["icon_index_sec"] = round(time.perf_counter() - t0, 6)
+
+    if resolution is not None:
+        lay = card_layout(resolution)
+
+        t0 = time.perf_counter()
+        prepare_icons(found, lay.icon_h)
+        timings["icon_cache_sec"] = round(time.perf_counter() - t0, 6)
+
+        # one throwaway card: imports Pillow and opens both card font sizes
+        t0 = time.perf_counter()
+        render_event_card("A", "Apple", None, resolution)
+        timings["fonts_sec"] = round(time.perf_counter() - t0, 6)
+
+    report = {
+        "templates": len(templates),
+        "icons": len(found),
+        "missing_icons": missing,
+        "timings": timings,
+    }
+    _last_report.clear()
+    _last_report.update(report)
+    return report
+
+
+def start_prewarm(resolution: Optional[Tuple[int, int]] = (854, 480)) -> Optional[threading.Thread]:
+    """
+    prewarm() on a daemon thread, once per process (later calls return the same
+    thread). Returns None when RENDER_PREWARM=0.
+    """
+    global _started
+    if not PREWARM_ENABLED:
+        return None
+    with _started_lock:
+        if _started is None:
+            _started = threading.Thread(target=prewarm, args=(resolution,), name="prewarm", daemon=True)
+            _started.start()
+    return _started
+
+
+def last_report() -> Dict[str, object]:
+    """The most recent prewarm() report ({} before the first one finishes)."""
+    return dict(_last_report)
+
+
+def time_first_render(
+    audio_path: str,
+    template_key: str = "abc",
+    engine: str = "drawtext",
+    duration_sec: int = 10,
+    output_path: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Storyboard + render of one short video in this process, timed, i.e. what
+    the first user request costs after whatever warm-up already happened.
+    """
+    out = output_path or str(ROOT / "outputs" / "warmup_first_render.mp4")
+    t0 = time.perf_counter()
+    events = build_storyboard_table(get_template_by_key(template_key).units, duration_sec=duration_sec)
+    t1 = time.perf_counter()
+    get_engine(engine).render(audio_path=audio_path, events=events, output_path=out, duration_sec=duration_sec)
+    t2 = time.perf_counter()
+    return {
+        "storyboard_sec": round(t1 - t0, 6),
+        "render_sec": round(t2 - t1, 6),
+        "total_sec": round(t2 - t0, 6),
+    }
+
+
+def _child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(ROOT), env.get("PYTHONPATH")) if p)
+    return env
+
+
+def measure_cold_import(module: str = "core.engines", top: int = 10) -> Dict[str, object]:
+    """
+    Imports `module` in a fresh interpreter under `-X importtime`. Returns its
+    cumulative import time and the `top` modules with the largest self time.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=_child_env(), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    total_us = next((c for _, c, name in rows if name == module), 0)
+    slowest = sorted(rows, reverse=True)[:top]
+    return {
+        "module": module,
+        "import_sec": round(total_us / 1e6, 6),
+        "slowest_self_sec": {name: round(s / 1e6, 6) for s, _, name in slowest},
+    }
+
+
+def measure_fresh_process(
+    audio_path: Optional[str] = None,
+    engine: str = "drawtext",
+    prewarm_first: bool = True,
+) -> Dict[str, object]:
+    """
+    Runs prewarm and/or one first render (`--in-process`) in a new interpreter.
+    process_sec is the wall time from spawn to exit (startup, imports and all).
+    """
+    cmd = [sys.executable, "-m", "core.warmup", "--in-process", "--engine", engine]
+    if audio_path:
+        cmd += ["--first-render", str(Path(audio_path).resolve())]
+    if not prewarm_first:
+        cmd.append("--no-prewarm")
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=_child_env(), capture_output=True, text=True)
+    process_sec = time.perf_counter() - t0
+    if proc.returncode not in (0, 1):  # 1 = missing icons, still a full report
+        raise RuntimeError(f"warm-up process failed:\n{proc.stderr[-2000:]}")
+    report = json.loads(proc.stdout)
+    report["process_sec"] = round(process_sec, 6)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--first-render", metavar="AUDIO", default=None, help="also time one short render")
+    ap.add_argument("--engine", default="drawtext")
+    ap.add_argument("--no-prewarm", action="store_true", help="skip prewarm (for a cold baseline)")
+    ap.add_argument("--in-process", action="store_true", help="measure in this process (used by the fresh child)")
+    args = ap.parse_args(argv)
+
+    if args.in_process:
+        result: Dict[str, object] = {}
+        if not args.no_prewarm:
+            result["prewarm"] = prewarm()
+        if args.first_render:
+            result["first_render"] = time_first_render(args.first_render, engine=args.engine)
+    else:
+        result = {
+            "cold_import": measure_cold_import(),
+            **measure_fresh_process(args.first_render, args.engine, not args.no_prewarm),
+        }
+    print(json.dumps(result, indent=2))
+    return 1 if result.get("prewarm", {}).get("missing_icons") else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
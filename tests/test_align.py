@@ -0,0 +1,35 @@
+import pytest
+
+from core.align import MIN_SPACING_SEC, align_units_to_onsets
+from core.storyboard import build_storyboard_table
+
+
+def _units(times):
+    return [{"t": t, "letter": chr(65 + i), "word": f"w{i}", "icon": ""} for i, t in enumerate(times)]
+
+
+def _starts(units, duration=10.0, onsets=None):
+    return [u["t"] for u in align_units_to_onsets(units, onsets, duration)]
+
+
+def test_untimed_units_before_an_anchor_at_zero_stay_apart():
+    times = _starts(_units([None, None, 0.0, None]))
+    assert times[:3] == pytest.approx([0.0, MIN_SPACING_SEC, 2 * MIN_SPACING_SEC])
+    assert times[3] > times[2]
+    assert len(build_storyboard_table(_units([None, None, 0.0, None]), 10)) == 4
+
+
+def test_untimed_units_between_equal_anchors_stay_apart():
+    units = _units([1.0, None, None, 1.0, 5.0])
+    times = _starts(units)
+    assert times == pytest.approx([1.0, 1.25, 1.5, 1.75, 5.0])
+    assert len(build_storyboard_table(units, 10)) == 5
+
+
+def test_runs_with_room_are_not_moved():
+    assert _starts(_units([0.0, None, 2.0, None, None, 8.0])) == pytest.approx([0.0, 1.0, 2.0, 4.0, 6.0, 8.0])
+
+
+def test_no_room_before_the_end_is_an_error():
+    with pytest.raises(ValueError, match="line 2"):
+        align_units_to_onsets(_units([9.9, None, None]), None, 10.0)
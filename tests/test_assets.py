@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("PIL")
+
+from core import assets
+
+
+def test_cards_are_redrawn_only_when_the_font_file_changes(tmp_path, monkeypatch):
+    cards = {"A": "Apple", "B": "Ball"}
+    assets.ensure_alphabet_assets(tmp_path, cards, workers=1)
+
+    drawn = []
+    monkeypatch.setattr(assets, "_generate_placeholder_letter_animal_image", lambda *a: drawn.append(a[0]))
+    assets.ensure_alphabet_assets(tmp_path, cards, workers=1)
+    assert drawn == []
+
+    monkeypatch.setattr(assets, "_font_digest", lambda: "another font")
+    assets.ensure_alphabet_assets(tmp_path, cards, workers=1)
+    assert sorted(drawn) == ["A", "B"]
@@ -0,0 +1,48 @@
+import shutil
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+
+from core.audio import ANALYSIS_SR, get_all_onset_times, get_onset_times_streaming, onset_strength_blocks
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def _fixture(path: Path, seconds: float = 20.0, sr: int = ANALYSIS_SR) -> Path:
+    """Quiet noise with decaying tone bursts at irregular times, some close together."""
+    rng = np.random.default_rng(7)
+    y = 0.01 * rng.standard_normal(int(seconds * sr))
+    t = np.arange(int(0.25 * sr)) / sr
+    for start in rng.uniform(0.2, seconds - 0.5, 40):
+        burst = np.sin(2 * np.pi * rng.uniform(200, 2000) * t) * np.exp(-12 * t)
+        i = int(start * sr)
+        y[i:i + len(burst)] += rng.uniform(0.2, 0.8) * burst
+    pcm = (np.clip(y, -1, 1) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+    return path
+
+
+def test_block_envelope_matches_batch(tmp_path):
+    y, sr = librosa.load(_fixture(tmp_path / "fx.wav"), sr=ANALYSIS_SR)
+    n = int(0.37 * sr)  # not a multiple of the hop, so frames straddle block edges
+    env = onset_strength_blocks(lambda: (y[i:i + n] for i in range(0, len(y), n)), sr=sr)
+    batch = librosa.onset.onset_strength(y=y, sr=sr)
+    assert env.shape == batch.shape
+    np.testing.assert_allclose(env, batch, rtol=0, atol=1e-4)
+
+
+@pytest.mark.parametrize("block_sec", [0.37, 1.0, 10.0])
+def test_streamed_onsets_equal_batch(tmp_path, block_sec):
+    path = _fixture(tmp_path / "fx.wav")
+    y, sr = librosa.load(path, sr=ANALYSIS_SR)
+    streamed = get_onset_times_streaming(path, max_events=None, min_gap=0.0, block_sec=block_sec)
+    assert len(streamed) > 10
+    assert streamed == get_all_onset_times(y, sr, min_gap=0.0)
@@ -0,0 +1,21 @@
+import os
+import time
+
+from core.cache import RenderCache
+
+
+def test_pcm_analysis_files_expire_with_the_cache(tmp_path):
+    cache = RenderCache(root=tmp_path, ttl_sec=60)
+    cache.pcm_dir.mkdir()
+    old = cache.pcm_dir / "abc_22050.npy"
+    env = cache.pcm_dir / "abc_22050_h512_env.npy"
+    fresh = cache.pcm_dir / "def_22050.npy"
+    for p in (old, env, fresh):
+        p.write_bytes(b"\0" * 128)
+    stale = time.time() - 3600
+    os.utime(old, (stale, stale))
+    os.utime(env, (stale, stale))
+
+    assert {e.path for e in cache.entries()} == {old, env, fresh}
+    assert cache.evict() == 256
+    assert not old.exists() and not env.exists() and fresh.exists()
@@ -0,0 +1,15 @@
+from core.ladder import DEFAULT_LADDER, build_ladder_filtergraph, nominal_video_kbps
+
+
+def test_nominal_rates_rise_with_resolution():
+    rates = [nominal_video_kbps(r) for r in DEFAULT_LADDER]
+    assert rates == sorted(rates) and len(set(rates)) == len(rates)
+    assert nominal_video_kbps((1, 1)) == 200
+
+
+def test_ladder_composites_once_and_scales_the_rest():
+    renditions = [(1920, 1080), (1280, 720), (854, 480)]
+    graph, labels = build_ladder_filtergraph([], {}, 3.0, renditions, 24)
+    assert labels == ["[r0]", "[s1]", "[s2]"]
+    assert graph.count("color=") == 1
+    assert "scale=1280:720" in graph and "scale=854:480" in graph
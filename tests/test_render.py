@@ -0,0 +1,29 @@
+from core.render import build_drawtext_filtergraph, card_layout, resolve_icon
+from core.storyboard import StoryEvent
+
+EVENTS = [
+    StoryEvent(0.0, 1.0, "A", "Apple", "a.png"),
+    StoryEvent(1.0, 2.0, "B", "Ball", "b.png"),
+    StoryEvent(2.0, 3.0, "A", "Apple", "a.png"),
+]
+
+
+def _graph():
+    idx = {str(resolve_icon("a.png")): 1, str(resolve_icon("b.png")): 2}
+    return build_drawtext_filtergraph(EVENTS, idx, 3.0, (854, 480), 24)
+
+
+def test_icons_are_centered_on_the_frame():
+    graph, _ = _graph()
+    overlays = [part for part in graph.split(";") if "overlay=" in part]
+    assert len(overlays) == 3
+    for part in overlays:
+        assert "overlay=x=(main_w-overlay_w)/2:y=(main_h-overlay_h)/2:eof_action=repeat:" in part
+
+
+def test_each_icon_input_is_split_once_per_use():
+    graph, out = _graph()
+    assert graph.count("[1:v]split=2") == 1
+    assert "[2:v]split" not in graph and "[2:v]" in graph
+    assert out in graph
+    assert f"s={card_layout((854, 480)).w}x" in graph
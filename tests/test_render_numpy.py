@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from core.render_numpy import _Compositor, _zoom_index
+
+
+@pytest.mark.parametrize("scale", [0.6, 0.85, 1.0, 1.1])
+def test_zoom_blend_matches_fancy_indexing(scale):
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, 256, (90, 160, 3), dtype=np.uint8)
+    b = rng.integers(0, 256, (90, 160, 3), dtype=np.uint8)
+    comp = _Compositor(90, 160)
+    rows, cols = _zoom_index(90, 160, scale)
+    expected = comp.blend(a, b[rows][:, cols], 0.4).copy()
+    out = comp.zoom_blend(a, b, scale, 0.4)
+    assert out is comp.out
+    np.testing.assert_array_equal(out, expected)
@@ -0,0 +1,41 @@
+import re
+import shutil
+import subprocess
+import wave
+from pathlib import Path
+
+import pytest
+
+from core.render_stills import render_video_ffmpeg_stills
+from core.storyboard import StoryEvent
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def _tone(path: Path, seconds: float, sr: int = 22050) -> Path:
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(b"\0\0" * int(seconds * sr))
+    return path
+
+
+def _duration(video: Path) -> float:
+    err = subprocess.run(["ffmpeg", "-hide_banner", "-i", str(video)], capture_output=True, text=True).stderr
+    h, m, s = re.search(r"Duration: (\d+):(\d+):([\d.]+)", err).groups()
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+@pytest.mark.parametrize("vfr", [True, False])
+def test_output_lasts_the_full_duration(tmp_path, vfr):
+    events = [
+        StoryEvent(1.0, 2.0, "A", "Apple"),
+        StoryEvent(2.0, 4.0, "B", "Ball"),
+        StoryEvent(4.0, 12.0, "C", "Cat"),
+    ]
+    out = render_video_ffmpeg_stills(
+        str(_tone(tmp_path / "tone.wav", 3.0)), events, str(tmp_path / "out.mp4"),
+        duration_sec=12, resolution=(160, 90), fps=12, vfr=vfr,
+    )
+    assert _duration(Path(out)) == pytest.approx(12.0, abs=0.15)
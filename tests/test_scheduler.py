@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.metrics import bind_context
+from core.scheduler import FfmpegScheduler
+
+
+def test_fan_out_splits_all_free_slots_across_its_processes():
+    sched = FfmpegScheduler(slots=4, cores=16)
+    with sched.fan_out(16) as (concurrent, budget):
+        assert (concurrent, budget.threads) == (16, 1)
+        assert sched.stats()["running"] == 4
+
+        # the job's own ffmpeg runs, on its worker threads, do not queue again
+        def run():
+            with sched.slot() as b:
+                return b
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            got = [pool.submit(bind_context(run)).result(timeout=5) for _ in range(8)]
+        assert all(b == budget for b in got)
+        assert sched.stats()["running"] == 4
+    assert sched.stats()["running"] == 0
+
+
+def test_fan_out_takes_only_what_is_free_and_queues_as_one_job():
+    sched = FfmpegScheduler(slots=2, cores=8)
+    with sched.slot():
+        with sched.fan_out(8) as (concurrent, budget):
+            assert (concurrent, budget.threads) == (4, 1)
+            assert sched.stats()["running"] == 2
+
+            admitted = threading.Event()
+
+            def later_job():
+                with sched.slot():
+                    admitted.set()
+
+            t = threading.Thread(target=later_job)
+            t.start()
+            assert not admitted.wait(0.3)
+            assert sched.stats()["queued"] == 1
+        t.join(timeout=5)
+        assert admitted.is_set()
+
+
+def test_small_fan_out_keeps_wide_processes():
+    sched = FfmpegScheduler(slots=4, cores=16)
+    with sched.fan_out(2) as (concurrent, budget):
+        assert (concurrent, budget.threads) == (2, 2)
+        assert sched.stats()["running"] == 1
@@ -0,0 +1,39 @@
+from core.storyboard import StoryEvent, Storyboard
+from core.thumbnails import timeline_cues
+
+
+def test_later_start_wins_on_overlap():
+    events = [
+        StoryEvent(1.0, 6.0, "A", "Apple", "a.png"),
+        StoryEvent(3.0, 4.0, "B", "Ball", "b.png"),
+        StoryEvent(5.0, 8.0, "C", "Cat", ""),
+    ]
+    cues = [(a, b, key[0]) for a, b, key in timeline_cues(events, 10)]
+    assert cues == [
+        (0.0, 1.0, None),
+        (1.0, 3.0, "A"),
+        (3.0, 4.0, "B"),
+        (4.0, 5.0, "A"),
+        (5.0, 8.0, "C"),
+        (8.0, 10.0, None),
+    ]
+    board = Storyboard.from_events(events)
+    for a, b, letter in cues:
+        i = board.at((a + b) / 2)
+        assert (events[i].letter if i is not None else None) == letter
+
+
+def test_cues_are_clipped_to_the_duration():
+    events = [StoryEvent(-1.0, 2.0, "A", "Apple"), StoryEvent(2.0, 20.0, "B", "Ball")]
+    assert [(a, b, key[0]) for a, b, key in timeline_cues(events, 10)] == [(0.0, 2.0, "A"), (2.0, 10.0, "B")]
+
+
+def test_an_event_spanning_a_hidden_one_stays_one_cue():
+    events = [
+        StoryEvent(0.0, 10.0, "A", "Apple"),
+        StoryEvent(2.0, 8.0, "B", "Ball"),
+        StoryEvent(3.0, 4.0, "C", "Cat"),
+        StoryEvent(1.0, 5.0, "D", "Dog"),
+    ]
+    cues = [(a, b, key[0]) for a, b, key in timeline_cues(events, 10)]
+    assert cues == [(0.0, 1.0, "A"), (1.0, 2.0, "D"), (2.0, 3.0, "B"), (3.0, 4.0, "C"), (4.0, 8.0, "B"), (8.0, 10.0, "A")]